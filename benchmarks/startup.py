@@ -0,0 +1,88 @@
+"""Cold start of the `wanna` command line
+
+Every subcommand is started in a fresh interpreter with `-X importtime`.
+Commands that do not touch the network run for real; for the others the
+arguments are parsed and the vendor module is imported, which is all the
+work done before the first request. The results are printed as json.
+
+Usage:
+  startup.py [--repeat=<n>] [--output=<file>]
+
+Options:
+  --repeat=<n>     Cold starts per subcommand, the median is reported [default: 5]
+  --output=<file>  Write the results to a file instead of stdout
+"""
+from docopt import docopt
+
+import re
+import sys
+import json
+import time
+import subprocess
+
+RUN = "import sys; sys.argv = {argv!r}; from wanna.entry_points.wannacli import main; main()"
+PARSE = (
+    "import importlib; from docopt import docopt; from wanna.entry_points import wannacli;"
+    " from wanna import ALIASES; docopt(wannacli.__doc__, argv={argv!r}[1:]);"
+    " importlib.import_module(ALIASES['aws'].split(':')[0])"
+)
+
+SUBCOMMANDS = {
+    "help": (RUN, ["--help"]),
+    "version": (RUN, ["--version"]),
+    "generate_secret": (RUN, ["generate_secret"]),
+    "ls": (PARSE, ["ls"]),
+    "search": (PARSE, ["search", "sample"]),
+    "upload": (PARSE, ["upload", "sample.bam"]),
+    "download": (PARSE, ["download", "sample.bam"]),
+    "sync": (PARSE, ["sync", "."]),
+}
+
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def cold_start(snippet, argv):
+    """Wall time in ms and the imported modules with their cumulative time in us"""
+    command = [sys.executable, "-X", "importtime", "-c", snippet.format(argv=["wanna"] + argv)]
+    started = time.time()
+    process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    wall = (time.time() - started) * 1000
+    modules = {}
+    for line in process.stderr.decode("utf-8", "replace").splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(2)), len(match.group(3)) == 1)
+    return wall, modules
+
+
+def measure(name, repeat=5):
+    snippet, argv = SUBCOMMANDS[name]
+    runs = [cold_start(snippet, argv) for _ in range(repeat)]
+    runs.sort(key=lambda run: run[0])
+    wall, modules = runs[len(runs) // 2]
+    top_level = dict((module, cumulative) for module, (cumulative, top) in modules.items() if top)
+    return {
+        "command": "wanna " + " ".join(argv),
+        "wall_ms": round(wall, 1),
+        "import_ms": round(sum(top_level.values()) / 1000.0, 1),
+        "boto3_imported": "boto3" in modules,
+        "slowest_imports_ms": dict(
+            (module, round(cumulative / 1000.0, 1))
+            for module, cumulative in sorted(top_level.items(), key=lambda item: -item[1])[:5]
+        ),
+    }
+
+
+def main():
+    args = docopt(__doc__)
+    results = [measure(name, int(args["--repeat"])) for name in sorted(SUBCOMMANDS)]
+    report = json.dumps({"python": sys.version.split()[0], "startup": results}, indent=2)
+    if args["--output"]:
+        with open(args["--output"], "w") as output:
+            output.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
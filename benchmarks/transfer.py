@@ -0,0 +1,315 @@
+"""Transfer benchmarks against a local S3 stand-in
+
+Measures the upload and download of files of every size (sparse files, so
+a 20GB file costs no disk until it is downloaded) for every part size and
+concurrency, a directory of many small files, and `ls`, `search`, `rename`
+and `delete` over a prefix of many keys. The results are printed as json,
+keep them per commit to spot regressions.
+
+Usage:
+  transfer.py [--endpoint=<url> | --moto-server] [--sizes=<sizes>] [--part-sizes=<sizes>]
+              [--concurrency=<list>] [--files=<n>] [--keys=<n>] [--workloads=<names>]
+              [--repeat=<n>] [--output=<file>]
+
+Options:
+  --endpoint=<url>      S3 compatible server, eg. MinIO on http://127.0.0.1:9000, the credentials
+                        are read from AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY (default minioadmin)
+  --moto-server         Start a moto server on localhost (needs moto[server])
+  --sizes=<sizes>       File sizes of the upload and download workloads [default: 1KB,1MB,64MB,1GB]
+  --part-sizes=<sizes>  Part sizes compared by the upload and download workloads [default: 8MB,64MB]
+  --concurrency=<list>  Concurrency compared by the transfer workloads [default: 4,16]
+  --files=<n>           Files of the small_files workload [default: 1000]
+  --keys=<n>            Keys of the ls, search, rename and delete workloads, eg. 1000000 [default: 10000]
+  --workloads=<names>   Any of upload,download,small_files,ls,search,rename,delete [default: all]
+  --repeat=<n>          Runs of every measurement, the median is reported [default: 3]
+  --output=<file>       Write the results to a file instead of stdout
+
+Without --endpoint or --moto-server the requests are answered by moto in
+this process, which shows the overhead of wanna itself but no network.
+rename and delete change the keys they measure and run once.
+"""
+from docopt import docopt
+
+import os
+import sys
+import json
+import time
+import logging
+import shutil
+import tempfile
+import itertools
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+
+# measure the checkout the script belongs to, not an installed wanna
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKLOADS = ("upload", "download", "small_files", "ls", "search", "rename", "delete")
+BUCKET = "wanna-benchmark"
+SMALL_FILE_SIZE = 4 * 1024
+
+CREDENTIALS = """
+[default]
+provider = {provider}
+bucket = {bucket}
+ignore_prefix = true
+checksum_cache =
+
+[{provider}]
+{key_name} = {access_key}
+{secret_name} = {secret_key}
+{endpoint}
+"""
+
+
+def write_credentials(home, endpoint=None, access_key="testing", secret_key="testing"):
+    """Credentials of the stand-in in a throwaway HOME, nothing touches ~/.wanna"""
+    provider = "minio" if endpoint else "aws"
+    directory = os.path.join(home, ".wanna")
+    os.makedirs(directory)
+    with open(os.path.join(directory, "credentials"), "w") as credentials:
+        credentials.write(
+            CREDENTIALS.format(
+                provider=provider,
+                bucket=BUCKET,
+                key_name="minio_access_key" if endpoint else "aws_access_key_id",
+                secret_name="minio_secret_key" if endpoint else "aws_secret_access_key",
+                access_key=access_key,
+                secret_key=secret_key,
+                endpoint="endpoint_url = {}".format(endpoint) if endpoint else "",
+            )
+        )
+
+
+def median(runs):
+    return sorted(runs)[len(runs) // 2]
+
+
+def timed(func, repeat=1, before=None):
+    """Median wall time of `repeat` runs, `before` resets the state outside of the clock"""
+    runs = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - started)
+    return median(runs)
+
+
+def result(workload, seconds, size=None, objects=1, **params):
+    entry = dict(params, workload=workload, seconds=round(seconds, 4), objects=objects)
+    if size is not None:
+        entry["bytes"] = size
+        entry["mb_per_second"] = round(size / seconds / 1024 ** 2, 2) if seconds else None
+    entry["objects_per_second"] = round(objects / seconds, 1) if seconds else None
+    return entry
+
+
+class Bench(object):
+    """Workloads run against one bucket"""
+
+    def __init__(self, workdir, repeat):
+        from wanna import setup_vendor
+
+        self.setup_vendor = setup_vendor
+        self.workdir = workdir
+        self.repeat = repeat
+        vendor = self.vendor()
+        try:
+            vendor.client.create_bucket(
+                Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": vendor.region_name}
+            )
+        except vendor.client.exceptions.BucketAlreadyOwnedByYou:
+            pass
+
+    def vendor(self, part_size=None, concurrency=None):
+        return self.setup_vendor(
+            "aws",
+            use_encryption=False,
+            ignore_prefix=True,
+            part_size=part_size,
+            concurrency=concurrency,
+            multipart_threshold=part_size,
+        )
+
+    def path(self, *names):
+        return os.path.join(self.workdir, *names)
+
+    def sparse_file(self, size):
+        path = self.path("bench-{}.bin".format(size))
+        if not os.path.exists(path):
+            with open(path, "wb") as sparse:
+                sparse.truncate(size)
+        return path
+
+    def transfers(self, sizes, part_sizes, concurrency, workloads):
+        """Upload and download of a file of every size, for every part size and concurrency"""
+        for size, part_size, workers in itertools.product(sizes, part_sizes, concurrency):
+            vendor = self.vendor(part_size, workers)
+            path = self.sparse_file(size)
+            key = os.path.basename(path)
+            params = dict(size=size, part_size=part_size, concurrency=workers)
+            seconds = timed(lambda: vendor.upload_files(path), self.repeat)
+            if "upload" in workloads:
+                yield result("upload", seconds, **params)
+            if "download" in workloads:
+                local = self.path("downloaded.bin")
+                seconds = timed(
+                    lambda: vendor.download_file(key, local), self.repeat, lambda: _remove(local)
+                )
+                _remove(local)
+                yield result("download", seconds, **params)
+            vendor.delete_files([key])
+
+    def small_files(self, count, concurrency):
+        """A directory of many small files, synced up and downloaded"""
+        source = self.path("small")
+        os.makedirs(source)
+        for index in range(count):
+            with open(os.path.join(source, "{:07d}.txt".format(index)), "wb") as small:
+                small.write(b"x" * SMALL_FILE_SIZE)
+        for workers in concurrency:
+            vendor = self.vendor(concurrency=workers)
+            params = dict(files=count, file_size=SMALL_FILE_SIZE, concurrency=workers)
+            seconds = timed(
+                lambda: vendor.sync(source, "small", jobs=workers),
+                self.repeat,
+                lambda: vendor.delete_prefix("small/"),
+            )
+            yield result("small_files_upload", seconds, count * SMALL_FILE_SIZE, count, **params)
+            target = self.path("small-downloaded")
+            seconds = timed(
+                lambda: vendor.download_prefix("small/", target, jobs=workers),
+                self.repeat,
+                lambda: shutil.rmtree(target, ignore_errors=True),
+            )
+            yield result("small_files_download", seconds, count * SMALL_FILE_SIZE, count, **params)
+            vendor.delete_prefix("small/")
+        shutil.rmtree(source)
+
+    def keys(self, count, workloads):
+        """Listing, search, rename and delete of a prefix of `count` keys"""
+        vendor = self.vendor()
+        names = ["keys/{:03d}/key-{:08d}".format(index % 1000, index) for index in range(count)]
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            for _ in pool.map(lambda name: vendor.client.put_object(Bucket=BUCKET, Key=name, Body=b""), names):
+                pass
+        prefix = "keys/"
+        term = names[count // 2].rsplit("/", 1)[1]
+        if "ls" in workloads:
+            seconds = timed(lambda: _drain(vendor.list_files(prefix=prefix)), self.repeat)
+            yield result("ls", seconds, objects=count)
+        if "search" in workloads:
+            seconds = timed(lambda: _drain(vendor.search(term, refresh=True)), self.repeat)
+            yield result("search_listing", seconds, objects=count)
+            seconds = timed(lambda: _drain(vendor.search(term)), self.repeat)
+            yield result("search_index", seconds, objects=count)
+        if "rename" in workloads:
+            seconds = timed(lambda: vendor.rename_prefix(prefix, "renamed/"))
+            yield result("rename", seconds, objects=count)
+            prefix = "renamed/"
+        seconds = timed(lambda: vendor.delete_prefix(prefix))
+        if "delete" in workloads:
+            yield result("delete", seconds, objects=count)
+
+
+def _drain(iterable):
+    for _ in iterable:
+        pass
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args, workdir):
+    from wanna.utils import parse_size
+
+    workloads = WORKLOADS if args["--workloads"] == "all" else tuple(args["--workloads"].split(","))
+    unknown = set(workloads) - set(WORKLOADS)
+    if unknown:
+        raise SystemExit("unknown workloads: {}".format(", ".join(sorted(unknown))))
+    sizes = [parse_size(size) for size in args["--sizes"].split(",")]
+    part_sizes = [parse_size(size) for size in args["--part-sizes"].split(",")]
+    concurrency = [int(workers) for workers in args["--concurrency"].split(",")]
+
+    bench = Bench(workdir, int(args["--repeat"]))
+    results = []
+    if "upload" in workloads or "download" in workloads:
+        results.extend(bench.transfers(sizes, part_sizes, concurrency, workloads))
+    if "small_files" in workloads:
+        results.extend(bench.small_files(int(args["--files"]), concurrency))
+    if set(workloads) & set(("ls", "search", "rename", "delete")):
+        results.extend(bench.keys(int(args["--keys"]), workloads))
+    return results
+
+
+def main():
+    args = docopt(__doc__)
+    logging.basicConfig(stream=sys.stderr, level=logging.ERROR)
+    started = time.strftime("%Y-%m-%dT%H:%M:%S")
+    workdir = tempfile.mkdtemp(prefix="wanna-benchmark-")
+    server = None
+    endpoint = args["--endpoint"]
+    try:
+        os.environ["HOME"] = workdir
+        if args["--moto-server"]:
+            from moto.server import ThreadedMotoServer
+
+            server = ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+            server.start()
+            host, port = server.get_host_and_port()
+            endpoint = "http://{}:{}".format(host, port)
+            write_credentials(workdir, endpoint)
+        elif endpoint:
+            write_credentials(
+                workdir,
+                endpoint,
+                os.environ.get("AWS_ACCESS_KEY_ID", "minioadmin"),
+                os.environ.get("AWS_SECRET_ACCESS_KEY", "minioadmin"),
+            )
+        else:
+            write_credentials(workdir)
+        if endpoint:
+            results = run(args, workdir)
+        else:
+            from moto import mock_aws
+
+            with mock_aws():
+                results = run(args, workdir)
+    finally:
+        if server is not None:
+            server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = json.dumps(
+        {
+            "commit": _commit(),
+            "python": sys.version.split()[0],
+            "server": "moto server" if server is not None else endpoint or "moto in process",
+            "started": started,
+            "results": results,
+        },
+        indent=2,
+    )
+    if args["--output"]:
+        with open(args["--output"], "w") as output:
+            output.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -39,7 +39,7 @@ def find_version(*file_paths):
     raise RuntimeError("Unable to find version string.")
 
 
-requires = ["docopt==0.6.2", "boto3~=1.9", "configparser==3.5.0"]
+requires = ["docopt==0.6.2", "boto3~=1.9"]
 
 test_requires = [
     'mock==2.0.0'
@@ -57,6 +57,7 @@ setup_options = dict(
     packages=find_packages(exclude=["tests*"]),
     install_requires=requires,
     test_requires=test_requires,
+    python_requires=">=3.8",
     zip_safe=False,
     license="BSD",
     classifiers=list(
@@ -68,13 +69,13 @@ setup_options = dict(
             "Environment :: Console",
             "License :: OSI Approved :: BSD License",
             "Programming Language :: Python",
-            "Programming Language :: Python :: 2.6",
-            "Programming Language :: Python :: 2.7",
             "Programming Language :: Python :: 3",
-            "Programming Language :: Python :: 3.3",
-            "Programming Language :: Python :: 3.4",
-            "Programming Language :: Python :: 3.5",
-            "Programming Language :: Python :: 3.6",
+            "Programming Language :: Python :: 3 :: Only",
+            "Programming Language :: Python :: 3.8",
+            "Programming Language :: Python :: 3.9",
+            "Programming Language :: Python :: 3.10",
+            "Programming Language :: Python :: 3.11",
+            "Programming Language :: Python :: 3.12",
             "Programming Language :: Python :: Implementation :: PyPy",
         )
     ),
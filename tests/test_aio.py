@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+
+from mock import patch
+from pytest import raises
+
+from wanna.aio import AsyncTransfer
+
+from tests.test_config import config_file
+from tests.test_wanna import vendor
+from tests.test_multipart import big_file, multipart_vendor
+
+
+def test_upload_download_roundtrip(vendor, tmpdir):
+    sample = tmpdir.join("sample.bam")
+    sample.write("spam")
+    dst = tmpdir.mkdir("dst")
+
+    async def run():
+        async with AsyncTransfer(vendor) as transfer:
+            events = transfer.events()
+            key = await transfer.upload(str(sample), "run1/sample.bam")
+            local = await transfer.download(key, str(dst))
+            received = [await events.__anext__() for _ in range(4)]
+            await events.aclose()
+        return key, local, received
+
+    key, local, received = asyncio.run(run())
+
+    assert key == "run1/sample.bam"
+    assert dst.join("sample.bam").read() == "spam"
+    assert [(event.kind, event.key) for event in received] == [
+        ("progress", key),
+        ("done", key),
+        ("progress", key),
+        ("done", key),
+    ]
+    assert received[-1].value == local
+
+
+def test_concurrent_uploads_list_and_delete(vendor, tmpdir):
+    paths = []
+    for index in range(20):
+        path = tmpdir.join("{}.bam".format(index))
+        path.write("x" * index)
+        paths.append(str(path))
+
+    async def run():
+        async with AsyncTransfer(vendor, max_workers=4, page_size=7) as transfer:
+            await asyncio.gather(*(transfer.upload(path, "run1/" + path.rsplit("/", 1)[1]) for path in paths))
+            listed = [el["name"] async for el in transfer.list("run1/")]
+            found = [key async for key in transfer.search("19.bam")]
+            deleted = await transfer.delete_prefix("run1/")
+        return listed, found, deleted
+
+    listed, found, deleted = asyncio.run(run())
+
+    assert sorted(listed) == sorted("run1/{}.bam".format(index) for index in range(20))
+    assert found == ["run1/19.bam"]
+    assert deleted == (20, [])
+
+
+def test_missing_object_fails(vendor, tmpdir):
+    async def run():
+        async with AsyncTransfer(vendor) as transfer:
+            events = transfer.events()
+            with raises(KeyError):
+                await transfer.download("nope.bam", str(tmpdir))
+            event = await events.__anext__()
+            await events.aclose()
+        return event
+
+    event = asyncio.run(run())
+    assert (event.kind, event.key) == ("failed", "nope.bam")
+
+
+def test_cancel_aborts_multipart_upload(multipart_vendor, big_file):
+    client = multipart_vendor.client
+    upload_part = client.upload_part
+    started = threading.Event()
+
+    def slow(**kwargs):
+        started.set()
+        time.sleep(0.2)
+        return upload_part(**kwargs)
+
+    async def run():
+        async with AsyncTransfer(multipart_vendor) as transfer:
+            events = transfer.events()
+            task = asyncio.ensure_future(transfer.upload(big_file, "sample.bam"))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with raises(asyncio.CancelledError):
+                await task
+            kinds = set()
+            while "cancelled" not in kinds:
+                kinds.add((await events.__anext__()).kind)
+            await events.aclose()
+        return kinds
+
+    with patch.object(client, "upload_part", side_effect=slow):
+        kinds = asyncio.run(run())
+
+    assert "done" not in kinds
+    assert client.list_multipart_uploads(Bucket="sausage").get("Uploads", []) == []
+    assert list(multipart_vendor.journal.entries()) == []
+    assert "Contents" not in client.list_objects_v2(Bucket="sausage")
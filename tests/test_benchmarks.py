@@ -0,0 +1,42 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_transfer_benchmark_runs(tmpdir):
+    output = tmpdir.join("results.json")
+    subprocess.check_call(
+        [
+            sys.executable,
+            os.path.join(ROOT, "benchmarks", "transfer.py"),
+            "--sizes=1KB,6MB",
+            "--part-sizes=5MB",
+            "--concurrency=2",
+            "--files=3",
+            "--keys=5",
+            "--repeat=1",
+            "--output={}".format(output),
+        ],
+        cwd=str(tmpdir),
+    )
+
+    report = json.loads(output.read())
+    assert report["server"] == "moto in process"
+    workloads = [(entry["workload"], entry.get("bytes")) for entry in report["results"]]
+    assert workloads == [
+        ("upload", 1024),
+        ("download", 1024),
+        ("upload", 6 * 1024 ** 2),
+        ("download", 6 * 1024 ** 2),
+        ("small_files_upload", 3 * 4096),
+        ("small_files_download", 3 * 4096),
+        ("ls", None),
+        ("search_listing", None),
+        ("search_index", None),
+        ("rename", None),
+        ("delete", None),
+    ]
+    assert all(entry["seconds"] > 0 for entry in report["results"])
@@ -0,0 +1,57 @@
+from mock import patch
+
+from wanna.cache import ChecksumCache
+
+from tests.test_config import config_file
+from tests.test_wanna import vendor
+
+
+def test_checksum_cache(tmpdir):
+    cache = ChecksumCache(str(tmpdir.join("checksums.db")))
+    sample = tmpdir.join("sample.bam")
+    sample.write("spam")
+
+    assert cache.get(str(sample), "md5") is None
+    cache.put(str(sample), "md5", None, "cafe")
+    assert cache.get(str(sample), "md5") == "cafe"
+    assert cache.get(str(sample), "sha256", 1024) is None
+
+    sample.write("spam and eggs")
+    assert cache.get(str(sample), "md5") is None
+
+
+def test_checksum_cache_evicts_least_recently_used(tmpdir):
+    cache = ChecksumCache(str(tmpdir.join("checksums.db")), max_entries=2)
+    paths = []
+    for name in ("egg", "bacon", "spam"):
+        paths.append(str(tmpdir.join(name)))
+        tmpdir.join(name).write(name)
+
+    cache.put(paths[0], "md5", None, "egg")
+    cache.put(paths[1], "md5", None, "bacon")
+    cache.get(paths[0], "md5")
+    cache.put(paths[2], "md5", None, "spam")
+
+    assert cache.get(paths[0], "md5") == "egg"
+    assert cache.get(paths[1], "md5") is None
+    assert cache.get(paths[2], "md5") == "spam"
+
+
+def test_disabled_checksum_cache(tmpdir):
+    cache = ChecksumCache("")
+    cache.put(str(tmpdir), "md5", None, "cafe")
+    assert cache.get(str(tmpdir), "md5") is None
+
+
+def test_unchanged_file_is_not_hashed_again(vendor, tmpdir):
+    sample = tmpdir.join("sample.fastq")
+    sample.write("ACGT" * 1000)
+
+    checksum = vendor.get_checksum(str(sample))
+    with patch("wanna.vendors.aws.hash_file") as hash_file:
+        assert vendor.get_checksum(str(sample)) == checksum
+        vendor.upload_files(str(sample), add_checksum=True)
+    assert not hash_file.called
+
+    stored = vendor.client.get_object(Bucket="sausage", Key="sample.fastq.md5")["Body"].read()
+    assert stored.decode() == checksum
@@ -171,3 +171,53 @@ def test_vendor_override_for_default_provider(config_file):
     assert config.PROVIDER == "minio"
     assert config.BUCKET == "foo"
 
+
+def test_transfer_defaults(config_file):
+    config = config_file(SAMPLE_CONFIG)
+    assert config.TRANSFER.MULTIPART_THRESHOLD == 8 * 1024 ** 2
+    assert config.TRANSFER.MULTIPART_CHUNKSIZE == "auto"
+    assert config.TRANSFER.MAX_CONCURRENCY == 10
+    # the parts or ranges of a run, and the files next to them
+    assert config.TRANSFER.max_pool_connections == 20
+
+def test_transfer_settings_per_profile(config_file):
+    config = config_file("""
+    [default]
+    max_concurrency = 4
+
+    [aws:fast]
+    aws_access_key_id = aaki
+    aws_secret_access_key = asak
+    multipart_chunksize = 64MB
+    max_concurrency = 32
+    max_pool_connections = 40
+    """, profile="fast")
+    assert config.TRANSFER.MULTIPART_CHUNKSIZE == 64 * 1024 ** 2
+    assert config.TRANSFER.MAX_CONCURRENCY == 32
+    assert config.TRANSFER.max_pool_connections == 40
+
+def test_transfer_settings_override(config_file):
+    config = config_file(SAMPLE_CONFIG)
+    config.TRANSFER.override(multipart_chunksize="16MB", max_concurrency="3")
+    assert config.TRANSFER.chunksize(10 ** 12) == 16 * 1024 ** 2
+    assert config.TRANSFER.MAX_CONCURRENCY == 3
+
+def test_auto_chunksize(config_file):
+    transfer = config_file(SAMPLE_CONFIG).TRANSFER
+    assert transfer.chunksize(5 * 1024 ** 2) == 8 * 1024 ** 2
+    assert transfer.chunksize(500 * 1024 ** 3) * 10000 >= 500 * 1024 ** 3
+    assert transfer.chunksize(500 * 1024 ** 3) == 64 * 1024 ** 2
+
+def test_bandwidth_settings(config_file):
+    config = config_file("""
+    [aws:lab]
+    aws_access_key_id = aaki
+    aws_secret_access_key = asak
+    max_bandwidth = 200MB/s
+    bandwidth_schedule = 08:00-18:00=50MB/s, 22:00-06:00=off
+    """, profile="lab")
+    assert config.TRANSFER.MAX_BANDWIDTH == 200 * 1024 ** 2
+    assert [rate for _, _, rate in config.TRANSFER.BANDWIDTH_SCHEDULE] == [50 * 1024 ** 2, None]
+    assert config.TRANSFER.BANDWIDTH_FILE is None
+    config.TRANSFER.override(max_bandwidth="1MB")
+    assert config.TRANSFER.MAX_BANDWIDTH == 1024 ** 2
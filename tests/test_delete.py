@@ -0,0 +1,71 @@
+from mock import patch
+from pytest import raises
+
+from wanna.misc import delete_files
+
+from tests.test_config import config_file
+from tests.test_wanna import vendor
+
+
+def _put(vendor, *keys):
+    for key in keys:
+        vendor.client.put_object(Bucket="sausage", Key=key, Body=b"x")
+
+
+def _keys(vendor):
+    return sorted(el["name"] for el in vendor.list_files())
+
+
+def test_delete_prefix_in_batches(vendor):
+    vendor.list_page_size = 3
+    vendor.delete_batch_size = 2
+    _put(vendor, *["run1/sample{}.bam".format(i) for i in range(7)] + ["run10/sample.bam"])
+
+    with patch.object(vendor.client, "delete_objects", side_effect=vendor.client.delete_objects) as batches:
+        assert vendor.delete_prefix("run1/") == (7, [])
+
+    assert len(batches.call_args_list) == 4
+    assert _keys(vendor) == ["run10/sample.bam"]
+
+
+def test_delete_dry_run_counts(vendor):
+    _put(vendor, "run1/a.bam", "run1/b.bam")
+
+    assert vendor.delete_prefix("run1/", dry_run=True) == (2, [])
+    assert vendor.delete_files(["run1/a.bam"], dry_run=True) == (1, [])
+    assert _keys(vendor) == ["run1/a.bam", "run1/b.bam"]
+
+
+def test_delete_reports_errors(vendor):
+    _put(vendor, "run1/a.bam", "run1/b.bam")
+    delete_objects = vendor.client.delete_objects
+
+    def denied(**kwargs):
+        delete_objects(Bucket=kwargs["Bucket"], Delete={"Objects": kwargs["Delete"]["Objects"][:1]})
+        key = kwargs["Delete"]["Objects"][1]["Key"]
+        return {"Errors": [{"Key": key, "Code": "AccessDenied", "Message": "Access Denied"}]}
+
+    with patch.object(vendor.client, "delete_objects", side_effect=denied):
+        deleted, errors = vendor.delete_files(["run1/a.bam", "run1/b.bam"])
+
+    assert deleted == 1
+    assert errors == [{"Key": "run1/b.bam", "Code": "AccessDenied", "Message": "Access Denied"}]
+    assert _keys(vendor) == ["run1/b.bam"]
+
+
+def test_refuse_to_delete_the_bucket(vendor):
+    with raises(ValueError):
+        vendor.delete_prefix("")
+
+
+def test_delete_of_a_single_missing_key_fails(vendor):
+    _put(vendor, "run1/a.bam")
+
+    with patch("wanna.misc.setup_vendor", return_value=vendor):
+        with raises(KeyError):
+            delete_files("aws", ["run1/nope.bam"])
+        assert delete_files("aws", ["run1/a.bam"]) == (1, [])
+        # many keys are deleted as given, without a lookup each
+        assert delete_files("aws", ["run1/nope.bam", "run1/other.bam"]) == (2, [])
+
+    assert _keys(vendor) == []
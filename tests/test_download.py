@@ -0,0 +1,144 @@
+import os
+import hashlib
+
+from mock import patch
+from pytest import fixture, raises
+
+from wanna.download import IntegrityError
+from wanna.vendors.aws.ranged import RangedDownload
+
+from tests.test_config import config_file
+from tests.test_wanna import vendor
+
+MB = 1024 ** 2
+BODY = b"".join(bytes(bytearray([i])) * MB for i in range(11))
+
+
+@fixture
+def stored(vendor):
+    vendor.transfer_settings.override(multipart_chunksize="4MB")
+    vendor.client.put_object(Bucket="sausage", Key="sample.bam", Body=BODY)
+    return vendor
+
+
+def flaky(get_object, failing):
+    def wrapper(**kwargs):
+        if kwargs["Range"] in failing:
+            failing.remove(kwargs["Range"])
+            raise IOError("connection reset")
+        return get_object(**kwargs)
+
+    return wrapper
+
+
+def test_ranged_download(stored, tmpdir):
+    stored.download_file("sample.bam", dst=str(tmpdir))
+
+    assert tmpdir.join("sample.bam").read_binary() == BODY
+    assert sorted(os.listdir(str(tmpdir))) == ["config", "sample.bam"]
+
+
+def test_interrupted_download_is_resumed(stored, tmpdir):
+    client = stored.client
+    get_object = client.get_object
+    with patch.object(client, "get_object", side_effect=flaky(get_object, ["bytes=8388608-11534335"])):
+        with raises(IOError):
+            stored.download_file("sample.bam", dst=str(tmpdir))
+
+    assert not tmpdir.join("sample.bam").exists()
+    assert tmpdir.join("sample.bam.part").exists()
+
+    with patch.object(client, "get_object", side_effect=get_object) as fetched:
+        stored.download_file("sample.bam", dst=str(tmpdir))
+
+    ranges = [call[1]["Range"] for call in fetched.call_args_list if "IfMatch" in call[1]]
+    assert ranges == ["bytes=8388608-11534335"]
+    assert tmpdir.join("sample.bam").read_binary() == BODY
+    assert not tmpdir.join("sample.bam.part").exists()
+    assert not tmpdir.join("sample.bam.part.state").exists()
+
+
+def test_changed_object_is_downloaded_again(stored, tmpdir):
+    client = stored.client
+    get_object = client.get_object
+    with patch.object(client, "get_object", side_effect=flaky(get_object, ["bytes=8388608-11534335"])):
+        with raises(IOError):
+            stored.download_file("sample.bam", dst=str(tmpdir))
+
+    client.put_object(Bucket="sausage", Key="sample.bam", Body=BODY[::-1])
+
+    with patch.object(client, "get_object", side_effect=get_object) as fetched:
+        stored.download_file("sample.bam", dst=str(tmpdir))
+
+    # the first GET brings the first two ranges of the new object again
+    ranges = [call[1]["Range"] for call in fetched.call_args_list if "IfMatch" in call[1]]
+    assert ranges == ["bytes=8388608-11534335"]
+    assert tmpdir.join("sample.bam").read_binary() == BODY[::-1]
+
+
+def test_first_get_is_not_fetched_again(stored, tmpdir):
+    stored.transfer_settings.override(multipart_threshold="6MB")
+    client = stored.client
+
+    with patch.object(client, "get_object", side_effect=client.get_object) as fetched:
+        stored.download_file("sample.bam", dst=str(tmpdir))
+
+    # 0-6MB came with the first GET, the second range is only fetched from there on
+    ranges = [call[1]["Range"] for call in fetched.call_args_list]
+    assert sorted(ranges) == ["bytes=0-6291455", "bytes=6291456-8388607", "bytes=8388608-11534335"]
+    assert tmpdir.join("sample.bam").read_binary() == BODY
+
+
+def test_failed_first_get_is_written_again(stored, tmpdir):
+    # the first GET ends inside the first range
+    stored.transfer_settings.override(multipart_threshold="1MB")
+    client = stored.client
+
+    with patch.object(RangedDownload, "_write_leading", side_effect=IOError("connection reset")):
+        with raises(IOError):
+            stored.download_file("sample.bam", dst=str(tmpdir))
+
+    with patch.object(client, "get_object", side_effect=client.get_object) as fetched:
+        stored.download_file("sample.bam", dst=str(tmpdir))
+
+    # the tail of the first range was on disk, its head was not
+    ranges = [call[1]["Range"] for call in fetched.call_args_list]
+    assert sorted(ranges) == ["bytes=0-1048575", "bytes=1048576-4194303"]
+    assert tmpdir.join("sample.bam").read_binary() == BODY
+
+
+def test_download_verified_while_streaming(stored, tmpdir):
+    stored.client.put_object(Bucket="sausage", Key="sample.bam.md5", Body=hashlib.md5(BODY).hexdigest())
+    checksum = stored.get_remote_checksum("sample.bam")
+
+    with patch("wanna.vendors.aws.hash_file") as hash_file:
+        stored.download_file("sample.bam", dst=str(tmpdir), checksum=checksum)
+    assert not hash_file.called
+    assert tmpdir.join("sample.bam").read_binary() == BODY
+
+
+def test_corrupted_download(stored, tmpdir):
+    with raises(IntegrityError):
+        stored.download_file("sample.bam", dst=str(tmpdir), checksum=hashlib.md5(b"spam").hexdigest())
+    assert not tmpdir.join("sample.bam").exists()
+    assert not tmpdir.join("sample.bam.part").exists()
+
+
+def test_small_object_is_a_single_get(stored, tmpdir):
+    client = stored.client
+    client.put_object(Bucket="sausage", Key="small.vcf", Body=b"spam")
+
+    with patch.object(client, "get_object", side_effect=client.get_object) as fetched:
+        with patch.object(client, "head_object") as head:
+            with patch.object(client, "list_objects_v2") as listed:
+                stored.download_file("small.vcf", dst=str(tmpdir))
+
+    assert len(fetched.call_args_list) == 1
+    assert not head.called and not listed.called
+    assert tmpdir.join("small.vcf").read_binary() == b"spam"
+
+
+def test_missing_object(stored, tmpdir):
+    with raises(KeyError):
+        stored.download_file("missing.vcf", dst=str(tmpdir))
+    assert not tmpdir.join("missing.vcf").exists()
@@ -0,0 +1,118 @@
+import os
+import hashlib
+
+from mock import patch
+
+from wanna.hashing import Checksum
+
+from tests.test_config import config_file
+from tests.test_wanna import vendor
+
+
+def _put(vendor, *keys):
+    for key in keys:
+        vendor.client.put_object(Bucket="sausage", Key=key, Body=key.encode("ascii"))
+
+
+def _files(root):
+    return sorted(
+        os.path.relpath(os.path.join(path, name), str(root)).replace(os.sep, "/")
+        for path, _, names in os.walk(str(root))
+        for name in names
+    )
+
+
+def test_download_prefix_mirrors_the_hierarchy(vendor, tmpdir):
+    vendor.list_page_size = 2
+    _put(vendor, "run1/a.bam", "run1/sub/b.bam", "run1/sub/c.vcf", "run10/d.bam")
+    dst = tmpdir.join("dst")
+
+    downloaded, skipped, failed = vendor.download_prefix("run1/", dst=str(dst), jobs=2)
+
+    assert sorted(downloaded) == ["run1/a.bam", "run1/sub/b.bam", "run1/sub/c.vcf"]
+    assert (skipped, failed) == ([], [])
+    assert _files(dst) == ["a.bam", "sub/b.bam", "sub/c.vcf"]
+    assert dst.join("sub", "b.bam").read() == "run1/sub/b.bam"
+
+
+def test_download_pattern(vendor, tmpdir):
+    _put(vendor, "run1/a.bam", "run1/sub/b.bam", "run1/sub/c.vcf", "run2/d.bam")
+    dst = tmpdir.join("dst")
+
+    downloaded, _, _ = vendor.download_prefix("run1/*.bam", dst=str(dst), pattern=True)
+
+    assert sorted(downloaded) == ["run1/a.bam", "run1/sub/b.bam"]
+    assert _files(dst) == ["a.bam", "sub/b.bam"]
+
+
+def test_download_prefix_takes_glob_characters_literally(vendor, tmpdir):
+    _put(vendor, "run1/sample[1].bam", "run1/sample1.bam")
+    dst = tmpdir.join("dst")
+
+    downloaded, _, _ = vendor.download_prefix("run1/sample[1].bam", dst=str(dst))
+
+    assert downloaded == ["run1/sample[1].bam"]
+    assert _files(dst) == ["sample[1].bam"]
+
+
+def test_download_prefix_skips_files_already_there(vendor, tmpdir):
+    _put(vendor, "run1/a.bam", "run1/b.bam")
+    dst = tmpdir.join("dst")
+    vendor.download_prefix("run1/", dst=str(dst))
+    dst.join("b.bam").remove()
+
+    with patch.object(vendor.client, "get_object", side_effect=vendor.client.get_object) as fetched:
+        downloaded, skipped, _ = vendor.download_prefix("run1/", dst=str(dst))
+
+    assert (downloaded, skipped) == (["run1/b.bam"], ["run1/a.bam"])
+    assert len(fetched.call_args_list) == 1
+
+
+def test_download_prefix_reports_failures(vendor, tmpdir):
+    _put(vendor, "run1/a.bam", "run1/b.bam")
+    get_object = vendor.client.get_object
+
+    def flaky(**kwargs):
+        if kwargs["Key"] == "run1/a.bam":
+            raise IOError("connection reset")
+        return get_object(**kwargs)
+
+    with patch.object(vendor.client, "get_object", side_effect=flaky):
+        downloaded, _, failed = vendor.download_prefix("run1/", dst=str(tmpdir.join("dst")))
+
+    assert downloaded == ["run1/b.bam"]
+    assert [key for key, _ in failed] == ["run1/a.bam"]
+
+
+def test_download_prefix_rejects_keys_leaving_dst(vendor, tmpdir):
+    _put(vendor, "run1/a.bam", "run1/../../escaped.bam")
+    dst = tmpdir.mkdir("deep").join("dst")
+
+    downloaded, _, failed = vendor.download_prefix("run1/", dst=str(dst))
+
+    assert downloaded == ["run1/a.bam"]
+    assert [key for key, _ in failed] == ["run1/../../escaped.bam"]
+    assert _files(tmpdir.join("deep")) == ["dst/a.bam"]
+    assert not tmpdir.join("escaped.bam").check()
+
+
+def test_download_prefix_caches_the_checksum_of_the_final_file(vendor, tmpdir):
+    _put(vendor, "run1/a.bam")
+    vendor.client.put_object(Bucket="sausage", Key="run1/a.bam.md5", Body=hashlib.md5(b"run1/a.bam").hexdigest())
+    checksum = Checksum.parse(vendor.get_remote_checksum("run1/a.bam"))
+    dst = tmpdir.join("dst")
+
+    downloaded, _, failed = vendor.download_prefix("run1/", dst=str(dst), add_checksum=True)
+
+    assert "run1/a.bam" in downloaded
+    assert failed == []
+    # the entry is keyed by the file with the modification time of the object
+    cached = vendor.checksum_cache.get(str(dst.join("a.bam")), checksum.algorithm, checksum.part_size)
+    assert Checksum.parse(cached) == checksum
+
+
+def test_connections_cover_the_jobs_and_the_ranges(vendor):
+    concurrency = vendor.transfer_settings.MAX_CONCURRENCY
+
+    # every job's first GET next to a full pool of range requests
+    assert vendor.client.meta.config.max_pool_connections == 2 * concurrency
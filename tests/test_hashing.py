@@ -0,0 +1,83 @@
+import zlib
+import base64
+import struct
+import random
+import hashlib
+
+from pytest import fixture, raises, mark
+
+from wanna.hashing import Checksum
+from wanna.hashing import OrderedDigest
+from wanna.hashing import _crc32c_python
+from wanna.hashing import crc32c_combine
+from wanna.hashing import hash_file
+from wanna.hashing import new_digest
+
+DATA = bytes(bytearray(random.getrandbits(8) for _ in range(300000)))
+
+
+@fixture
+def sample(tmpdir):
+    path = tmpdir.join("sample.bam")
+    path.write_binary(DATA)
+    return str(path)
+
+
+def test_ordered_digest_out_of_order():
+    data = bytes(bytearray(range(256))) * 100
+    chunks = [(offset, data[offset:offset + 1000]) for offset in range(0, len(data), 1000)]
+    digest = OrderedDigest()
+    for offset, chunk in reversed(chunks):
+        digest.update(offset, chunk)
+    assert digest.hexdigest() == hashlib.md5(data).hexdigest()
+
+
+def test_ordered_digest_incomplete():
+    digest = OrderedDigest()
+    digest.update(10, b"spam")
+    assert not digest.wait(0, timeout=0)
+    with raises(ValueError):
+        digest.hexdigest()
+
+
+def test_crc32c_combine():
+    assert _crc32c_python(b"123456789") == 0xE3069283
+    head, tail = DATA[:1000], DATA[1000:]
+    combined = crc32c_combine(zlib.crc32(head), zlib.crc32(tail), len(tail), poly=0xEDB88320)
+    assert combined == zlib.crc32(DATA)
+
+
+def test_md5_is_a_bare_digest(sample):
+    checksum = hash_file(sample)
+    assert str(checksum) == hashlib.md5(DATA).hexdigest()
+    assert Checksum.parse(str(checksum)).algorithm == "md5"
+
+
+def test_md5_etag(sample):
+    part_size = 100000
+    parts = b"".join(hashlib.md5(DATA[i:i + part_size]).digest() for i in range(0, len(DATA), part_size))
+    checksum = hash_file(sample, "md5-etag", part_size=part_size)
+    assert checksum.digest == hashlib.md5(parts).hexdigest() + "-3"
+    assert str(checksum) == "md5-etag:100000:" + checksum.digest
+
+
+def test_crc32c_is_a_full_object_checksum(sample):
+    checksum = hash_file(sample, "crc32c", part_size=100000)
+    expected = struct.pack(">I", _crc32c_python(DATA))
+    assert checksum.digest == base64.b64encode(expected).decode("ascii")
+
+
+@mark.parametrize("algorithm", ["md5", "md5-etag", "sha256", "crc32c"])
+def test_streaming_digest_matches_file_digest(sample, algorithm):
+    digest = new_digest(algorithm, part_size=65536)
+    chunks = [(offset, DATA[offset:offset + 40000]) for offset in range(0, len(DATA), 40000)]
+    random.shuffle(chunks)
+    for offset, chunk in chunks:
+        digest.update(offset, chunk)
+    assert digest.checksum() == hash_file(sample, algorithm, part_size=65536)
+    assert Checksum.parse(str(digest.checksum())) == digest.checksum()
+
+
+def test_unknown_algorithm():
+    with raises(ValueError):
+        new_digest("rot13")
@@ -0,0 +1,99 @@
+from mock import patch
+
+from wanna.index import _prefix_range
+
+from tests.test_config import config_file
+from tests.test_wanna import vendor
+
+
+def _put(vendor, *keys):
+    for key in keys:
+        vendor.client.put_object(Bucket="sausage", Key=key, Body=b"x")
+
+
+def test_search_is_answered_from_the_index(vendor):
+    _put(vendor, "run1/sample.bam", "run2/sample.vcf")
+
+    assert sorted(vendor.search("sample")) == ["run1/sample.bam", "run2/sample.vcf"]
+    assert vendor.key_index.refreshed is not None
+
+    with patch.object(vendor, "_iter_pages", side_effect=AssertionError("listed")):
+        assert list(vendor.search("vcf")) == ["run2/sample.vcf"]
+
+
+def test_stale_index_picks_up_appended_keys(vendor):
+    _put(vendor, "run1/a.bam")
+    list(vendor.search("bam"))
+    _put(vendor, "run1/b.bam", "run2/c.bam", "top.bam")
+    vendor.key_index.ttl = -1
+
+    assert sorted(vendor.search("bam")) == ["run1/a.bam", "run1/b.bam", "run2/c.bam", "top.bam"]
+
+
+def test_stale_index_picks_up_keys_inserted_before_the_last_one(vendor):
+    _put(vendor, "in/acme/sample_Z.bam")
+    list(vendor.search("sample"))
+    _put(vendor, "in/acme/sample_A.bam")
+    vendor.client.delete_object(Bucket="sausage", Key="in/acme/sample_Z.bam")
+    vendor.key_index.ttl = -1
+
+    assert list(vendor.search("sample")) == ["in/acme/sample_A.bam"]
+    listing = vendor.list_files(prefix="in/", use_index=True)
+    assert [el["name"] for el in listing] == ["in/acme/sample_A.bam"]
+
+
+def test_refresh_forgets_deleted_keys(vendor):
+    _put(vendor, "run1/a.bam", "run1/b.bam")
+    list(vendor.search("bam"))
+    vendor.client.delete_object(Bucket="sausage", Key="run1/a.bam")
+
+    assert sorted(vendor.search("bam")) == ["run1/a.bam", "run1/b.bam"]
+    assert list(vendor.search("bam", refresh=True)) == ["run1/b.bam"]
+
+
+def test_index_follows_uploads_and_deletes(vendor, tmpdir):
+    _put(vendor, "run1/a.bam")
+    list(vendor.search("bam"))
+    sample = tmpdir.join("b.bam")
+    sample.write("spam")
+
+    vendor.upload_files(str(sample))
+    vendor.delete_file("run1/a.bam")
+
+    with patch.object(vendor, "_iter_pages", side_effect=AssertionError("listed")):
+        assert list(vendor.search("bam")) == ["b.bam"]
+        assert vendor.check_if_key_exists("b.bam")
+        listing = list(vendor.list_files(dirs=True, use_index=True))
+    assert [el["name"] for el in listing] == ["b.bam"]
+
+
+def test_prefix_is_a_range_of_the_primary_key(vendor):
+    _put(vendor, "run1/a.bam", "run1/b.bam", "run10/c.bam", "run1\U0010ffff", "run2/d.bam")
+    list(vendor.search("bam"))
+    index = vendor.key_index
+
+    assert [entry["name"] for entry in index.keys("run1/")] == ["run1/a.bam", "run1/b.bam"]
+    assert [entry["name"] for entry in index.keys("run1", start_after="run1/b.bam")] == [
+        "run10/c.bam",
+        "run1\U0010ffff",
+    ]
+    assert [entry["name"] for entry in index.keys("run1\U0010ffff")] == ["run1\U0010ffff"]
+    assert len(list(index.keys(""))) == 5
+
+    condition, params = _prefix_range("run1/")
+    plan = index._connect().execute("EXPLAIN QUERY PLAN SELECT key FROM keys WHERE " + condition, params)
+    assert "INDEX sqlite_autoindex_keys_1 (key>? AND key<?)" in " ".join(str(row[-1]) for row in plan)
+
+
+def test_unordered_search_yields_before_the_listing_ends(vendor):
+    _put(vendor, "run1/sample.bam", "run2/sample.vcf")
+    list(vendor.search("sample"))
+
+    def keys(*args, **kwargs):
+        yield {"name": "run1/sample.bam"}
+        raise AssertionError("listed past the first match")
+
+    with patch.object(vendor.key_index, "keys", side_effect=keys):
+        matches = vendor.search("sample", ordered=False)
+        assert next(matches) == "run1/sample.bam"
+        assert list(vendor.search("sample", limit=1, ordered=False)) == ["run1/sample.bam"]
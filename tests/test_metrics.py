@@ -0,0 +1,98 @@
+import json
+
+from botocore.awsrequest import AWSResponse
+from pytest import raises
+
+from wanna.metrics import Metrics
+from wanna.metrics import report
+
+from tests.test_config import config_file
+from tests.test_wanna import vendor
+from tests.test_multipart import big_file, multipart_vendor
+
+SLOW_DOWN = b"<Error><Code>SlowDown</Code><Message>Please reduce your request rate.</Message></Error>"
+
+
+class Raw(object):
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+def slow_down(times):
+    def handler(request, **kwargs):
+        if times:
+            times.pop()
+            return AWSResponse(request.url, 503, {}, Raw(SLOW_DOWN))
+
+    return handler
+
+
+def test_upload_metrics(multipart_vendor, big_file, tmpdir):
+    stats = tmpdir.join("stats.json")
+    multipart_vendor.client.meta.events.register_first("before-send.s3.UploadPart", slow_down([1]))
+
+    with report(multipart_vendor, "upload", stats_json=str(stats)) as metrics:
+        multipart_vendor.upload_files(big_file, add_checksum=True, metrics=metrics)
+
+    result = json.loads(stats.read())
+    assert result["success"] is True
+    assert (result["files"], result["bytes"]) == (1, 11 * 1024 ** 2)
+    assert (result["retries"], result["throttled"]) == (1, 1)
+    assert result["latency"]["upload_part"]["count"] == 3
+    assert result["latency"]["upload_part"]["buckets"]["+Inf"] == 3
+    assert result["labels"]["bucket"] == "sausage"
+    assert result["hashing_seconds"] >= 0 and result["transfer_seconds"] > 0
+    assert not hasattr(multipart_vendor, "metrics")
+
+
+def test_runs_sharing_a_vendor_keep_their_metrics(multipart_vendor, big_file, tmpdir):
+    multipart_vendor.client.meta.events.register_first("before-send.s3.UploadPart", slow_down([1]))
+    other = Metrics("download")
+    other.attach(multipart_vendor.client)
+    try:
+        with report(multipart_vendor, "upload", stats_json=str(tmpdir.join("stats.json"))) as metrics:
+            multipart_vendor.upload_files(big_file, metrics=metrics)
+    finally:
+        other.detach(multipart_vendor.client)
+
+    assert metrics.retries.value == 1
+    assert (other.retries.value, other.throttled.value, other.latency) == (0, 0, {})
+
+
+def test_failed_download_is_reported(vendor, tmpdir):
+    textfile = tmpdir.join("wanna.prom")
+
+    with raises(KeyError):
+        with report(vendor, "download", stats_textfile=str(textfile)) as metrics:
+            vendor.download_file("nope.bam", str(tmpdir), metrics=metrics)
+
+    lines = textfile.read().splitlines()
+    assert any(line.startswith("wanna_last_run_success{") and line.endswith(" 0") for line in lines)
+    assert "# TYPE wanna_bytes gauge" in lines
+    assert tmpdir.listdir(lambda path: path.basename.endswith(".tmp")) == []
+
+
+def test_prometheus_histogram():
+    metrics = Metrics("download", labels={"bucket": 'sau"sage'})
+    for seconds in (0.01, 0.2, 0.2, 700):
+        metrics.observe("get_range", seconds)
+    metrics.add_file(42)
+    metrics.stop()
+
+    text = metrics.as_prometheus()
+    assert text.count("# TYPE wanna_request_latency_seconds histogram") == 1
+    assert 'bucket="sau\\"sage"' in text
+    buckets = [line for line in text.splitlines() if line.startswith("wanna_request_latency_seconds_bucket")]
+    assert buckets[0].endswith(" 1") and 'le="0.05"' in buckets[0]
+    assert buckets[-1].endswith(" 4") and 'le="+Inf"' in buckets[-1]
+    assert [line for line in text.splitlines() if line.startswith("wanna_request_latency_seconds_count")][0].endswith(" 4")
+    assert "wanna_bytes{" in text
+
+
+def test_no_report_collects_nothing(vendor):
+    with report(vendor, "upload") as metrics:
+        assert metrics is None
+        vendor.upload_files(__file__, metrics=metrics)
@@ -0,0 +1,109 @@
+import hashlib
+
+from mock import patch
+from pytest import fixture, raises
+
+from wanna.journal import UploadJournal
+
+from tests.test_config import config_file
+from tests.test_wanna import vendor
+
+MB = 1024 ** 2
+
+
+@fixture
+def big_file(tmpdir):
+    path = tmpdir.join("sample.bam")
+    path.write_binary(b"".join(bytes(bytearray([i])) * MB for i in range(11)))
+    return str(path)
+
+
+@fixture
+def multipart_vendor(vendor, tmpdir):
+    vendor.journal = UploadJournal(str(tmpdir.join("uploads")))
+    vendor.transfer_settings.override(multipart_threshold="5MB", multipart_chunksize="5MB")
+    return vendor
+
+
+def flaky(upload_part, failing):
+    def wrapper(**kwargs):
+        if kwargs["PartNumber"] in failing:
+            failing.remove(kwargs["PartNumber"])
+            raise IOError("connection reset")
+        return upload_part(**kwargs)
+
+    return wrapper
+
+
+def test_multipart_upload(multipart_vendor, big_file):
+    multipart_vendor.upload_files(big_file)
+
+    body = multipart_vendor.client.get_object(Bucket="sausage", Key="sample.bam")["Body"].read()
+    with open(big_file, "rb") as source:
+        assert body == source.read()
+    assert list(multipart_vendor.journal.entries()) == []
+
+
+def test_interrupted_upload_is_resumed(multipart_vendor, big_file):
+    client = multipart_vendor.client
+    upload_part = client.upload_part
+    with patch.object(client, "upload_part", side_effect=flaky(upload_part, [2])):
+        with raises(IOError):
+            multipart_vendor.upload_files(big_file)
+
+    entry, = multipart_vendor.journal.entries()
+    assert entry.parts
+
+    with patch.object(client, "upload_part", side_effect=upload_part) as sent:
+        multipart_vendor.upload_files(big_file)
+
+    assert [call[1]["PartNumber"] for call in sent.call_args_list] == [2]
+    body = client.get_object(Bucket="sausage", Key="sample.bam")["Body"].read()
+    with open(big_file, "rb") as source:
+        assert body == source.read()
+    assert list(multipart_vendor.journal.entries()) == []
+
+
+def test_abort_stale_uploads(multipart_vendor, big_file):
+    client = multipart_vendor.client
+    with patch.object(client, "upload_part", side_effect=IOError("connection reset")):
+        with raises(IOError):
+            multipart_vendor.upload_files(big_file)
+
+    upload, = multipart_vendor.list_uploads()
+    assert upload["resumable"]
+    assert list(multipart_vendor.abort_stale_uploads(older_than=24 * 365 * 100)) == []
+
+    aborted = list(multipart_vendor.abort_stale_uploads(older_than=-1))
+    assert [el["upload_id"] for el in aborted] == [upload["upload_id"]]
+    assert list(multipart_vendor.list_uploads()) == []
+    assert list(multipart_vendor.journal.entries()) == []
+
+
+def test_checksum_computed_while_uploading(multipart_vendor, big_file):
+    client = multipart_vendor.client
+    upload_part = client.upload_part
+    with patch.object(client, "upload_part", side_effect=flaky(upload_part, [1])):
+        with raises(IOError):
+            multipart_vendor.upload_files(big_file, add_checksum=True)
+
+    with patch("wanna.vendors.aws.hash_file") as hash_file:
+        multipart_vendor.upload_files(big_file, add_checksum=True)
+    assert not hash_file.called
+
+    checksum = client.get_object(Bucket="sausage", Key="sample.bam.md5")["Body"].read()
+    with open(big_file, "rb") as source:
+        assert checksum.decode() == hashlib.md5(source.read()).hexdigest()
+
+
+def test_checksum_algorithm_roundtrip(multipart_vendor, big_file, tmpdir):
+    multipart_vendor.checksum_algorithm = "sha256"
+    multipart_vendor.upload_files(big_file, add_checksum=True)
+
+    checksum = multipart_vendor.get_remote_checksum("sample.bam")
+    assert checksum.startswith("sha256:{}:".format(5 * MB))
+    assert checksum.endswith("-3")
+
+    dst = tmpdir.mkdir("dst")
+    multipart_vendor.download_file("sample.bam", dst=str(dst), checksum=checksum)
+    assert multipart_vendor.get_checksum(str(dst.join("sample.bam"))) == checksum
@@ -0,0 +1,88 @@
+import io
+import threading
+
+from wanna.progress import Counter
+from wanna.progress import Progress
+
+from tests.test_config import config_file
+from tests.test_wanna import vendor
+
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_counter_adds_from_many_threads():
+    counter = Counter()
+    threads = [
+        threading.Thread(target=lambda: [counter.add(3) for _ in range(10000)])
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.value == 8 * 3 * 10000
+
+
+def test_terminal_shows_every_file_and_the_total():
+    stream = Terminal()
+    progress = Progress(stream=stream, max_files=1)
+    first, second = progress.track("a.bam", 100), progress.track("b.bam", 300)
+    first(50)
+    second(100)
+
+    progress.paint()
+    frame = stream.getvalue()
+    assert "a.bam  50 / 100  (50.00%)" in frame
+    assert "b.bam" not in frame
+    assert "... and 1 more files" in frame
+    assert "0 of 2 files  150 / 400  (37.50%)" in frame
+
+    first(50)
+    progress.paint(final=True)
+    final = stream.getvalue()[len(frame):]
+    # back over the three lines of the last frame, which is cleared
+    assert final.startswith("\x1b[3F")
+    assert "a.bam" not in final
+    assert "1 of 2 files  200 / 400  (50.00%)" in final
+
+
+def test_log_lines_when_not_a_terminal():
+    stream = io.StringIO()
+    with Progress(stream=stream, humanized=True, log_interval=0.01) as progress:
+        callback = progress.track("a.bam", 2048)
+        while not stream.getvalue():
+            callback(1)
+
+    lines = stream.getvalue().splitlines()
+    assert all(line.startswith(("0 of 1 files", "1 of 1 files")) for line in lines)
+    assert "\x1b" not in stream.getvalue()
+    assert " in 0:00:00" in lines[-1]
+
+
+def test_upload_files_share_one_renderer(vendor, tmpdir, capsys):
+    for name in ("a.bam", "b.bam", "c.bam"):
+        tmpdir.join("run1", name).write("spam", ensure=True)
+
+    vendor.upload_files(str(tmpdir.join("run1")), progress=True, jobs=3)
+
+    line, = capsys.readouterr().out.splitlines()
+    assert line.startswith("3 of 3 files  12 / 12  (100.00%)")
+
+
+def test_finished_files_only_add_to_the_totals():
+    progress = Progress(stream=io.StringIO())
+    for index in range(100):
+        progress.track("{}.bam".format(index), 10)(10)
+    stream = progress.track("piped.bam", None)
+    stream(5)
+
+    assert progress._lines()[-1].startswith("100 of 101 files  1005 / ?")
+    assert [entry.name for entry in progress._files] == ["piped.bam"]
+
+    stream.finish()
+    assert progress._lines(final=True)[-1].startswith("101 of 101 files  1005 / 1005  (100.00%)")
+    assert progress._files == []
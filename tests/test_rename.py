@@ -0,0 +1,84 @@
+from mock import patch
+from pytest import fixture, raises
+from botocore.exceptions import ClientError
+
+from tests.test_config import config_file
+from tests.test_wanna import vendor
+
+MB = 1024 ** 2
+BIG = b"".join(bytes(bytearray([i])) * MB for i in range(11))
+
+
+@fixture
+def project(vendor):
+    vendor.transfer_settings.override(multipart_threshold="5MB", multipart_chunksize="5MB")
+    vendor.client.put_object(Bucket="sausage", Key="old/sample.bam", Body=BIG, Metadata={"run": "42"})
+    vendor.client.put_object(Bucket="sausage", Key="old/sample.bam.md5", Body=b"cafe")
+    vendor.client.put_object(Bucket="sausage", Key="old/sub/sample.vcf", Body=b"spam")
+    vendor.client.put_object(Bucket="sausage", Key="older/keep.vcf", Body=b"eggs")
+    return vendor
+
+
+def _keys(vendor):
+    return sorted(el["name"] for el in vendor.list_files())
+
+
+def _read(vendor, key):
+    return vendor.client.get_object(Bucket="sausage", Key=key)["Body"].read()
+
+
+def test_rename_prefix(project):
+    client = project.client
+    with patch.object(client, "upload_part_copy", side_effect=client.upload_part_copy) as parts:
+        moves, errors = project.rename_prefix("old/", "new/")
+
+    assert errors == []
+    assert len(moves) == 3
+    assert len(parts.call_args_list) == 3
+    assert _keys(project) == ["new/sample.bam", "new/sample.bam.md5", "new/sub/sample.vcf", "older/keep.vcf"]
+    assert _read(project, "new/sample.bam") == BIG
+    assert _read(project, "new/sub/sample.vcf") == b"spam"
+    assert client.head_object(Bucket="sausage", Key="new/sample.bam")["Metadata"] == {"run": "42"}
+
+
+def test_failed_copy_deletes_nothing(project):
+    with patch.object(project.client, "upload_part_copy", side_effect=IOError("connection reset")):
+        with raises(IOError):
+            project.rename_prefix("old/", "new/")
+
+    assert "old/sample.bam" in _keys(project)
+    assert "old/sub/sample.vcf" in _keys(project)
+    assert project.client.list_multipart_uploads(Bucket="sausage").get("Uploads", []) == []
+
+
+def test_rename_prefix_dry_run(project):
+    moves, _ = project.rename_prefix("old/", "new/", dry_run=True)
+
+    assert [move[1] for move in moves] == ["new/sample.bam", "new/sample.bam.md5", "new/sub/sample.vcf"]
+    assert not any(key.startswith("new/") for key in _keys(project))
+
+
+def test_copy_keeps_the_customer_key(project):
+    project._encrypt = True
+    extra_args, source_args = project._copy_args()
+
+    assert sorted(extra_args) == ["SSECustomerAlgorithm", "SSECustomerKey"]
+    assert sorted(source_args) == ["CopySourceSSECustomerAlgorithm", "CopySourceSSECustomerKey"]
+
+
+def test_rename_object(project):
+    project.rename_object("old/sub/sample.vcf", "new.vcf")
+
+    assert "old/sub/sample.vcf" not in _keys(project)
+    assert _read(project, "new.vcf") == b"spam"
+
+
+def test_rename_fails_when_the_original_is_not_deleted(project):
+    denied = {"Errors": [{"Key": "old/sub/sample.vcf", "Code": "AccessDenied", "Message": "Access Denied"}]}
+
+    with patch.object(project.client, "delete_objects", return_value=denied):
+        with raises(ClientError) as error:
+            project.rename_object("old/sub/sample.vcf", "new/sample.vcf")
+
+    assert error.value.response["Error"]["Code"] == "AccessDenied"
+    assert "old/sub/sample.vcf" in _keys(project)
@@ -0,0 +1,172 @@
+import io
+import time
+import hashlib
+
+from pytest import fixture, raises
+
+from wanna.hashing import Checksum
+from wanna.utils import IntegrityError
+
+from tests.test_config import config_file
+from tests.test_wanna import vendor
+
+MB = 1024 ** 2
+
+
+@fixture
+def stream_vendor(vendor):
+    vendor.transfer_settings.override(multipart_chunksize="5MB", stream_buffer_size="10MB")
+    return vendor
+
+
+def chunks(count, size=MB):
+    for i in range(count):
+        yield bytes(bytearray([i % 256])) * size
+
+
+def test_open_writes_parts_while_streaming(stream_vendor):
+    sent = []
+    upload_part = stream_vendor.client.upload_part
+
+    def record(**kwargs):
+        sent.append(kwargs["PartNumber"])
+        return upload_part(**kwargs)
+
+    stream_vendor.client.upload_part = record
+    try:
+        with stream_vendor.open("run1/stream.bin", "wb") as out:
+            for chunk in chunks(16):
+                out.write(chunk)
+            # 10MB in flight: the third part waited for an upload of the first ones
+            assert sent
+    finally:
+        del stream_vendor.client.upload_part
+
+    body = stream_vendor.client.get_object(Bucket="sausage", Key="run1/stream.bin")["Body"].read()
+    assert body == b"".join(chunks(16))
+    assert sorted(sent) == [1, 2, 3, 4]
+    assert out.size == 16 * MB
+    assert not list(stream_vendor.list_uploads())
+
+
+def test_open_small_stream_is_a_single_put(stream_vendor):
+    with stream_vendor.open("small.txt", "wb", add_checksum=True) as out:
+        out.write(b"ACGT")
+        out.write(b"ACGT")
+
+    body = stream_vendor.client.get_object(Bucket="sausage", Key="small.txt")["Body"].read()
+    assert body == b"ACGTACGT"
+    assert stream_vendor.get_remote_checksum("small.txt") == hashlib.md5(b"ACGTACGT").hexdigest()
+
+
+def test_upload_stream_checksum(stream_vendor):
+    data = b"".join(chunks(11))
+    size = stream_vendor.upload_stream(io.BytesIO(data), "piped.bin", add_checksum=True)
+
+    assert size == len(data)
+    remote = Checksum.parse(stream_vendor.get_remote_checksum("piped.bin"))
+    assert remote == Checksum.parse(hashlib.md5(data).hexdigest())
+
+
+def test_open_aborts_on_error(stream_vendor):
+    with raises(RuntimeError):
+        with stream_vendor.open("broken.bin", "wb") as out:
+            for chunk in chunks(6):
+                out.write(chunk)
+            raise RuntimeError("producer died")
+
+    assert not list(stream_vendor.list_uploads())
+    assert not list(stream_vendor.list_files())
+
+
+def test_failed_part_stops_the_writer(stream_vendor):
+    def failing(**kwargs):
+        raise IOError("connection reset")
+
+    stream_vendor.client.upload_part = failing
+    try:
+        with raises(IOError):
+            with stream_vendor.open("failed.bin", "wb") as out:
+                for chunk in chunks(30):
+                    out.write(chunk)
+    finally:
+        del stream_vendor.client.upload_part
+
+    assert not list(stream_vendor.list_uploads())
+
+
+def test_open_only_writes(stream_vendor):
+    with raises(ValueError):
+        stream_vendor.open("run1/stream.bin", "ab")
+
+
+@fixture
+def stored(stream_vendor):
+    stream_vendor.transfer_settings.override(multipart_threshold="1MB", multipart_chunksize="1MB")
+    stream_vendor.client.put_object(Bucket="sausage", Key="sample.bam", Body=b"".join(chunks(11)))
+    return stream_vendor
+
+
+def test_download_stream_in_order(stored):
+    get_object = stored.client.get_object
+    requests = []
+
+    def slow_second_range(**kwargs):
+        requests.append(kwargs)
+        if kwargs.get("Range", "").startswith("bytes={}-".format(MB)):
+            # the later ranges are back first and wait in the buffer
+            time.sleep(0.2)
+        return get_object(**kwargs)
+
+    stored.client.get_object = slow_second_range
+    try:
+        output = io.BytesIO()
+        size = stored.download_stream("sample.bam", output)
+    finally:
+        del stored.client.get_object
+
+    assert size == 11 * MB
+    assert output.getvalue() == b"".join(chunks(11))
+    assert len(requests) == 11
+    assert all(request.get("IfMatch") for request in requests[1:])
+
+
+def test_download_stream_decrypts_every_range(stored):
+    get_object = stored.client.get_object
+    requests = []
+
+    def record(**kwargs):
+        requests.append(dict(kwargs))
+        kwargs.pop("SSECustomerKey")
+        kwargs.pop("SSECustomerAlgorithm")
+        return get_object(**kwargs)
+
+    stored._encrypt = True
+    stored.client.get_object = record
+    try:
+        stored.download_stream("sample.bam", io.BytesIO())
+    finally:
+        del stored.client.get_object
+        stored._encrypt = False
+
+    assert all(request["SSECustomerAlgorithm"] == "AES256" for request in requests)
+
+
+def test_download_stream_verified(stored):
+    output = io.BytesIO()
+    checksum = hashlib.md5(b"".join(chunks(11))).hexdigest()
+    stored.download_stream("sample.bam", output, checksum=checksum)
+    assert len(output.getvalue()) == 11 * MB
+
+    with raises(IntegrityError):
+        stored.download_stream("sample.bam", io.BytesIO(), checksum=hashlib.md5(b"spam").hexdigest())
+
+
+def test_download_stream_small_and_missing(stored):
+    stored.client.put_object(Bucket="sausage", Key="small.vcf", Body=b"ACGT")
+    output = io.BytesIO()
+    assert stored.download_stream("small.vcf", output) == 4
+    assert output.getvalue() == b"ACGT"
+
+    with raises(KeyError):
+        stored.download_stream("missing.vcf", io.BytesIO())
@@ -0,0 +1,95 @@
+import os
+import time
+
+from pytest import raises
+
+from tests.test_config import config_file
+from tests.test_wanna import vendor
+
+
+def _make_tree(root):
+    root.join("a.txt").write("alpha")
+    root.mkdir("sub").join("b.txt").write("bravo")
+
+
+def _keys(vendor):
+    return sorted(el["name"] for el in vendor.list_files())
+
+
+def test_sync_upload(vendor, tmpdir):
+    local = tmpdir.mkdir("local")
+    _make_tree(local)
+
+    actions = vendor.sync(str(local), "run")
+
+    assert actions == [("upload", "a.txt"), ("upload", "sub/b.txt")]
+    assert _keys(vendor) == ["run/a.txt", "run/sub/b.txt"]
+
+
+def test_sync_skips_unchanged(vendor, tmpdir):
+    local = tmpdir.mkdir("local")
+    _make_tree(local)
+    vendor.sync(str(local), "run", add_checksum=True)
+
+    assert vendor.sync(str(local), "run") == []
+    # same size, newer and different content
+    future = time.time() + 60
+    local.join("a.txt").write("ALPHA")
+    os.utime(str(local.join("a.txt")), (future, future))
+    assert vendor.sync(str(local), "run", add_checksum=True) == [("upload", "a.txt")]
+    # touched but identical, the sidecar says so
+    os.utime(str(local.join("sub", "b.txt")), (future, future))
+    assert vendor.sync(str(local), "run") == []
+
+
+def test_sync_download(vendor, tmpdir):
+    source = tmpdir.mkdir("source")
+    _make_tree(source)
+    vendor.sync(str(source), "run")
+    target = tmpdir.join("target")
+
+    actions = vendor.sync(str(target), "run", download=True)
+
+    assert actions == [("download", "a.txt"), ("download", "sub/b.txt")]
+    assert target.join("sub", "b.txt").read() == "bravo"
+    assert vendor.sync(str(target), "run", download=True) == []
+
+
+def test_sync_delete_and_dry_run(vendor, tmpdir):
+    local = tmpdir.mkdir("local")
+    _make_tree(local)
+    vendor.sync(str(local), "run", add_checksum=True)
+    local.join("a.txt").remove()
+
+    planned = vendor.sync(str(local), "run", delete=True, dry_run=True)
+
+    assert planned == [("delete", "a.txt")]
+    assert "run/a.txt" in _keys(vendor)
+    assert vendor.sync(str(local), "run", delete=True) == planned
+    assert _keys(vendor) == ["run/sub/b.txt", "run/sub/b.txt.md5"]
+
+
+def test_sync_refuses_a_missing_or_empty_source(vendor, tmpdir):
+    local = tmpdir.mkdir("local")
+    _make_tree(local)
+    vendor.sync(str(local), "run")
+
+    with raises(ValueError):
+        vendor.sync(str(tmpdir.join("typo")), "run", delete=True)
+    with raises(ValueError):
+        vendor.sync(str(tmpdir.mkdir("empty")), "run", delete=True)
+    with raises(ValueError):
+        vendor.sync(str(local), "elsewhere", download=True, delete=True)
+
+    assert _keys(vendor) == ["run/a.txt", "run/sub/b.txt"]
+    assert local.join("a.txt").check()
+
+
+def test_sync_download_rejects_keys_leaving_the_directory(vendor, tmpdir):
+    vendor.client.put_object(Bucket="sausage", Key="run/../escaped.txt", Body=b"x")
+    target = tmpdir.mkdir("deep").mkdir("target")
+
+    with raises(ValueError):
+        vendor.sync(str(target), "run", download=True)
+
+    assert not tmpdir.join("deep", "escaped.txt").check()
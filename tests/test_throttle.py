@@ -0,0 +1,138 @@
+import datetime
+import threading
+
+from mock import patch
+from pytest import raises
+
+from wanna.throttle import Throttle
+from wanna.throttle import ThrottledBody
+from wanna.throttle import parse_rate
+from wanna.throttle import parse_schedule
+from wanna.throttle import shared_throttle
+
+from tests.test_config import config_file
+from tests.test_wanna import vendor
+
+MB = 1024 ** 2
+
+
+def test_parse_rate():
+    assert parse_rate("200MB/s") == 200 * MB
+    assert parse_rate("1.5 GiB / s") == int(1.5 * 1024 ** 3)
+    assert parse_rate("64kB") == 64 * 1024
+    assert parse_rate("unlimited") is None
+    assert parse_rate(None) is None
+    with raises(ValueError):
+        parse_rate("fast")
+
+
+def test_schedule_wraps_midnight():
+    throttle = Throttle(100 * MB, parse_schedule("08:00-18:00=50MB/s, 22:00-06:00=off"))
+
+    assert throttle.rate_at(datetime.datetime(2020, 1, 1, 9, 30)) == 50 * MB
+    assert throttle.rate_at(datetime.datetime(2020, 1, 1, 23, 0)) is None
+    assert throttle.rate_at(datetime.datetime(2020, 1, 1, 3, 0)) is None
+    assert throttle.rate_at(datetime.datetime(2020, 1, 1, 20, 0)) == 100 * MB
+    with raises(ValueError):
+        parse_schedule("08:00=50MB/s")
+
+
+def test_bytes_are_paid_in_grants():
+    throttle = Throttle(MB, burst=0)
+    with patch("wanna.throttle.time.sleep") as sleep:
+        with patch.object(throttle, "_reserve", wraps=throttle._reserve) as reserve:
+            for _ in range(64):
+                throttle.consume(1024)
+            assert reserve.call_count == 1
+            for _ in range(10 * 64):
+                throttle.consume(1024)
+
+    # 64kB grants at 1MB/s
+    assert reserve.call_count == 11
+    assert 0.6 < max(call[0][0] for call in sleep.call_args_list) <= 11 / 16.0
+
+
+def test_limit_is_shared_by_threads():
+    throttle = Throttle(10 * MB, burst=0)
+    slept = []
+    with patch("wanna.throttle.time.sleep", side_effect=slept.append):
+        threads = [
+            threading.Thread(target=lambda: [throttle.consume(128 * 1024) for _ in range(10)])
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # 5MB at 10MB/s, the last thread to pay waits for everybody else
+    assert 0.4 < max(slept) <= 0.5
+
+
+def test_limit_is_shared_through_a_file(tmpdir):
+    path = str(tmpdir.join("bandwidth"))
+    first, second = Throttle(MB, path=path, burst=0), Throttle(MB, path=path, burst=0)
+    with patch("wanna.throttle.time.sleep") as sleep:
+        first.consume(MB)
+        second.consume(MB)
+
+    first_delay, second_delay = [call[0][0] for call in sleep.call_args_list]
+    assert 0.9 < first_delay <= 1
+    assert 1.9 < second_delay <= 2
+
+
+def test_unlimited_transfers_are_not_throttled():
+    assert shared_throttle(None, parse_schedule("22:00-06:00=off")) is None
+    assert shared_throttle(MB) is shared_throttle(MB)
+
+
+def test_upload_and_download_are_throttled(vendor, tmpdir):
+    sample = tmpdir.join("sample.bam")
+    sample.write_binary(b"x" * 11 * MB)
+    vendor.transfer_settings.override(multipart_threshold="5MB", multipart_chunksize="5MB")
+    vendor.throttle = Throttle(22 * MB, burst=0)
+
+    with patch("wanna.throttle.time.sleep") as sleep:
+        with patch.object(vendor.throttle, "_reserve", wraps=vendor.throttle._reserve) as reserve:
+            vendor.upload_files(str(sample))
+            vendor.download_file("sample.bam", str(tmpdir.join("copy.bam")))
+
+    assert tmpdir.join("copy.bam").read_binary() == sample.read_binary()
+    assert sleep.called
+    # both ways, short of the bytes still pending in the threads
+    assert 21 * MB < sum(call[0][0] for call in reserve.call_args_list) <= 22 * MB
+
+
+def test_body_is_paid_as_it_is_read():
+    throttle = Throttle(MB)
+    body = ThrottledBody(b"x" * MB, throttle)
+    with patch.object(throttle, "consume") as consume:
+        assert body.read(300 * 1024) == b"x" * 300 * 1024
+        assert [call[0][0] for call in consume.call_args_list] == [256 * 1024, 44 * 1024]
+        body.seek(0)
+        assert len(body.read()) == MB
+
+    # the rewound bytes are not paid twice
+    assert sum(call[0][0] for call in consume.call_args_list) == MB
+    assert len(body) == MB
+
+
+def test_parts_are_paid_while_they_are_sent(vendor, tmpdir):
+    sample = tmpdir.join("sample.bam")
+    sample.write_binary(b"x" * 11 * MB)
+    vendor.transfer_settings.override(multipart_threshold="5MB", multipart_chunksize="5MB")
+    vendor.throttle = Throttle(22 * MB)
+    upload_part = vendor.client.upload_part
+    paid = []
+
+    def record(**kwargs):
+        # nothing is paid for a part before botocore reads its body
+        paid.append(kwargs["Body"]._paid)
+        return upload_part(**kwargs)
+
+    with patch("wanna.throttle.time.sleep"):
+        with patch.object(vendor.client, "upload_part", side_effect=record):
+            vendor.upload_files(str(sample))
+
+    assert paid == [0, 0, 0]
+    assert vendor.client.get_object(Bucket="sausage", Key="sample.bam")["Body"].read() == sample.read_binary()
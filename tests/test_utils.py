@@ -0,0 +1,50 @@
+import os
+
+from pytest import raises
+
+from wanna.utils import parse_size
+from wanna.utils import finder
+from wanna.utils import local_path
+
+
+def test_parse_size():
+    assert parse_size("8MB") == 8 * 1024 ** 2
+    assert parse_size("1.5 GiB") == 1536 * 1024 ** 2
+    assert parse_size("512") == 512
+    with raises(ValueError):
+        parse_size("lots")
+
+
+KEYS = ["run1/Sample.bam", "run2/sample.vcf", "other/samp.txt", "xsample", "s-a-m-p-l-e"]
+
+
+def test_finder_ranks_matches():
+    assert list(finder("sample", KEYS)) == ["xsample", "run1/Sample.bam", "run2/sample.vcf"]
+    assert list(finder("s.mple$", KEYS)) == ["xsample"]
+    assert list(finder("spl", KEYS, fuzzy=True)) == [
+        "xsample",
+        "run1/Sample.bam",
+        "run2/sample.vcf",
+        "s-a-m-p-l-e",
+    ]
+
+
+def test_finder_limit_keeps_the_best():
+    assert list(finder("sample", KEYS, limit=2)) == ["xsample", "run1/Sample.bam"]
+    assert list(finder("spl", KEYS, fuzzy=True, limit=1)) == ["xsample"]
+
+
+def test_finder_streams_unordered():
+    def keys():
+        yield "run1/sample.bam"
+        raise AssertionError("scanned past the limit")
+
+    assert list(finder("sample", keys(), ordered=False, limit=1)) == ["run1/sample.bam"]
+
+
+def test_local_path_stays_below_the_root():
+    assert local_path("dst", "run1/a.bam") == os.path.join("dst", "run1", "a.bam")
+    assert local_path("dst", "run1/./sub/../a.bam") == os.path.join("dst", "run1", "a.bam")
+    for name in ("../a.bam", "run1/../../a.bam", "", "run1/.."):
+        with raises(ValueError):
+            local_path("dst", name)
@@ -1,9 +1,31 @@
 from wanna import Transfer
 from pytest import fixture
+from moto import mock_aws
 from wanna.vendors.aws import _AWS
 
 from tests.test_config import config_file
 
+AWS_CONFIG = """
+[aws]
+aws_access_key_id = foo
+aws_secret_access_key = bar
+bucket = sausage
+"""
+
+
+@fixture
+def vendor(config_file, tmpdir, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmpdir.join("home")))
+    config = config_file(AWS_CONFIG)
+    with mock_aws():
+        vendor = _AWS(config=config, use_encryption=False, ignore_prefix=True)
+        vendor.client.create_bucket(
+            Bucket="sausage",
+            CreateBucketConfiguration={"LocationConstraint": vendor.region_name},
+        )
+        yield vendor
+
+
 def test_aws(config_file):
     config = config_file("""
     [aws]
@@ -23,3 +45,99 @@ def test_transfer(config_file):
     trf = Transfer(config=config)
     assert hasattr(trf, "download_file")
 
+
+def test_upload_directory_in_parallel(vendor, tmpdir):
+    run = tmpdir.mkdir("run")
+    for i in range(6):
+        run.join("sample{}.fastq".format(i)).write("ACGT" * (i + 1))
+
+    vendor.upload_files(str(run), add_checksum=True, jobs=3)
+
+    keys = sorted(el["name"] for el in vendor.list_files())
+    assert len(keys) == 12
+    assert "sample5.fastq" in keys
+    assert "sample5.fastq.md5" in keys
+
+
+def test_list_files_follows_pages(vendor):
+    vendor.list_page_size = 2
+    for name in ("run1/a", "run1/b", "run1/sub/c", "run2/d", "top"):
+        vendor.client.put_object(Bucket="sausage", Key=name, Body=b"x")
+
+    names = [el["name"] for el in vendor.list_files()]
+    assert names == ["run1/a", "run1/b", "run1/sub/c", "run2/d", "top"]
+
+    names = [el["name"] for el in vendor.list_files(max_keys=3, start_after="run1/a")]
+    assert names == ["run1/b", "run1/sub/c", "run2/d"]
+
+    listing = list(vendor.list_files(dirs=True))
+    assert [el["name"] for el in listing] == ["run1/", "run2/", "top"]
+    assert [el.get("dir", False) for el in listing] == [True, True, False]
+    assert [el["name"] for el in vendor.list_files(prefix="run1/", dirs=True)] == [
+        "run1/a",
+        "run1/b",
+        "run1/sub/",
+    ]
+
+
+def test_vendors_and_clients_are_shared(tmpdir, monkeypatch):
+    from wanna import setup_vendor
+
+    monkeypatch.setenv("HOME", str(tmpdir))
+    tmpdir.mkdir(".wanna").join("credentials").write(AWS_CONFIG)
+
+    first = setup_vendor("aws", use_encryption=False)
+    assert setup_vendor("s3", use_encryption=False) is not first
+    assert setup_vendor("aws", use_encryption=False) is first
+    assert first._resource is None
+
+    other = _AWS(config=first.config, use_encryption=True)
+    assert other.client is first.client
+    assert _AWS(config=first.config, bucket="bacon").client is not first.client
+
+
+def test_cli_starts_without_boto3():
+    import os
+    import sys
+    import wanna
+    import subprocess
+
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            "-c",
+            "import sys; from wanna.entry_points import wannacli; print('boto3' in sys.modules)",
+        ],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(wanna.__file__))),
+    )
+    assert output.strip() == b"False"
+
+
+def test_cli_jobs_default():
+    from docopt import docopt
+    from wanna.entry_points import wannacli
+
+    def jobs(argv):
+        return wannacli._handle(docopt(wannacli.__doc__, argv=argv))["jobs"]
+
+    assert jobs(["upload", "sample.bam"]) == 1
+    assert jobs(["sync", "runs"]) == 1
+    # a download of many files takes all of max_concurrency unless told otherwise
+    assert jobs(["download", "run1/", "--prefix"]) is None
+    assert jobs(["download", "run1/", "--prefix", "--jobs=4"]) == 4
+
+
+def test_cli_download_fails_when_nothing_matches(capsys):
+    from mock import patch
+    from pytest import raises
+    from docopt import docopt
+    from wanna.entry_points import wannacli
+
+    args = docopt(wannacli.__doc__, argv=["download", "run/sample[1].bam", "--glob"])
+    with patch.object(wannacli, "download_files", return_value=([], [], [])) as download_files:
+        with raises(SystemExit) as exited:
+            wannacli.handle_download(args)
+
+    assert exited.value.code == 1
+    assert download_files.call_args[1]["pattern"] is True
+    assert "Nothing matches run/sample[1].bam" in capsys.readouterr().out
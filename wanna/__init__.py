@@ -1,16 +1,22 @@
-from wanna.vendors.aws import _AWS
+import importlib
+import threading
 
 __version__ = '0.2.2'
 
+# vendors are imported on first use, boto3 alone takes hundreds of ms
 ALIASES = {
-    "s3": _AWS,
-    "aws": _AWS,
+    "s3": "wanna.vendors.aws:_AWS",
+    "aws": "wanna.vendors.aws:_AWS",
     "softlayer": NotImplementedError,
     "azure": NotImplementedError,
     "googlecloud": NotImplementedError,
 }
 
 
+_VENDORS = {}
+_VENDORS_LOCK = threading.Lock()
+
+
 def setup_vendor(
     vendor_str,
     bucket=None,
@@ -19,19 +25,35 @@ def setup_vendor(
     profile=None,
     **other
 ):
-    """Setup vendor from the given string and params"""
-    vendor = vendor_str.lower()
+    """Setup vendor from the given string and params
+
+    Vendors are cached for the process, the same vendor, profile, bucket
+    and options give the same instance (and its connections) until the
+    configuration file changes.
+    """
+    name = vendor_str.lower()
     try:
-        vendor = ALIASES[vendor]
+        vendor = ALIASES[name]
     except KeyError:
-        raise ValueError("datacenter: {}, is not supported".format(vendor))
-    return vendor(
-        bucket=bucket,
-        use_encryption=use_encryption,
-        ignore_prefix=ignore_prefix,
-        profile=profile,
-        **other
-    )
+        raise ValueError("datacenter: {}, is not supported".format(name))
+    if isinstance(vendor, str):
+        module, _, attr = vendor.partition(":")
+        vendor = getattr(importlib.import_module(module), attr)
+    from wanna.settings import Config
+
+    other["config"] = other.get("config") or Config.load(profile=profile)
+    key = (name, profile, bucket, use_encryption, ignore_prefix, tuple(sorted(other.items())))
+    with _VENDORS_LOCK:
+        instance = _VENDORS.get(key)
+        if instance is None:
+            instance = _VENDORS[key] = vendor(
+                bucket=bucket,
+                use_encryption=use_encryption,
+                ignore_prefix=ignore_prefix,
+                profile=profile,
+                **other
+            )
+    return instance
 
 
 def Transfer(
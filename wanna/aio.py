@@ -0,0 +1,200 @@
+"""Asyncio interface
+
+`AsyncTransfer` runs the transfers of a vendor in one bounded thread pool
+shared by every coroutine, so the event loop never blocks and thousands
+of concurrent operations queue for the same workers and connections.
+Nothing is printed: progress and completion are delivered as events.
+
+    async with AsyncTransfer(setup_vendor("aws")) as transfer:
+        await transfer.upload("sample.bam", "run1/sample.bam")
+        async for el in transfer.list("run1/"):
+            print(el["name"])
+
+Cancelling the task of an upload aborts its multipart upload; a cancelled
+download keeps its partial file to be resumed.
+"""
+from wanna.utils import TransferCancelled
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+from functools import partial
+
+import os
+import asyncio
+import logging
+import itertools
+import threading
+
+LOG = logging.getLogger("wanna:aio")
+
+#: kind is progress (value: bytes), done (value: the result), failed (value: the error) or cancelled
+TransferEvent = namedtuple("TransferEvent", "kind key value")
+
+
+class AsyncTransfer(object):
+    """Coroutines over a vendor
+
+    Args:
+        vendor: vendor instance, eg. from `wanna.setup_vendor`
+        max_workers (int): transfers running at the same time (default max_concurrency)
+        page_size (int): listed entries handed to the event loop at a time
+    """
+
+    def __init__(self, vendor, max_workers=None, page_size=1000):
+        self.vendor = vendor
+        concurrency = vendor.transfer_settings.MAX_CONCURRENCY
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or concurrency)
+        # parts and ranges of every transfer, kept apart so a transfer never waits for its own slot
+        self._parts = ThreadPoolExecutor(max_workers=concurrency)
+        self._transfer = vendor._transfer(vendor.client, config=vendor._get_transfer_config())
+        self._page_size = page_size
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Wait for the running transfers and release the pools"""
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._shutdown)
+
+    def _shutdown(self):
+        self._executor.shutdown(wait=True)
+        self._parts.shutdown(wait=True)
+        self._transfer.__exit__(None, None, None)
+
+    def events(self):
+        """Async iterator over the events of every transfer started afterwards"""
+        queue = asyncio.Queue()
+        subscriber = (asyncio.get_event_loop(), queue)
+        with self._lock:
+            self._subscribers.append(subscriber)
+
+        async def iterate():
+            try:
+                while True:
+                    yield await queue.get()
+            finally:
+                with self._lock:
+                    self._subscribers.remove(subscriber)
+
+        return iterate()
+
+    def _emit(self, kind, key, value=None):
+        """Deliver an event from any thread"""
+        event = TransferEvent(kind, key, value)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    async def _run(self, key, func, *args, **kwargs):
+        """Run a blocking transfer in the pool, cancelled through a threading.Event"""
+        cancel = threading.Event()
+        loop = asyncio.get_event_loop()
+        future = loop.run_in_executor(self._executor, partial(func, *args, cancel=cancel, **kwargs))
+        try:
+            result = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancel.set()
+            try:
+                # let the transfer clean up, eg. abort its multipart upload
+                await future
+            except (TransferCancelled, Exception) as error:
+                LOG.debug("%s stopped: %s", key, error)
+            self._emit("cancelled", key)
+            raise
+        except Exception as error:
+            self._emit("failed", key, error)
+            raise
+        self._emit("done", key, result)
+        return result
+
+    async def upload(self, path, key=None, add_checksum=False, encryption_key=None):
+        """Upload a file, by default named after it (with the upload prefix)
+
+        Returns:
+            str - key of the object
+        """
+        vendor = self.vendor
+        key = key or vendor.get_obj_key(os.path.basename(path))
+
+        def upload(cancel):
+            vendor._upload_file(
+                self._transfer,
+                self._parts,
+                path,
+                key=key,
+                add_checksum=add_checksum,
+                encryption_key=encryption_key,
+                callback=partial(self._emit, "progress", key),
+                cancel=cancel,
+            )
+            return key
+
+        return await self._run(key, upload)
+
+    async def download(self, key, dst=".", checksum=None, use_encryption=None, encryption_key=None):
+        """Download an object, `dst` is a file or a directory
+
+        Args:
+            checksum (str): expected checksum sidecar, IntegrityError is raised on a mismatch
+
+        Returns:
+            str - the local file
+        """
+        vendor = self.vendor
+        local = os.path.join(dst, os.path.basename(key)) if os.path.isdir(dst) else dst
+        extra_args = {} if use_encryption is False else vendor._get_extra_args(encryption_key=encryption_key)
+
+        def download(cancel):
+            return vendor._download_object(
+                self._parts,
+                key,
+                local,
+                extra_args,
+                progress=lambda size: partial(self._emit, "progress", key),
+                checksum=checksum,
+                cancel=cancel,
+            )
+
+        return await self._run(key, download)
+
+    async def delete(self, *keys):
+        """Delete objects in DeleteObjects batches
+
+        Returns:
+            tuple - number of deleted keys and the per-key errors
+        """
+        return await self._run(", ".join(keys), lambda cancel: self.vendor.delete_files(keys))
+
+    async def delete_prefix(self, prefix):
+        """Delete every object under the prefix, see `delete`"""
+        return await self._run(prefix, lambda cancel: self.vendor.delete_prefix(prefix))
+
+    async def _iterate(self, iterable):
+        """Pull a blocking iterator in the pool, a page at a time"""
+        loop = asyncio.get_event_loop()
+        iterator = iter(iterable)
+        while True:
+            page = await loop.run_in_executor(
+                self._executor, lambda: list(itertools.islice(iterator, self._page_size))
+            )
+            for item in page:
+                yield item
+            if len(page) < self._page_size:
+                return
+
+    def list(self, prefix=None, max_keys=None, start_after=None, dirs=False):
+        """Async iterator over the listing, see `list_files` of the vendor"""
+        return self._iterate(
+            self.vendor.list_files(prefix=prefix, max_keys=max_keys, start_after=start_after, dirs=dirs)
+        )
+
+    def search(self, term, fuzzy=False, limit=None):
+        """Async iterator over the keys matching the term"""
+        return self._iterate(self.vendor.search(term, fuzzy=fuzzy, limit=limit))
@@ -0,0 +1,105 @@
+"""Checksum cache
+
+Remembers the checksums of local files, so unchanged multi-GB files are
+not hashed again. Entries are keyed by the identity of the file (device,
+inode, size and modification time) and the algorithm, the least recently
+used ones are evicted once the cache holds `max_entries`.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+LOG = logging.getLogger("wanna:cache")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checksums (
+    device INTEGER,
+    inode INTEGER,
+    size INTEGER,
+    mtime_ns INTEGER,
+    algorithm TEXT,
+    part_size INTEGER,
+    checksum TEXT,
+    used REAL,
+    PRIMARY KEY (device, inode, size, mtime_ns, algorithm, part_size)
+)
+"""
+
+
+def file_identity(path):
+    """Device, inode, size and modification time of the file"""
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class ChecksumCache(object):
+    """Checksums of local files stored in sqlite
+
+    Args:
+        path (str): database file, an empty path disables the cache
+        max_entries (int): number of checksums kept
+    """
+
+    def __init__(self, path="~/.wanna/checksums.db", max_entries=100000):
+        self.path = os.path.expanduser(path) if path else None
+        self.max_entries = max_entries
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(SCHEMA)
+        return self._connection
+
+    def get(self, path, algorithm, part_size=None, identity=None):
+        """Cached checksum of the file or None"""
+        if not self.path:
+            return None
+        key = (identity or file_identity(path)) + (algorithm, part_size or 0)
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT checksum FROM checksums WHERE device = ? AND inode = ? AND size = ?"
+                " AND mtime_ns = ? AND algorithm = ? AND part_size = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE checksums SET used = ? WHERE device = ? AND inode = ? AND size = ?"
+                " AND mtime_ns = ? AND algorithm = ? AND part_size = ?",
+                (time.time(),) + key,
+            )
+            connection.commit()
+        LOG.debug("cached checksum of %s", path)
+        return row[0]
+
+    def put(self, path, algorithm, part_size, checksum, identity=None):
+        """Remember the checksum of the file
+
+        Args:
+            identity (tuple): file identity taken before the file was hashed
+        """
+        if not self.path:
+            return
+        key = (identity or file_identity(path)) + (algorithm, part_size or 0)
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (checksum, time.time()),
+            )
+            count, = connection.execute("SELECT COUNT(*) FROM checksums").fetchone()
+            if count > self.max_entries:
+                connection.execute(
+                    "DELETE FROM checksums WHERE rowid IN"
+                    " (SELECT rowid FROM checksums ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            connection.commit()
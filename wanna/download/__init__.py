@@ -6,19 +6,18 @@ download from the cloud. It handles several things for the user:
 * Uploading a file in parallel
 * Progress callbacks to monitor transfers
 * Retries. When possible.
+* Streaming to a pipe, eg. stdout, in order and without temporary files
 """
 from wanna import setup_vendor
+from wanna.utils import IntegrityError
+from wanna.metrics import report
 
-import difflib
+import sys
 import logging
 
 LOG = logging.getLogger(__name__)
 
 
-class IntegrityError(Exception):
-    pass
-
-
 def download_file(
     path,
     vendor,
@@ -30,6 +29,8 @@ def download_file(
     ignore_prefix=False,
     encryption_key=None,
     humanized=False,
+    stats_json=None,
+    stats_textfile=None,
     **kwargs
 ):
 
@@ -38,11 +39,14 @@ def download_file(
     Args:
         path (str): path to the file
         vendor (str): datacenter name: 'aws|softlayer|azure|googlecloud'
-        dst (str): destination default .
+        dst (str): destination default ., - to write the object to stdout
         use_encryption (bool): should the file be decrypted
-        add_checksum (bool): should the control sum be checked
-        progress (bool): should the transfer be monitored
+        add_checksum (bool): should the control sum be checked while downloading,
+            raises IntegrityError on a mismatch
+        progress (bool|str): should the transfer be monitored, "log" for periodic lines
         ignore_prefix (bool): ignore all prefixes
+        stats_json (str): write the metrics of the run to this json file
+        stats_textfile (str): write the metrics of the run to this node_exporter textfile
 
     Returns:
         obj - confirmation(s) from the vendor
@@ -57,22 +61,68 @@ def download_file(
         **kwargs
     )
 
-    if add_checksum:
-        chck_path = path + vendor.hash_checksum
-        vendor.download_file(chck_path, use_encryption=False)
-
-    resp = vendor.download_file(path, dst=dst, progress=progress)
-
-    if add_checksum:
-        with open(chck_path, "rb") as chck_file:
-            control1 = chck_file.read().strip()
-        control2 = vendor.get_checksum(path)
+    with report(vendor, "download", stats_json, stats_textfile) as metrics:
+        checksum = vendor.get_remote_checksum(path) if add_checksum else None
+        if dst == "-":
+            return vendor.download_stream(
+                path,
+                sys.stdout.buffer,
+                progress=progress,
+                encryption_key=encryption_key,
+                checksum=checksum,
+                metrics=metrics,
+            )
+        return vendor.download_file(path, dst=dst, progress=progress, checksum=checksum, metrics=metrics)
+
+
+def download_files(
+    path,
+    vendor,
+    dst=".",
+    bucket=None,
+    use_encryption=True,
+    add_checksum=False,
+    progress=False,
+    ignore_prefix=False,
+    encryption_key=None,
+    humanized=False,
+    jobs=None,
+    stats_json=None,
+    stats_textfile=None,
+    pattern=False,
+    **kwargs
+):
+    """Download every file under a prefix, or matching a pattern, from the cloud.
 
-        if control1 != control2:
-            error = "File corrupted!\n"
-            error += "".join(difflib.unified_diff(control2, control1))
-            raise IntegrityError(error)
-        else:
-            LOG.info("\nIntegrity check: OK")
+    Args:
+        path (str): prefix or pattern, eg. run1/ or run1/*.bam
+        vendor (str): datacenter name: 'aws|softlayer|azure|googlecloud'
+        dst (str): directory the key hierarchy is mirrored in, default .
+        add_checksum (bool): verify the files against their checksum sidecars
+        jobs (int): number of files downloaded in parallel
+        stats_json (str): write the metrics of the run to this json file
+        stats_textfile (str): write the metrics of the run to this node_exporter textfile
+        pattern (bool): `path` is a glob pattern, otherwise a literal prefix
 
-    return resp
+    Returns:
+        tuple - downloaded keys, skipped keys and (key, error) failures
+    """
+    vendor = setup_vendor(
+        vendor,
+        bucket=bucket,
+        use_encryption=use_encryption,
+        ignore_prefix=ignore_prefix,
+        humanized=humanized,
+        **kwargs
+    )
+    with report(vendor, "download", stats_json, stats_textfile) as metrics:
+        return vendor.download_prefix(
+            vendor.get_prefix_key(path),
+            dst=dst or ".",
+            progress=progress,
+            add_checksum=add_checksum,
+            jobs=jobs,
+            encryption_key=encryption_key,
+            metrics=metrics,
+            pattern=pattern,
+        )
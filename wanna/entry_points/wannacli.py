@@ -2,21 +2,32 @@
 """Wanna transfer.
 
 Usage:
-  wanna upload PATH [--no-encrypt] [--no-progress] [--ignore-prefix]
+  wanna upload PATH [KEY] [--no-encrypt] [--no-progress] [--log-progress] [--ignore-prefix]
                     [--checksum] [--datacenter=<aws>] [--bucket=<credentials>] [-v | -vv] [-H | --human]
-                    [--profile=<name>]
-  wanna download PATH [DST] [--no-decrypt] [--no-progress] [--checksum]
+                    [--profile=<name>] [--jobs=<n>] [--part-size=<size>] [--concurrency=<n>]
+                    [--multipart-threshold=<size>] [--checksum-algorithm=<name>] [--max-bandwidth=<rate>]
+                    [--stats-json=<file>] [--stats-textfile=<file>] [--buffer-size=<size>]
+  wanna download PATH [DST] [--no-decrypt] [--no-progress] [--log-progress] [--checksum]
                             [--datacenter=<aws>]  [--bucket=<credentials>] [--ignore-prefix] [-v | -vv] [-H | --human]
-                            [--profile=<name>]
-  wanna delete PATH [--ignore-prefix] [--datacenter=<aws>]  [--bucket=<credentials>] [-v | -vv]
-                    [--profile=<name>]
+                            [--profile=<name>] [--part-size=<size>] [--concurrency=<n>]
+                            [--multipart-threshold=<size>] [--prefix] [--glob] [--jobs=<n>] [--max-bandwidth=<rate>]
+                            [--stats-json=<file>] [--stats-textfile=<file>] [--buffer-size=<size>]
+  wanna delete PATH [PATHS...] [--prefix] [--dry-run] [--ignore-prefix] [--datacenter=<aws>]
+                    [--bucket=<credentials>] [-v | -vv] [--profile=<name>]
   wanna search TERM [--ignore-prefix] [--datacenter=<aws>]  [--bucket=<credentials>] [-v | -vv]
-                    [--profile=<name>] [--fuzzy]
+                    [--profile=<name>] [--fuzzy] [--refresh] [--limit=<n>] [--unordered]
   wanna rename OLD NEW [--ignore-prefix] [--datacenter=<aws>] [--no-encrypt]  [--bucket=<credentials>] [-v | -vv]
-                       [--profile=<name>]
+                       [--profile=<name>] [--prefix] [--dry-run]
   wanna status PATH [--ignore-prefix] [--datacenter=<aws>]  [--bucket=<credentials>] [-v | -vv] [--profile=<name>]
+  wanna uploads [--abort-stale] [--older-than=<hours>] [--ignore-prefix] [--datacenter=<aws>]
+                [--bucket=<credentials>] [-v | -vv] [--profile=<name>]
+  wanna sync LOCAL_DIR [REMOTE_PREFIX] [--download] [--delete] [--dry-run] [--checksum] [--jobs=<n>]
+                       [--no-encrypt] [--no-progress] [--log-progress] [--ignore-prefix] [--datacenter=<aws>]
+                       [--bucket=<credentials>] [-v | -vv] [-H | --human] [--profile=<name>]
+                       [--max-bandwidth=<rate>]
   wanna generate_secret [-v | -vv]
   wanna ls [--ignore-prefix] [--datacenter=<aws>]  [--bucket=<credentials>] [-v | -vv] [-H | --human] [--profile=<name>]
+           [--max-keys=<n>] [--start-after=<key>] [--dirs] [--json] [--refresh]
   wanna (-h | --help)
   wanna --version
 
@@ -25,28 +36,59 @@ Options:
   -v --verbose   Show more text.
   --version      Show version and exit.
   --no-progress  Do not show progress bar.
+  --log-progress  Print a progress line every 10 seconds instead of the progress bars.
   --no-encrypt   Do not encrypt at rest.
   --no-decrypt   Do not decrypt in transit.
   --ignore-prefix  Ignore all prefixes
   --profile=<name>  Use a named profile
   --datacenter=<name>  Cloud provider [default: aws]
   --bucket=<name>  Bucket name [default: credentials]
+  --jobs=<n>     Number of files transferred in parallel (default 1, max_concurrency for a download of many files)
+  --part-size=<size>  Part size, eg. 64MB or auto (default from the profile)
+  --concurrency=<n>  Parallel requests per run (default from the profile)
+  --multipart-threshold=<size>  Split files from this size on (default from the profile)
+  --checksum-algorithm=<name>  md5, md5-etag, sha256, crc32c, xxh3 or blake3 (default from the profile)
+  --max-bandwidth=<rate>  Limit all transfers together, eg. 200MB/s (default from the profile)
+  --buffer-size=<size>  Memory of the parts of a stream from stdin or to stdout in flight, eg. 256MB
+                        (default from the profile)
+  --stats-json=<file>  Write the metrics of the run as json
+  --stats-textfile=<file>  Write the metrics of the run for the node_exporter textfile collector
+  --abort-stale  Abort multipart uploads older than --older-than
+  --older-than=<hours>  Age of a stale multipart upload [default: 24]
+  --download     Sync from the bucket to the local directory
+  --delete       Delete files missing on the other side
+  --dry-run      Only show what would be done
+  --max-keys=<n>  List at most n keys
+  --start-after=<key>  List the keys after this one
+  --dirs         Group the keys by '/'
+  --json         One json object per line
+  --refresh      Rebuild the local key index from a full listing
+  --limit=<n>    Show only the n best matches
+  --unordered    Show the matches as they are found instead of the best first, with --limit the first n
+  --prefix       Download, delete or rename every object under the given prefixes
+  --glob         Download every object matching PATH as a pattern, eg. 'run1/*.bam'
 """
 from docopt import docopt
 
 from wanna.upload import upload_files
 from wanna.download import download_file
-from wanna.misc import delete_file
+from wanna.download import download_files
+from wanna.misc import delete_files
 from wanna.misc import list_files
 from wanna.misc import get_status
 from wanna.misc import rename_file
 from wanna.misc import search_files
+from wanna.misc import list_uploads
+from wanna.misc import abort_stale_uploads
+from wanna.misc import sync_files
 from wanna import __version__ as version
 
 from wanna.utils import humanize
 
+import io
 import os
 import sys
+import json
 import random
 import logging
 import binascii
@@ -60,18 +102,61 @@ def _handle(args):
         if args["upload"] or args["download"]:
             add_checksum = args["--checksum"]
             use_encryption = not (args["--no-encrypt"] or args["--no-decrypt"])
-            progress = not (args["--no-progress"])
+            progress = not args["--no-progress"] and ("log" if args["--log-progress"] else True)
+            part_size = args["--part-size"]
+            concurrency = args["--concurrency"]
+            multipart_threshold = args["--multipart-threshold"]
+            max_bandwidth = args["--max-bandwidth"]
+            stats_json = args["--stats-json"]
+            stats_textfile = args["--stats-textfile"]
+            buffer_size = args["--buffer-size"]
+            if args["upload"]:
+                jobs = int(args["--jobs"] or 1)
+                checksum_algorithm = args["--checksum-algorithm"]
+                key = args["KEY"]
             if args["download"]:
                 dst = args["DST"]
+                by_prefix = args["--prefix"]
+                by_pattern = args["--glob"]
+                jobs = int(args["--jobs"]) if args["--jobs"] else None
+    if args["delete"]:
+        paths = [args["PATH"]] + args["PATHS"]
+        by_prefix = args["--prefix"]
+        dry_run = args["--dry-run"]
     if args["rename"]:
         use_encryption = not (args["--no-encrypt"] or args["--no-decrypt"])
         old = args["OLD"]
         new = args["NEW"]
+        by_prefix = args["--prefix"]
+        dry_run = args["--dry-run"]
     if args["search"]:
         term = args["TERM"]
         fuzzy = False
         if args["--fuzzy"]:
             fuzzy = True
+        refresh = args["--refresh"]
+        limit = int(args["--limit"]) if args["--limit"] else None
+        ordered = not args["--unordered"]
+    if args["uploads"]:
+        abort_stale = args["--abort-stale"]
+        older_than = int(args["--older-than"])
+    if args["ls"]:
+        max_keys = int(args["--max-keys"]) if args["--max-keys"] else None
+        start_after = args["--start-after"]
+        dirs = args["--dirs"]
+        json_lines = args["--json"]
+        refresh = args["--refresh"]
+    if args["sync"]:
+        local_dir = args["LOCAL_DIR"]
+        remote_prefix = args["REMOTE_PREFIX"]
+        download = args["--download"]
+        delete = args["--delete"]
+        dry_run = args["--dry-run"]
+        add_checksum = args["--checksum"]
+        use_encryption = not args["--no-encrypt"]
+        progress = not args["--no-progress"] and ("log" if args["--log-progress"] else True)
+        jobs = int(args["--jobs"] or 1)
+        max_bandwidth = args["--max-bandwidth"]
     vendor = args["--datacenter"]
     ignore_prefix = args["--ignore-prefix"]
 
@@ -92,26 +177,81 @@ def handle_upload(args):
     print("Upload finished!")
 
 
+def _format_entry(el, humanized=False, json_lines=False):
+    if json_lines:
+        return json.dumps(
+            dict(el, date=el["date"].isoformat() if el["date"] else None)
+        )
+    if el.get("dir"):
+        return "{:>25}\t PRE\t\t {}".format("", el["name"])
+    reported_size = humanize(el["size"]) if humanized else el["size"]
+    return "{}\t {}\t\t {}".format(el["date"].isoformat(), reported_size, el["name"])
+
+
 def handle_ls(args):
     kwargs = _handle(args)
-    for el in list_files(**kwargs):
-
-        reported_size = humanize(el["size"]) if kwargs["humanized"] else el["size"]
-        print(
-            "{}\t {}\t\t {}".format(el["date"].isoformat(), reported_size, el["name"])
-        )
+    json_lines = kwargs.pop("json_lines")
+    # one buffered write per 64kB instead of a print per key
+    out = io.open(sys.stdout.fileno(), "w", buffering=1 << 16, encoding="utf-8", closefd=False)
+    try:
+        for el in list_files(**kwargs):
+            out.write(_format_entry(el, kwargs["humanized"], json_lines) + "\n")
+        out.flush()
+    except BrokenPipeError:
+        # the reader (eg. head) is gone, drop what is still buffered
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
 
 
 def handle_rename(args):
     kwargs = _handle(args)
-    rename_file(**kwargs)
+    result = rename_file(**kwargs)
+    if kwargs["by_prefix"]:
+        moves, errors = result
+        for old, new, _ in moves if kwargs["dry_run"] else []:
+            print("{}\t -> {}".format(old, new))
+        for error in errors:
+            print("failed to delete\t {}\t {}".format(error["Key"], error.get("Message", error["Code"])))
+        print("{} {} objects".format("Would move" if kwargs["dry_run"] else "Moved", len(moves)))
+        return
     print("Done!")
 
 
 def handle_search(args):
     kwargs = _handle(args)
     for el in search_files(**kwargs):
-        print(el)
+        # unordered matches are shown as soon as they are found, even in a pipe
+        print(el, flush=not kwargs["ordered"])
+
+
+def handle_uploads(args):
+    kwargs = _handle(args)
+    if kwargs.pop("abort_stale"):
+        for el in abort_stale_uploads(**kwargs):
+            print("aborted {}\t {}".format(el["upload_id"], el["name"]))
+        return
+    kwargs.pop("older_than")
+    for el in list_uploads(**kwargs):
+        print(
+            "{}\t {}\t {}{}".format(
+                el["date"].isoformat(),
+                el["upload_id"],
+                el["name"],
+                "\t (resumable)" if el["resumable"] else "",
+            )
+        )
+
+
+def handle_sync(args):
+    kwargs = _handle(args)
+    LOG.info("Syncing {local_dir}...".format(**kwargs))
+    try:
+        actions = sync_files(**kwargs)
+    except ValueError as error:
+        print("Sync failed: {}".format(error))
+        sys.exit(1)
+    for action, name in actions:
+        print("{}{}\t {}".format("(dry run) " if kwargs["dry_run"] else "", action, name))
+    print("Sync finished!" if actions else "Nothing to sync")
 
 
 def handle_secret(args):
@@ -121,9 +261,27 @@ def handle_secret(args):
 def handle_download(args):
     kwargs = _handle(args)
     LOG.info("Getting {path}...".format(**kwargs))
+    by_prefix = kwargs.pop("by_prefix")
+    by_pattern = kwargs.pop("by_pattern")
+    jobs = kwargs.pop("jobs")
     try:
+        if by_prefix or by_pattern:
+            downloaded, skipped, failed = download_files(jobs=jobs, pattern=by_pattern, **kwargs)
+            if not (downloaded or skipped or failed):
+                print("Nothing matches {}".format(kwargs["path"]))
+                sys.exit(1)
+            for key, error in failed:
+                print("failed\t {}\t {}".format(key, error))
+            print("Downloaded {} files, {} already there".format(len(downloaded), len(skipped)))
+            if failed:
+                sys.exit(1)
+            return
         download_file(**kwargs)
-        print("Download finished!")
+        if kwargs["dst"] != "-":
+            print("Download finished!")
+    except BrokenPipeError:
+        # the reader (eg. head) is gone, nothing more to write
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
     except Exception as error:
         from pygments.console import codes
 
@@ -158,9 +316,21 @@ def handle_download(args):
 
 def handle_delete(args):
     kwargs = _handle(args)
-    LOG.info("Deleting {path}...".format(**kwargs))
-    delete_file(**kwargs)
-    print("Done!")
+    kwargs.pop("path")
+    LOG.info("Deleting {paths}...".format(**kwargs))
+    try:
+        deleted, errors = delete_files(**kwargs)
+    except KeyError as error:
+        print(error.args[0])
+        sys.exit(1)
+    for error in errors:
+        print("failed\t {}\t {}".format(error["Key"], error.get("Message", error["Code"])))
+    if kwargs["dry_run"]:
+        print("Would delete {} objects".format(deleted))
+    else:
+        print("Deleted {} objects".format(deleted))
+    if errors:
+        sys.exit(1)
 
 
 def handle_status(args):
@@ -220,6 +390,12 @@ def main():
     if args["status"] is True:
         handle_status(args)
 
+    if args["uploads"] is True:
+        handle_uploads(args)
+
+    if args["sync"] is True:
+        handle_sync(args)
+
     if args["generate_secret"] is True:
         handle_secret(args)
 
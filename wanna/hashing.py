@@ -0,0 +1,451 @@
+"""Checksums
+
+Whole file algorithms hash the bytes in order:
+
+* md5 -- the default, stored as a bare hex digest for compatibility
+* blake3 -- fast, multi-threaded for files on disk (needs `blake3`)
+
+Part based algorithms hash fixed-size parts independently, in parallel and
+in any order, and combine the part digests:
+
+* md5-etag -- the ETag S3 gives an object uploaded in parts of the same size
+* sha256 -- S3 composite SHA256 additional checksum
+* crc32c -- S3 full object CRC32C additional checksum (faster with `crc32c`)
+* xxh3 -- fast tree hash for local use (needs `xxhash`)
+
+The checksum sidecar records the algorithm, eg. `sha256:8388608:<digest>`.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import os
+import mmap
+import base64
+import struct
+import hashlib
+import threading
+
+DEFAULT_ALGORITHM = "md5"
+DEFAULT_PART_SIZE = 8 * 1024 ** 2
+
+
+class _Algorithm(object):
+    name = None
+    parted = False
+
+    def new(self):
+        raise NotImplementedError
+
+    def finalize(self, hasher):
+        return hasher.hexdigest()
+
+    def combine(self, parts):
+        """Combine the finalized part digests"""
+        raise NotImplementedError
+
+
+class _MD5(_Algorithm):
+    name = "md5"
+
+    def new(self):
+        return hashlib.md5()
+
+
+class _BLAKE3(_Algorithm):
+    name = "blake3"
+
+    def new(self):
+        import blake3
+
+        return blake3.blake3()
+
+
+class _MD5ETag(_Algorithm):
+    name = "md5-etag"
+    parted = True
+
+    def new(self):
+        return hashlib.md5()
+
+    def finalize(self, hasher):
+        return hasher.digest()
+
+    def combine(self, parts):
+        if len(parts) == 1:
+            return _hex(parts[0])
+        return "{}-{}".format(hashlib.md5(b"".join(parts)).hexdigest(), len(parts))
+
+
+class _SHA256(_Algorithm):
+    name = "sha256"
+    parted = True
+
+    def new(self):
+        return hashlib.sha256()
+
+    def finalize(self, hasher):
+        return hasher.digest()
+
+    def combine(self, parts):
+        if len(parts) == 1:
+            return _b64(parts[0])
+        return "{}-{}".format(_b64(hashlib.sha256(b"".join(parts)).digest()), len(parts))
+
+
+class _XXH3(_Algorithm):
+    name = "xxh3"
+    parted = True
+
+    def new(self):
+        import xxhash
+
+        return xxhash.xxh3_128()
+
+    def finalize(self, hasher):
+        return hasher.digest()
+
+    def combine(self, parts):
+        import xxhash
+
+        if len(parts) == 1:
+            return _hex(parts[0])
+        return "{}-{}".format(xxhash.xxh3_128(b"".join(parts)).hexdigest(), len(parts))
+
+
+class _CRC32C(_Algorithm):
+    name = "crc32c"
+    parted = True
+
+    def new(self):
+        return _Crc32c()
+
+    def finalize(self, hasher):
+        return hasher.crc, hasher.length
+
+    def combine(self, parts):
+        crc, _ = parts[0]
+        for part_crc, length in parts[1:]:
+            crc = crc32c_combine(crc, part_crc, length)
+        return _b64(struct.pack(">I", crc))
+
+
+ALGORITHMS = dict(
+    (algorithm.name, algorithm)
+    for algorithm in (_MD5(), _BLAKE3(), _MD5ETag(), _SHA256(), _XXH3(), _CRC32C())
+)
+
+
+def _hex(digest):
+    return "".join("{:02x}".format(byte) for byte in bytearray(digest))
+
+
+def _b64(digest):
+    return base64.b64encode(digest).decode("ascii")
+
+
+def get_algorithm(name):
+    """Get the algorithm, ValueError if unknown or its package is missing"""
+    try:
+        algorithm = ALGORITHMS[(name or DEFAULT_ALGORITHM).lower()]
+    except KeyError:
+        raise ValueError(
+            "checksum: {}, is not supported ({})".format(name, ", ".join(sorted(ALGORITHMS)))
+        )
+    try:
+        algorithm.new()
+    except ImportError as error:
+        raise ValueError("checksum: {}, needs a missing package: {}".format(name, error))
+    return algorithm
+
+
+_CRC32C_POLY = 0x82F63B78
+_crc32c_table = []
+
+
+def _crc32c_python(data, crc=0):
+    if not _crc32c_table:
+        for n in range(256):
+            c = n
+            for _ in range(8):
+                c = (c >> 1) ^ _CRC32C_POLY if c & 1 else c >> 1
+            _crc32c_table.append(c)
+    crc ^= 0xFFFFFFFF
+    for byte in bytearray(data):
+        crc = _crc32c_table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+try:
+    from crc32c import crc32c as _crc32c
+except ImportError:
+    _crc32c = _crc32c_python
+
+
+class _Crc32c(object):
+    def __init__(self):
+        self.crc = 0
+        self.length = 0
+
+    def update(self, data):
+        self.crc = _crc32c(data, self.crc)
+        self.length += len(data)
+
+
+def _gf2_times(matrix, vector):
+    total = 0
+    index = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[index]
+        vector >>= 1
+        index += 1
+    return total
+
+
+def _gf2_square(matrix):
+    return [_gf2_times(matrix, row) for row in matrix]
+
+
+def crc32c_combine(crc1, crc2, length2, poly=_CRC32C_POLY):
+    """CRC of two concatenated blocks from their CRCs (as zlib's crc32_combine)"""
+    if length2 == 0:
+        return crc1
+    odd = [poly] + [1 << n for n in range(31)]
+    even = _gf2_square(odd)
+    odd = _gf2_square(even)
+    while True:
+        even = _gf2_square(odd)
+        if length2 & 1:
+            crc1 = _gf2_times(even, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+        odd = _gf2_square(even)
+        if length2 & 1:
+            crc1 = _gf2_times(odd, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+    return crc1 ^ crc2
+
+
+class Checksum(object):
+    """Digest together with the algorithm (and part size) it was made with"""
+
+    def __init__(self, algorithm, digest, part_size=None):
+        self.algorithm = get_algorithm(algorithm).name
+        self.digest = digest
+        self.part_size = part_size if ALGORITHMS[self.algorithm].parted else None
+
+    @classmethod
+    def parse(cls, text):
+        """Read a checksum sidecar, a bare digest is md5"""
+        text = text.decode("ascii") if isinstance(text, bytes) else text
+        fields = text.strip().split(":")
+        if len(fields) == 1:
+            return cls(DEFAULT_ALGORITHM, fields[0])
+        if len(fields) == 2:
+            return cls(fields[0], fields[1])
+        return cls(fields[0], fields[2], int(fields[1]))
+
+    def new_digest(self):
+        """An empty digest of the same kind"""
+        return new_digest(self.algorithm, self.part_size)
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __str__(self):
+        if self.algorithm == DEFAULT_ALGORITHM:
+            return self.digest
+        if self.part_size:
+            return "{}:{}:{}".format(self.algorithm, self.part_size, self.digest)
+        return "{}:{}".format(self.algorithm, self.digest)
+
+    def __repr__(self):
+        return "Checksum({})".format(self)
+
+
+class OrderedDigest(object):
+    """Hash of a file whose chunks are read out of order
+
+    Every chunk is fed with its offset. Chunks ahead of the first missing
+    byte are kept until the gap is filled, so the digest is computed from
+    the bytes the transfer already read, in one pass.
+    """
+
+    def __init__(self, algorithm=DEFAULT_ALGORITHM, hasher=None):
+        self._algorithm = get_algorithm(algorithm)
+        self._hash = hasher or self._algorithm.new()
+        self._offset = 0
+        self._pending = {}
+        self._pending_size = 0
+        self._cond = threading.Condition()
+
+    @property
+    def pending_size(self):
+        return self._pending_size
+
+    def update(self, offset, data):
+        with self._cond:
+            if offset < self._offset:
+                return
+            self._pending[offset] = data
+            self._pending_size += len(data)
+            while self._offset in self._pending:
+                chunk = self._pending.pop(self._offset)
+                self._pending_size -= len(chunk)
+                self._hash.update(chunk)
+                self._offset += len(chunk)
+            self._cond.notify_all()
+
+    def wait(self, max_pending, timeout=None):
+        """Block until at most `max_pending` bytes wait for a gap to be filled
+
+        Returns:
+            bool - False if the timeout expired first
+        """
+        with self._cond:
+            if self._pending_size > max_pending:
+                self._cond.wait(timeout)
+            return self._pending_size <= max_pending
+
+    def _finalize(self):
+        with self._cond:
+            if self._pending:
+                raise ValueError("Digest incomplete: missing bytes at {}".format(self._offset))
+            return self._algorithm.finalize(self._hash)
+
+    def hexdigest(self):
+        return self._finalize()
+
+    def checksum(self):
+        return Checksum(self._algorithm.name, self._finalize())
+
+
+class PartedDigest(object):
+    """Hash of fixed-size parts fed in any order, see OrderedDigest"""
+
+    def __init__(self, algorithm, part_size=DEFAULT_PART_SIZE):
+        self._algorithm = get_algorithm(algorithm)
+        self._part_size = part_size
+        self._parts = {}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+
+    def _part(self, index):
+        with self._lock:
+            if index not in self._parts:
+                self._parts[index] = OrderedDigest(self._algorithm.name, self._algorithm.new())
+            return self._parts[index]
+
+    @property
+    def pending_size(self):
+        with self._lock:
+            parts = list(self._parts.values())
+        return sum(part.pending_size for part in parts)
+
+    def update(self, offset, data):
+        view = memoryview(data)
+        while len(view):
+            index, start = divmod(offset, self._part_size)
+            length = min(len(view), self._part_size - start)
+            self._part(index).update(start, view[:length].tobytes())
+            offset += length
+            view = view[length:]
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait(self, max_pending, timeout=None):
+        with self._cond:
+            if self.pending_size > max_pending:
+                self._cond.wait(timeout)
+        return self.pending_size <= max_pending
+
+    def checksum(self):
+        with self._lock:
+            parts = [self._parts.get(index) for index in range(max(self._parts) + 1)] if self._parts else []
+        if None in parts:
+            raise ValueError("Digest incomplete: missing part {}".format(parts.index(None)))
+        finalized = [part._finalize() for part in parts] or [
+            self._algorithm.finalize(self._algorithm.new())
+        ]
+        return Checksum(self._algorithm.name, self._algorithm.combine(finalized), self._part_size)
+
+
+def new_digest(algorithm=DEFAULT_ALGORITHM, part_size=None):
+    """Digest fed with (offset, bytes) chunks as a transfer reads them"""
+    if get_algorithm(algorithm).parted:
+        return PartedDigest(algorithm, part_size or DEFAULT_PART_SIZE)
+    return OrderedDigest(algorithm)
+
+
+def wait_for_digest(digest, max_pending, futures):
+    """Wait until the digest has room, raise the error of a failed future"""
+    while not digest.wait(max_pending, timeout=1):
+        for future in futures:
+            if future.done() and future.exception() is not None:
+                future.result()
+
+
+def _hash_part(algorithm, view, offset, length):
+    hasher = algorithm.new()
+    hasher.update(view[offset:offset + length])
+    return algorithm.finalize(hasher)
+
+
+def hash_file(path, algorithm=DEFAULT_ALGORITHM, part_size=None, workers=None):
+    """Checksum of a file on disk
+
+    Part based algorithms hash the parts of the memory mapped file in a
+    thread pool (hashlib and the optional packages release the GIL).
+
+    Args:
+        path (str): path to the file
+        algorithm (str): name of the algorithm
+        part_size (int): part size of part based algorithms
+        workers (int): number of threads, by default one per cpu
+
+    Returns:
+        Checksum
+    """
+    algorithm = get_algorithm(algorithm)
+    part_size = part_size or DEFAULT_PART_SIZE
+    size = os.path.getsize(path)
+
+    if algorithm.name == "blake3":
+        import blake3
+
+        hasher = blake3.blake3(max_threads=blake3.blake3.AUTO)
+        hasher.update_mmap(path)
+        return Checksum(algorithm.name, hasher.hexdigest())
+
+    if size == 0:
+        empty = algorithm.finalize(algorithm.new())
+        if algorithm.parted:
+            return Checksum(algorithm.name, algorithm.combine([empty]), part_size)
+        return Checksum(algorithm.name, empty)
+
+    with open(path, "rb") as source:
+        mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            view = memoryview(mapped)
+            try:
+                if not algorithm.parted:
+                    hasher = algorithm.new()
+                    for offset in range(0, size, 1024 ** 2):
+                        hasher.update(view[offset:offset + 1024 ** 2])
+                    return Checksum(algorithm.name, algorithm.finalize(hasher))
+
+                offsets = range(0, size, part_size)
+                with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+                    parts = list(
+                        pool.map(lambda offset: _hash_part(algorithm, view, offset, part_size), offsets)
+                    )
+                return Checksum(algorithm.name, algorithm.combine(parts), part_size)
+            finally:
+                view.release()
+        finally:
+            mapped.close()
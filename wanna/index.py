@@ -0,0 +1,172 @@
+"""Key index
+
+A local copy of the listing of a bucket (key, size, modification time and
+ETag), so searches and existence checks do not list the whole bucket over
+the network every time.
+
+Once the index is older than its TTL the whole bucket is listed again. A
+listing after the last indexed key would miss keys sorting before it,
+and S3 does not tell which prefixes changed. Uploads, deletes and renames
+made by wanna update the index as they happen, so between two listings
+it only lags behind the changes made by others.
+"""
+import os
+import sys
+import time
+import sqlite3
+import logging
+import threading
+
+from calendar import timegm
+
+LOG = logging.getLogger("wanna:index")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS keys (
+    key TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    etag TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _row(obj):
+    """Index row of a list_objects_v2 entry"""
+    mtime = timegm(obj["LastModified"].utctimetuple())
+    return obj["Key"], obj["Size"], mtime, obj.get("ETag", "").strip('"')
+
+
+def _prefix_range(prefix):
+    """
+    Condition on the key matching the prefix, as a range the primary key can answer.
+    Args:
+        prefix (str): key prefix, empty for every key
+
+    Returns:
+        tuple of (sql, params) for `key >= prefix AND key < upper`, where upper
+        is the prefix with its last character incremented
+    """
+    upper = prefix
+    while upper:
+        last = ord(upper[-1]) + 1
+        if 0xD800 <= last <= 0xDFFF:
+            # surrogates cannot be stored, the next character is U+E000
+            last = 0xE000
+        if last <= sys.maxunicode:
+            return "key >= ? AND key < ?", (prefix, upper[:-1] + chr(last))
+        upper = upper[:-1]
+    return "key >= ?", (prefix,)
+
+
+class KeyIndex(object):
+    """Keys of a bucket stored in sqlite
+
+    Args:
+        path (str): database file, an empty path disables the index
+        ttl (int): seconds after which the index is refreshed
+    """
+
+    def __init__(self, path, ttl=3600):
+        self.path = os.path.expanduser(path) if path else None
+        self.ttl = ttl
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connect(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def _exists(self):
+        return self._connection is not None or os.path.exists(self.path)
+
+    @property
+    def refreshed(self):
+        """Time of the last refresh, None if the index was never built"""
+        if not self.enabled or not self._exists():
+            return None
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM meta WHERE name = 'refreshed'").fetchone()
+        return float(row[0]) if row else None
+
+    def is_stale(self):
+        refreshed = self.refreshed
+        return refreshed is None or time.time() - refreshed > self.ttl
+
+    def _mark_refreshed(self, connection):
+        connection.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('refreshed', ?)", (repr(time.time()),)
+        )
+
+    def rebuild(self, objects):
+        """Replace the whole index with the given listing"""
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM keys")
+            connection.executemany(
+                "INSERT OR REPLACE INTO keys VALUES (?, ?, ?, ?)", (_row(obj) for obj in objects)
+            )
+            self._mark_refreshed(connection)
+            connection.commit()
+
+    def update(self, objects):
+        """Add or update the given objects
+
+        Nothing is written unless the index was built before, an index
+        nobody reads is not worth keeping up to date.
+        """
+        if not self.enabled or not self._exists():
+            return
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO keys VALUES (?, ?, ?, ?)", (_row(obj) for obj in objects)
+            )
+            connection.commit()
+
+    def remove(self, keys):
+        """Forget the given keys"""
+        if not self.enabled or not self._exists():
+            return
+        with self._lock:
+            connection = self._connect()
+            connection.executemany("DELETE FROM keys WHERE key = ?", ((key,) for key in keys))
+            connection.commit()
+
+    def get(self, key):
+        """Indexed entry of the key or None"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT key, size, mtime, etag FROM keys WHERE key = ?", (key,)
+            ).fetchone()
+        return row and {"name": row[0], "size": row[1], "mtime": row[2], "etag": row[3]}
+
+    def keys(self, prefix="", start_after=None):
+        """Indexed entries with the prefix in key order, read in batches"""
+        condition, params = _prefix_range(prefix)
+        last = start_after or ""
+        while True:
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT key, size, mtime, etag FROM keys"
+                    " WHERE " + condition + " AND key > ? ORDER BY key LIMIT 1000",
+                    params + (last,),
+                ).fetchall()
+            for row in rows:
+                yield {"name": row[0], "size": row[1], "mtime": row[2], "etag": row[3]}
+            if len(rows) < 1000:
+                return
+            last = rows[-1][0]
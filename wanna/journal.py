@@ -0,0 +1,123 @@
+"""Upload journal
+
+Keeps track of multipart uploads in progress, so an interrupted upload
+can be resumed instead of started again from byte zero.
+
+Every upload is a json-lines file under `~/.wanna/uploads`. The first line
+describes the upload (bucket, key, source file, UploadId, part size), every
+next line records a completed part with its ETag.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+LOG = logging.getLogger("wanna:journal")
+
+
+class JournalEntry(object):
+    """A single multipart upload in progress"""
+
+    def __init__(self, path, header, parts=None):
+        self.path = path
+        self.header = header
+        self.parts = parts or {}
+        self._lock = threading.Lock()
+
+    @property
+    def upload_id(self):
+        return self.header["upload_id"]
+
+    @property
+    def part_size(self):
+        return self.header["part_size"]
+
+    def matches(self, filename, part_size):
+        """Is the entry still valid for the given file"""
+        stat = os.stat(filename)
+        return (
+            self.header["size"] == stat.st_size
+            and self.header["mtime"] == stat.st_mtime
+            and self.header["part_size"] == part_size
+        )
+
+    def add_part(self, part_number, etag):
+        """Record a completed part"""
+        with self._lock:
+            self.parts[part_number] = etag
+            with open(self.path, "a") as journal:
+                journal.write(json.dumps({"part": part_number, "etag": etag}) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+
+
+class UploadJournal(object):
+    """Multipart uploads in progress on this host"""
+
+    def __init__(self, path="~/.wanna/uploads"):
+        self.path = os.path.expanduser(path)
+
+    def _entry_path(self, bucket, key, filename):
+        ident = "\0".join((bucket, key, os.path.abspath(filename)))
+        return os.path.join(self.path, hashlib.sha1(ident.encode("utf-8")).hexdigest() + ".json")
+
+    @staticmethod
+    def _read(path):
+        with open(path) as journal:
+            lines = [json.loads(line) for line in journal if line.strip()]
+        parts = dict((line["part"], line["etag"]) for line in lines[1:])
+        return JournalEntry(path, lines[0], parts)
+
+    def load(self, bucket, key, filename):
+        """Get the upload in progress for the given file, if any"""
+        path = self._entry_path(bucket, key, filename)
+        try:
+            return self._read(path)
+        except (IOError, OSError, ValueError, IndexError):
+            return None
+
+    def start(self, bucket, key, filename, upload_id, part_size):
+        """Record a new multipart upload"""
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        stat = os.stat(filename)
+        header = {
+            "bucket": bucket,
+            "key": key,
+            "filename": os.path.abspath(filename),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "upload_id": upload_id,
+            "part_size": part_size,
+            "created": time.time(),
+        }
+        path = self._entry_path(bucket, key, filename)
+        with open(path, "w") as journal:
+            journal.write(json.dumps(header) + "\n")
+        LOG.debug("journal %s: %s", path, upload_id)
+        return JournalEntry(path, header)
+
+    def finish(self, entry):
+        """Forget a completed or aborted upload"""
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+    def entries(self):
+        """All uploads in progress"""
+        if not os.path.isdir(self.path):
+            return
+        for name in sorted(os.listdir(self.path)):
+            try:
+                yield self._read(os.path.join(self.path, name))
+            except (IOError, OSError, ValueError, IndexError):
+                LOG.warning("skipping corrupted journal %s", name)
+
+    def discard(self, upload_id):
+        """Forget the upload with the given id"""
+        for entry in self.entries():
+            if entry.upload_id == upload_id:
+                self.finish(entry)
@@ -0,0 +1,323 @@
+"""Transfer metrics
+
+Collects the metrics of a run: bytes and files transferred, wall time and
+throughput, a latency histogram of the requests moving the data (parts,
+ranges and single requests), retries and throttling (503 SlowDown) seen by
+the client, and the time spent hashing against the time spent moving bytes
+(both summed over the threads).
+
+The report is written as json (`--stats-json`) or in the Prometheus text
+format for the textfile collector of node_exporter (`--stats-textfile`).
+
+Every run has a Metrics of its own, passed down to the transfers. The
+client is shared by the whole process, so the retries it sees are only
+counted for the threads the run is bound to (see `Metrics.bind`).
+"""
+from wanna.progress import Counter
+
+import os
+import json
+import time
+import socket
+import logging
+import tempfile
+import threading
+import contextlib
+
+LOG = logging.getLogger("wanna:metrics")
+
+#: upper bounds in seconds of the latency buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+#: the run the requests of a thread belong to
+_bound = threading.local()
+
+
+class Histogram(object):
+    """Cumulative histogram, as Prometheus has it"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def cumulative(self):
+        """(upper bound, observations up to it) pairs, the last bound is +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+class TimedDigest(object):
+    """Digest which adds the time spent in `update` to the hashing time"""
+
+    def __init__(self, digest, metrics):
+        self._digest = digest
+        self._metrics = metrics
+
+    def update(self, offset, data):
+        started = time.monotonic()
+        try:
+            self._digest.update(offset, data)
+        finally:
+            self._metrics.hashing.add(time.monotonic() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._digest, name)
+
+
+class Metrics(object):
+    """Metrics of a run
+
+    Args:
+        operation (str): upload|download
+        labels (dict): extra labels of the Prometheus metrics, eg. the bucket
+    """
+
+    def __init__(self, operation, labels=None):
+        self.operation = operation
+        self.labels = dict(labels or {}, operation=operation, host=socket.gethostname())
+        self.started = time.time()
+        self._started = time.monotonic()
+        self.wall = None
+        self.success = None
+        self.bytes = Counter()
+        self.files = Counter()
+        self.retries = Counter()
+        self.throttled = Counter()
+        self.errors = Counter()
+        self.failed = Counter()
+        self.hashing = Counter()
+        self.transferring = Counter()
+        self.latency = {}
+        self._lock = threading.Lock()
+
+    def add_file(self, size):
+        self.files.add(1)
+        self.bytes.add(size)
+
+    def observe(self, request, seconds):
+        """Latency of a request moving data, eg. upload_part"""
+        histogram = self.latency.get(request)
+        if histogram is None:
+            with self._lock:
+                histogram = self.latency.setdefault(request, Histogram())
+        histogram.observe(seconds)
+        self.transferring.add(seconds)
+
+    @contextlib.contextmanager
+    def timed(self, request):
+        """Observe the latency of the block"""
+        started = time.monotonic()
+        yield
+        self.observe(request, time.monotonic() - started)
+
+    @contextlib.contextmanager
+    def hashing_time(self):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.hashing.add(time.monotonic() - started)
+
+    def timed_digest(self, digest):
+        return TimedDigest(digest, self) if digest is not None else None
+
+    def bind(self):
+        """Count the requests of the current thread for this run, eg. as a pool initializer"""
+        _bound.metrics = self
+
+    @contextlib.contextmanager
+    def bound(self):
+        """Count the requests of the current thread for this run during the block"""
+        previous = getattr(_bound, "metrics", None)
+        _bound.metrics = self
+        try:
+            yield self
+        finally:
+            _bound.metrics = previous
+
+    def _on_attempt(self, response=None, attempts=1, caught_exception=None, **kwargs):
+        """Every attempt of every request of the client goes through `needs-retry`"""
+        if getattr(_bound, "metrics", None) is not self:
+            # a request of another run sharing the client
+            return
+        if attempts > 1:
+            self.retries.add(1)
+        status = response[0].status_code if response is not None else None
+        code = response[1].get("Error", {}).get("Code") if response is not None else None
+        if status == 503 or code == "SlowDown":
+            self.throttled.add(1)
+        if caught_exception is not None or (status or 0) >= 500:
+            self.errors.add(1)
+
+    def attach(self, client):
+        """Count the retries and the throttling of the client"""
+        client.meta.events.register_first("needs-retry.s3", self._on_attempt, unique_id=id(self))
+
+    def detach(self, client):
+        client.meta.events.unregister("needs-retry.s3", unique_id=id(self))
+
+    def stop(self, success=True):
+        """End of the run, which did not succeed if a single file failed"""
+        self.wall = time.monotonic() - self._started
+        self.success = success and not self.failed.value
+
+    def as_dict(self):
+        wall = self.wall if self.wall is not None else time.monotonic() - self._started
+        transferred = self.bytes.value
+        return {
+            "operation": self.operation,
+            "labels": self.labels,
+            "started": self.started,
+            "success": self.success,
+            "files": self.files.value,
+            "failed_files": self.failed.value,
+            "bytes": transferred,
+            "wall_seconds": round(wall, 3),
+            "mb_per_second": round(transferred / wall / 1024 ** 2, 3) if wall else 0.0,
+            "retries": self.retries.value,
+            "throttled": self.throttled.value,
+            "errors": self.errors.value,
+            "hashing_seconds": round(self.hashing.value, 3),
+            "transfer_seconds": round(self.transferring.value, 3),
+            "latency": dict(
+                (
+                    request,
+                    {
+                        "count": histogram.count,
+                        "sum": round(histogram.sum, 3),
+                        "buckets": dict(
+                            ("+Inf" if bound == float("inf") else str(bound), count)
+                            for bound, count in histogram.cumulative()
+                        ),
+                    },
+                )
+                for request, histogram in sorted(self.latency.items())
+            ),
+        }
+
+    def _labels(self, **extra):
+        labels = dict(self.labels, **extra)
+        return "{" + ",".join(
+            '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+            for name, value in sorted(labels.items())
+        ) + "}"
+
+    def as_prometheus(self):
+        """The report in the Prometheus text format"""
+        stats = self.as_dict()
+        wall = stats["wall_seconds"]
+        gauges = (
+            ("wanna_last_run_timestamp_seconds", "Start of the last run", self.started),
+            ("wanna_last_run_success", "1 if the last run succeeded", int(bool(self.success))),
+            ("wanna_files", "Files transferred by the last run", stats["files"]),
+            ("wanna_failed_files", "Files the last run failed to transfer", stats["failed_files"]),
+            ("wanna_bytes", "Bytes transferred by the last run", stats["bytes"]),
+            ("wanna_wall_seconds", "Wall time of the last run", wall),
+            (
+                "wanna_throughput_bytes_per_second",
+                "Effective throughput of the last run",
+                round(stats["bytes"] / wall, 1) if wall else 0,
+            ),
+            ("wanna_retries", "Requests retried by the last run", stats["retries"]),
+            ("wanna_throttled", "503 SlowDown responses of the last run", stats["throttled"]),
+            ("wanna_errors", "Failed attempts of the last run", stats["errors"]),
+            ("wanna_hashing_seconds", "Time spent hashing, summed over threads", stats["hashing_seconds"]),
+            ("wanna_transfer_seconds", "Time spent in data requests, summed over threads", stats["transfer_seconds"]),
+        )
+        lines = []
+        for name, help, value in gauges:
+            lines.append("# HELP {} {}".format(name, help))
+            lines.append("# TYPE {} gauge".format(name))
+            lines.append("{}{} {}".format(name, self._labels(), value))
+        if self.latency:
+            name = "wanna_request_latency_seconds"
+            lines.append("# HELP {} Latency of the requests moving data".format(name))
+            lines.append("# TYPE {} histogram".format(name))
+            for request, histogram in sorted(self.latency.items()):
+                for bound, count in histogram.cumulative():
+                    le = "+Inf" if bound == float("inf") else bound
+                    lines.append("{}_bucket{} {}".format(name, self._labels(request=request, le=le), count))
+                lines.append("{}_sum{} {}".format(name, self._labels(request=request), round(histogram.sum, 6)))
+                lines.append("{}_count{} {}".format(name, self._labels(request=request), histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.as_dict(), indent=2) + "\n")
+
+    def write_textfile(self, path):
+        """Write the textfile atomically, node_exporter must never read half of it"""
+        _write_atomic(path, self.as_prometheus())
+
+
+def _write_atomic(path, text):
+    path = os.path.expanduser(path)
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix=".wanna-", suffix=".tmp")
+    try:
+        with os.fdopen(handle, "w") as output:
+            output.write(text)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def bound_pool(max_workers, metrics=None):
+    """Thread pool whose requests are counted for the run of `metrics`"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    if metrics is None:
+        return ThreadPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, initializer=metrics.bind)
+
+
+def timed(metrics, request):
+    """Observe the latency of a data request when metrics are collected"""
+    return metrics.timed(request) if metrics is not None else contextlib.nullcontext()
+
+
+def hashing_time(metrics):
+    return metrics.hashing_time() if metrics is not None else contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def report(vendor, operation, stats_json=None, stats_textfile=None):
+    """Metrics of a run, written at the end of the block, also on failure
+
+    The metrics are passed to the transfers of the run, eg.
+    `vendor.upload_files(path, metrics=metrics)`. Nothing is collected
+    unless a report is asked for.
+    """
+    if not stats_json and not stats_textfile:
+        yield None
+        return
+    metrics = Metrics(operation, labels={"vendor": vendor.name})
+    with vendor.collect_metrics(metrics):
+        with metrics.bound():
+            try:
+                yield metrics
+            except BaseException:
+                metrics.stop(success=False)
+                raise
+            else:
+                metrics.stop(success=True)
+            finally:
+                if stats_json:
+                    metrics.write_json(stats_json)
+                if stats_textfile:
+                    metrics.write_textfile(stats_textfile)
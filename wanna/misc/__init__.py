@@ -9,21 +9,67 @@ def delete_file(vendor, path, **kwargs):
     return vendor.delete_file(path)
 
 
-def search_files(vendor, term, fuzzy, **kwargs):
+def delete_files(vendor, paths, by_prefix=False, dry_run=False, **kwargs):
     vendor = setup_vendor(vendor, **kwargs)
-    return vendor.search(term, fuzzy)
+    if not by_prefix and len(paths) == 1:
+        # a single key is looked up, a typo is not reported as deleted
+        key = vendor.get_obj_key(paths[0])
+        if not vendor.check_if_key_exists(key, ignore_prefix=True):
+            raise KeyError("{} does not exist!".format(key))
+    if not by_prefix:
+        return vendor.delete_files((vendor.get_obj_key(path) for path in paths), dry_run=dry_run)
+    deleted, errors = 0, []
+    for path in paths:
+        count, failed = vendor.delete_prefix(vendor.get_prefix_key(path), dry_run=dry_run)
+        deleted += count
+        errors.extend(failed)
+    return deleted, errors
 
 
-def rename_file(vendor, old, new, **kwargs):
+def search_files(vendor, term, fuzzy, refresh=False, limit=None, ordered=True, **kwargs):
     vendor = setup_vendor(vendor, **kwargs)
+    return vendor.search(term, fuzzy, refresh=refresh, limit=limit, ordered=ordered)
+
+
+def rename_file(vendor, old, new, by_prefix=False, dry_run=False, **kwargs):
+    vendor = setup_vendor(vendor, **kwargs)
+    if by_prefix:
+        return vendor.rename_prefix(old, new, dry_run=dry_run)
     return vendor.rename_object(old, new)
 
 
-def list_files(vendor, **kwargs):
+def list_files(vendor, max_keys=None, start_after=None, dirs=False, refresh=False, **kwargs):
     vendor = setup_vendor(vendor, **kwargs)
-    return vendor.list_files()
+    return vendor.list_files(
+        max_keys=max_keys, start_after=start_after, dirs=dirs, use_index=True, refresh=refresh
+    )
 
 
 def get_status(vendor, path, **kwargs):
     vendor = setup_vendor(vendor, **kwargs)
     return vendor.get_status(path)
+
+
+def list_uploads(vendor, **kwargs):
+    vendor = setup_vendor(vendor, **kwargs)
+    return vendor.list_uploads()
+
+
+def abort_stale_uploads(vendor, older_than, **kwargs):
+    vendor = setup_vendor(vendor, **kwargs)
+    return vendor.abort_stale_uploads(older_than=older_than)
+
+
+def sync_files(vendor, local_dir, remote_prefix=None, download=False, delete=False, dry_run=False,
+               add_checksum=False, progress=False, jobs=1, **kwargs):
+    vendor = setup_vendor(vendor, **kwargs)
+    return vendor.sync(
+        local_dir,
+        remote_prefix,
+        download=download,
+        delete=delete,
+        dry_run=dry_run,
+        add_checksum=add_checksum,
+        progress=progress,
+        jobs=jobs,
+    )
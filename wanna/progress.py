@@ -0,0 +1,214 @@
+"""Progress of a run
+
+Workers only add to counters, no lock is taken and nothing is formatted
+or written on their side. One renderer thread reads the counters at a
+fixed rate and repaints a line per file in flight and a total line with
+the throughput and ETA. Finished files only add to running totals, so a
+repaint costs the files in flight, not every file of the run. When the output is not a terminal (or in log
+mode) a total line is written every `log_interval` seconds instead.
+"""
+from wanna.utils import humanize
+
+import sys
+import time
+import logging
+import datetime
+import threading
+import collections
+
+LOG = logging.getLogger("wanna:progress")
+
+#: seconds over which the current throughput is measured
+WINDOW = 2.0
+
+
+class Counter(object):
+    """Bytes added by many threads without a lock
+
+    Every thread adds to a cell of its own (a single writer per cell), the
+    reader sums the cells.
+    """
+
+    def __init__(self):
+        self._cells = []
+        self._local = threading.local()
+
+    def add(self, amount):
+        cell = getattr(self._local, "cell", None)
+        if cell is None:
+            cell = self._local.cell = [0]
+            self._cells.append(cell)
+        cell[0] += amount
+
+    @property
+    def value(self):
+        return sum(cell[0] for cell in list(self._cells))
+
+
+class FileProgress(object):
+    """Progress callback of a single file, called with the bytes transferred
+
+    The size of a stream is None until it is finished.
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.counter = Counter()
+
+    def __call__(self, amount):
+        self.counter.add(amount)
+
+    @property
+    def seen(self):
+        return self.counter.value
+
+    def finish(self):
+        """End of a stream, its size is what was transferred"""
+        self.size = self.seen
+
+
+def _duration(seconds):
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+class Progress(object):
+    """Renderer of the progress of every file of a run
+
+    Args:
+        stream (file): output, default stdout
+        humanized (bool): human readable sizes
+        log (bool): write a total line every `log_interval` seconds even on a terminal
+        interval (float): seconds between two repaints
+        log_interval (float): seconds between two lines in log mode
+        max_files (int): files shown at most, the others are summarised
+    """
+
+    def __init__(self, stream=None, humanized=False, log=False, interval=0.1, log_interval=10.0, max_files=10):
+        self.stream = stream or sys.stdout
+        self.humanized = humanized
+        isatty = getattr(self.stream, "isatty", None)
+        self.log = log or not (isatty and isatty())
+        self.interval = log_interval if self.log else interval
+        self.max_files = max_files
+        self._files = []
+        self._done_files = 0
+        self._done_bytes = 0
+        self._done_size = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._painted = 0
+        self._started = None
+        self._samples = collections.deque()
+
+    def track(self, name, size):
+        """Progress callback of a new file"""
+        entry = FileProgress(name, size)
+        with self._lock:
+            self._files.append(entry)
+        return entry
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="wanna-progress")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the renderer and paint the final state"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.paint(final=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.paint()
+            except Exception as error:
+                LOG.debug("cannot paint the progress: %s", error)
+
+    def _size(self, value):
+        return humanize(value) if self.humanized else str(value)
+
+    def _rate(self, now, seen):
+        """Throughput over the last seconds"""
+        samples = self._samples
+        samples.append((now, seen))
+        while len(samples) > 2 and now - samples[1][0] >= WINDOW:
+            samples.popleft()
+        then, before = samples[0]
+        return (seen - before) / (now - then) if now > then else 0.0
+
+    def _lines(self, final=False):
+        now = time.monotonic()
+        with self._lock:
+            progress = [(entry, entry.seen) for entry in self._files]
+            active = [(entry, done) for entry, done in progress if entry.size is None or done < entry.size]
+            if len(active) < len(progress):
+                # finished files leave the list for the totals
+                for entry, done in progress:
+                    if entry.size is not None and done >= entry.size:
+                        self._done_files += 1
+                        self._done_bytes += done
+                        self._done_size += entry.size
+                self._files = [entry for entry, _ in active]
+            done_files, done_bytes, done_size = self._done_files, self._done_bytes, self._done_size
+        seen = done_bytes + sum(done for _, done in active)
+        size = None if any(entry.size is None for entry, _ in active) else done_size + sum(
+            entry.size for entry, _ in active
+        )
+        elapsed = now - (self._started or now)
+        average = seen / elapsed if elapsed else 0.0
+        rate = self._rate(now, seen)
+        lines = []
+        if not self.log and not final:
+            for entry, done in active[:self.max_files]:
+                if entry.size is None:
+                    lines.append("{}  {} / ?".format(entry.name, self._size(done)))
+                    continue
+                lines.append(
+                    "{}  {} / {}  ({:.2f}%)".format(
+                        entry.name, self._size(done), self._size(entry.size), 100.0 * done / entry.size
+                    )
+                )
+            if len(active) > self.max_files:
+                lines.append("... and {} more files".format(len(active) - self.max_files))
+        total = "{} of {} files  {} / {}  {}{}/s, average {}/s".format(
+            done_files,
+            done_files + len(active),
+            self._size(seen),
+            "?" if size is None else self._size(size),
+            "" if size is None else "({:.2f}%)  ".format(100.0 * seen / size if size else 100.0),
+            humanize(rate),
+            humanize(average),
+        )
+        if final:
+            total += "  in {}".format(_duration(elapsed))
+        elif rate and size is not None:
+            total += "  ETA {}".format(_duration(max(0, size - seen) / rate))
+        lines.append(total)
+        return lines
+
+    def paint(self, final=False):
+        """Write the current state, in place on a terminal"""
+        if not self._files and not self._done_files:
+            return
+        lines = self._lines(final)
+        if self.log:
+            self.stream.write("\n".join(lines) + "\n")
+        else:
+            # back to the first line of the last frame, the frame is cleared line by line
+            frame = "\x1b[{}F".format(self._painted) if self._painted else "\r"
+            frame += "".join(line + "\x1b[K\n" for line in lines) + "\x1b[J"
+            self.stream.write(frame)
+            self._painted = len(lines)
+        self.stream.flush()
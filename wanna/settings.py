@@ -3,10 +3,15 @@
 Settings and defaults
 """
 import os
+import threading
 import configparser
 
 from functools import partial
 
+from wanna.utils import parse_size
+from wanna.throttle import parse_rate
+from wanna.throttle import parse_schedule
+
 DEFAULT_SECTION = 'default'
 
 class Config(object):
@@ -14,6 +19,24 @@ class Config(object):
 
     ENCRYPTION_ALGORITHM = "AES256"
 
+    _loaded = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def load(cls, profile=None, vendor=None, path="~/.wanna/credentials"):
+        """Shared settings, parsed again only when the file changes"""
+        path = os.path.abspath(os.path.expanduser(path))
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        key = (profile, vendor, path)
+        with cls._lock:
+            loaded = cls._loaded.get(key)
+            if loaded is None or loaded[0] != mtime:
+                loaded = cls._loaded[key] = (mtime, cls(profile=profile, vendor=vendor, path=path))
+        return loaded[1]
+
     def __init__(self, profile=None, vendor=None, path="~/.wanna/credentials"):
         config = configparser.ConfigParser()
         config.default_section = DEFAULT_SECTION
@@ -31,7 +54,14 @@ class Config(object):
         self.BUCKET = get("bucket", fallback="mtp-cloudstorage")
         self.UPLOAD_PREFIX = get("upload_prefix", fallback="in")
         self.IGNORE_PREFIX = get_boolean("ignore_prefix", fallback=False)
+        self.CHECKSUM_ALGORITHM = get("checksum_algorithm", fallback="md5")
+        self.CHECKSUM_CACHE = get("checksum_cache", fallback="~/.wanna/checksums.db")
+        self.CHECKSUM_CACHE_SIZE = int(get("checksum_cache_size", fallback=100000))
+        self.KEY_INDEX = get("key_index", fallback="~/.wanna/index")
+        self.KEY_INDEX_TTL = int(get("key_index_ttl", fallback=3600))
+        self.PROFILE = profile
         self.VENDOR = DATACENTERS[self.PROVIDER](get)
+        self.TRANSFER = Transfer(get)
 
     def validate(self, config):
         if len(config.sections()) < 1:
@@ -43,6 +73,87 @@ class Config(object):
             if vendor not in DATACENTERS.keys():
                 raise ValueError("Invalid configuration file: Unsupported vendor '{}'".format(vendor))
 
+class Transfer(object):
+    """Transfer tuning
+
+    multipart_threshold -- files from this size on are split into parts (default 8MB)
+    multipart_chunksize -- part size or `auto` to derive it from the file size (default auto)
+    max_concurrency -- in-flight requests shared by all files of a run (default 10)
+    max_io_queue -- chunks buffered before they are written to disk (default 100)
+    max_pool_connections -- http connections kept open (default 2 * max_concurrency, the parts or
+        ranges of a run plus the requests of the files transferred next to them)
+    max_bandwidth -- bytes per second of all transfers, eg. 200MB/s (default unlimited)
+    bandwidth_schedule -- time of day limits, eg. 08:00-18:00=50MB/s, 22:00-06:00=off
+    bandwidth_file -- share the limit with other processes through this file (default per process)
+    stream_buffer_size -- memory of the parts of a stream in flight (default max_concurrency + 1 parts)
+    """
+
+    AUTO = "auto"
+    MIN_CHUNKSIZE = 8 * 1024 ** 2
+    MAX_CHUNKSIZE = 5 * 1024 ** 3
+    MAX_PARTS = 10000
+
+    def __init__(self, get=None, **overrides):
+        get = get or (lambda option, fallback=None: fallback)
+        self.MULTIPART_THRESHOLD = parse_size(get("multipart_threshold", fallback=self.MIN_CHUNKSIZE))
+        chunksize = get("multipart_chunksize", fallback=self.AUTO)
+        self.MULTIPART_CHUNKSIZE = chunksize if chunksize == self.AUTO else parse_size(chunksize)
+        self.MAX_CONCURRENCY = int(get("max_concurrency", fallback=10))
+        self.MAX_IO_QUEUE = int(get("max_io_queue", fallback=100))
+        self.MAX_POOL_CONNECTIONS = int(get("max_pool_connections", fallback=0)) or None
+        self.MAX_BANDWIDTH = parse_rate(get("max_bandwidth", fallback=None))
+        self.BANDWIDTH_SCHEDULE = parse_schedule(get("bandwidth_schedule", fallback=""))
+        self.BANDWIDTH_FILE = get("bandwidth_file", fallback=None) or None
+        self.STREAM_BUFFER_SIZE = parse_size(get("stream_buffer_size", fallback=0))
+        self.override(**overrides)
+
+    def override(
+        self,
+        multipart_threshold=None,
+        multipart_chunksize=None,
+        max_concurrency=None,
+        max_bandwidth=None,
+        stream_buffer_size=None,
+    ):
+        """Apply command line settings on top of the profile ones"""
+        if multipart_threshold:
+            self.MULTIPART_THRESHOLD = parse_size(multipart_threshold)
+        if multipart_chunksize:
+            self.MULTIPART_CHUNKSIZE = (
+                self.AUTO if multipart_chunksize == self.AUTO else parse_size(multipart_chunksize)
+            )
+        if max_concurrency:
+            self.MAX_CONCURRENCY = int(max_concurrency)
+        if max_bandwidth:
+            self.MAX_BANDWIDTH = parse_rate(max_bandwidth)
+        if stream_buffer_size:
+            self.STREAM_BUFFER_SIZE = parse_size(stream_buffer_size)
+        return self
+
+    @property
+    def max_pool_connections(self):
+        # up to max_concurrency parts or ranges, and as many files sending their
+        # own first GET or single PUT in the meantime
+        return self.MAX_POOL_CONNECTIONS or 2 * self.MAX_CONCURRENCY
+
+    def chunksize(self, size=None):
+        """Part size for an object of the given size
+
+        In auto mode the smallest power-of-two multiple of 8MB which keeps
+        the object under the 10,000 parts limit is used.
+        """
+        if self.MULTIPART_CHUNKSIZE != self.AUTO:
+            return self.MULTIPART_CHUNKSIZE
+        chunksize = self.MIN_CHUNKSIZE
+        while size and chunksize < self.MAX_CHUNKSIZE and size > chunksize * self.MAX_PARTS:
+            chunksize *= 2
+        return min(chunksize, self.MAX_CHUNKSIZE)
+
+    def stream_buffer_size(self, part_size):
+        """Bytes of a stream held in memory while its parts are uploaded"""
+        return self.STREAM_BUFFER_SIZE or (self.MAX_CONCURRENCY + 1) * part_size
+
+
 class AWS(object):
     """Aws specific settings"""
 
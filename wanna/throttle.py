@@ -0,0 +1,224 @@
+"""Bandwidth limit
+
+A token bucket shared by every part and file transferred by the process,
+and optionally by every process using the same bucket file. The bucket is
+kept as a single "theoretical arrival time" (GCRA): the time at which the
+bytes paid so far would have been sent at the allowed rate. A thread pays
+for its bytes by moving that time forward and sleeps (outside of any
+lock) when it is ahead of it.
+
+Threads count their bytes in a thread local and pay only once per grant
+(1/100s of the rate, 64kB to 1MB), so the lock is not taken per chunk.
+"""
+from wanna.utils import parse_size
+
+import io
+import os
+import re
+import time
+import logging
+import datetime
+import threading
+
+LOG = logging.getLogger("wanna:throttle")
+
+UNLIMITED = ("", "0", "off", "none", "unlimited")
+MIN_GRANT = 64 * 1024
+MAX_GRANT = 1024 ** 2
+
+
+def parse_rate(value):
+    """
+    Parse a transfer rate (eg. 200MB/s, 1.5GiB or unlimited).
+    Args:
+        value (str|int): size per second, units are binary as for sizes
+
+    Returns:
+        bytes per second as int, None when unlimited
+    """
+    if value is None or str(value).strip().lower() in UNLIMITED:
+        return None
+    rate = parse_size(re.sub(r"\s*/\s*s(ec)?\s*$", "", str(value), flags=re.IGNORECASE))
+    return rate or None
+
+
+def _parse_time(value):
+    hours, _, minutes = value.strip().partition(":")
+    return datetime.time(int(hours), int(minutes or 0))
+
+
+def parse_schedule(value):
+    """
+    Parse time of day limits (eg. 08:00-18:00=50MB/s, 22:00-06:00=off).
+    Args:
+        value (str): comma separated windows in local time, a window may wrap midnight
+
+    Returns:
+        tuple of (start, end, rate) with the rate in bytes per second or None
+    """
+    windows = []
+    for window in (value or "").split(","):
+        if not window.strip():
+            continue
+        try:
+            span, rate = window.split("=")
+            start, end = span.split("-")
+            windows.append((_parse_time(start), _parse_time(end), parse_rate(rate)))
+        except ValueError:
+            raise ValueError("Invalid bandwidth schedule: {}".format(window.strip()))
+    return tuple(windows)
+
+
+class Throttle(object):
+    """Token bucket limiting the bytes per second
+
+    Args:
+        rate (int): bytes per second outside of the schedule, None for unlimited
+        schedule (tuple): (start, end, rate) windows, see `parse_schedule`
+        path (str): bucket file shared with other processes, None for this process only
+        burst (float): seconds of unused bandwidth that can be caught up on
+    """
+
+    def __init__(self, rate=None, schedule=(), path=None, burst=0.1):
+        self.rate = rate
+        self.schedule = schedule
+        self.path = os.path.expanduser(path) if path else None
+        self.burst = burst
+        self._arrival = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._fd = None
+        # a shared bucket is in wall time, the only clock processes agree on
+        self._clock = time.time if self.path else time.monotonic
+
+    def rate_at(self, now=None):
+        """Allowed bytes per second at the given local time"""
+        if self.schedule:
+            now = (now or datetime.datetime.now()).time()
+            for start, end, rate in self.schedule:
+                if start <= now < end or (end <= start and (now >= start or now < end)):
+                    return rate
+        return self.rate
+
+    def _grant(self, rate):
+        return min(max(rate // 100, MIN_GRANT), MAX_GRANT) if rate else MAX_GRANT
+
+    def consume(self, amount):
+        """Account for `amount` bytes, blocks while the process is over the limit"""
+        local = self._local
+        pending = getattr(local, "pending", 0) + amount
+        grant = getattr(local, "grant", MIN_GRANT)
+        if pending < grant:
+            local.pending = pending
+            return
+        local.pending = 0
+        rate = self.rate_at()
+        local.grant = self._grant(rate)
+        if rate:
+            delay = self._reserve(pending, rate)
+            if delay > 0:
+                time.sleep(delay)
+
+    def _reserve(self, amount, rate):
+        """Pay for the bytes, returns how long to wait before sending more"""
+        with self._lock:
+            now = self._clock()
+            if self.path is None:
+                self._arrival = max(self._arrival, now) + float(amount) / rate
+                arrival = self._arrival
+            else:
+                arrival = self._reserve_shared(now, amount, rate)
+        return arrival - now - self.burst
+
+    def _reserve_shared(self, now, amount, rate):
+        import fcntl
+
+        if self._fd is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            try:
+                arrival = float(os.read(self._fd, 64) or 0)
+            except ValueError:
+                arrival = 0.0
+            arrival = max(arrival, now) + float(amount) / rate
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            os.ftruncate(self._fd, 0)
+            os.write(self._fd, repr(arrival).encode("ascii"))
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return arrival
+
+
+_THROTTLES = {}
+_THROTTLES_LOCK = threading.Lock()
+
+
+def shared_throttle(rate=None, schedule=(), path=None):
+    """Process wide throttle for the settings, None when nothing is limited"""
+    if rate is None and not any(limit for _, _, limit in schedule):
+        return None
+    key = (rate, schedule, path)
+    with _THROTTLES_LOCK:
+        throttle = _THROTTLES.get(key)
+        if throttle is None:
+            LOG.info("bandwidth limited to %s bytes/s", rate)
+            throttle = _THROTTLES[key] = Throttle(rate, schedule, path)
+        return throttle
+
+
+class ThrottledBody(object):
+    """Request body paying the throttle as the bytes are read from it
+
+    The bytes are paid in chunks of `chunk_size` before they are handed out,
+    so a part is sent at the allowed rate instead of being paid for once it
+    is already on the wire. Bytes read again, eg. when botocore rewinds the
+    body to retry or to compute a checksum, are not paid twice.
+
+    Args:
+        data (bytes): the whole body
+        throttle (Throttle): bandwidth limit the bytes are paid to
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, data, throttle):
+        self._body = io.BytesIO(data)
+        self._length = len(data)
+        self._throttle = throttle
+        self._paid = 0
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        data = self._body.read(size)
+        end = self._body.tell()
+        while self._paid < end:
+            amount = min(self.chunk_size, end - self._paid)
+            self._throttle.consume(amount)
+            self._paid += amount
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._body.seek(offset, whence)
+
+    def tell(self):
+        return self._body.tell()
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+
+def throttled_body(data, throttle):
+    """Body of a request for the bytes, paid to the throttle as it is sent unless it is None"""
+    if throttle is None:
+        return data
+    return ThrottledBody(data, throttle)
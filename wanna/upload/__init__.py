@@ -6,12 +6,15 @@ uploads to the cloud. It handles several things for the user:
 * Uploading a file in parallel
 * Progress callbacks to monitor transfers
 * Retries. When possible.
+* Streaming from a pipe, eg. stdin, without knowing the length
 """
+import sys
 
 
 def upload_files(
     path,
     vendor,
+    key=None,
     bucket=None,
     use_encryption=True,
     add_checksum=False,
@@ -19,30 +22,65 @@ def upload_files(
     prefix=None,
     ignore_prefix=False,
     humanized=False,
-    profile=None
+    profile=None,
+    jobs=1,
+    part_size=None,
+    concurrency=None,
+    multipart_threshold=None,
+    checksum_algorithm=None,
+    max_bandwidth=None,
+    stats_json=None,
+    stats_textfile=None,
+    buffer_size=None
 ):
 
     """Uploads file to the cloud.
 
     Args:
-        path (str): path to the file or folder
+        path (str): path to the file or folder, - to read from stdin
+        key (str): key of the object read from stdin
         vendor (str): datacenter name: 'aws|softlayer|azure|googlecloud'
         use_encryption (bool): should the file be server side encrypted
         add_checksum (bool): should the md5 checksum be uploaded next to the original file
-        progress (bool): should the transfer be monitored
+        progress (bool|str): should the transfer be monitored, "log" for periodic lines
+        jobs (int): number of files uploaded in parallel
+        part_size (str): part size, eg. 64MB or 'auto' (default from the profile)
+        concurrency (int): number of parallel requests (default from the profile)
+        multipart_threshold (str): size from which files are split into parts
+        checksum_algorithm (str): md5|md5-etag|sha256|crc32c|xxh3|blake3 (default from the profile)
+        max_bandwidth (str): bytes per second of all transfers, eg. 200MB/s (default from the profile)
+        stats_json (str): write the metrics of the run to this json file
+        stats_textfile (str): write the metrics of the run to this node_exporter textfile
+        buffer_size (str): memory of the parts of a stream in flight, eg. 256MB (default from the profile)
 
     Returns:
         tuple - confirmation(s) from the vendor
     """
     from wanna import setup_vendor
+    from wanna.metrics import report
 
+    if path == "-" and not key:
+        raise ValueError("the key of the object is needed to upload from stdin")
+    if path != "-" and key:
+        raise ValueError("a key can only be given to upload from stdin")
     vendor = setup_vendor(
         vendor,
         bucket=bucket,
         use_encryption=use_encryption,
         ignore_prefix=ignore_prefix,
         humanized=humanized,
-        profile=profile
+        profile=profile,
+        part_size=part_size,
+        concurrency=concurrency,
+        multipart_threshold=multipart_threshold,
+        checksum_algorithm=checksum_algorithm,
+        max_bandwidth=max_bandwidth,
+        buffer_size=buffer_size
     )
 
-    vendor.upload_files(path, add_checksum=add_checksum, progress=progress)
+    with report(vendor, "upload", stats_json, stats_textfile) as metrics:
+        if path == "-":
+            return vendor.upload_stream(
+                sys.stdin.buffer, key, add_checksum=add_checksum, progress=progress, metrics=metrics
+            )
+        vendor.upload_files(path, add_checksum=add_checksum, progress=progress, jobs=jobs, metrics=metrics)
@@ -5,6 +5,8 @@ import threading
 import hashlib
 import contextlib
 import signal
+import heapq
+import itertools
 
 
 suffixes = {
@@ -43,30 +45,83 @@ def humanize(value, binary=True, format="%.1f"):
     return (format + " %s") % ((base * bytes / unit), s)
 
 
-def finder(input, collection, fuzzy=False, accessor=lambda x: x):
+def parse_size(value):
+    """
+    Parse a human readable size (eg. 64MB, 1.5 GiB or 8388608).
+    Args:
+        value (str|int): size with an optional unit, units are binary (1 MB = 1024 kB)
+
+    Returns:
+        number of bytes as int
+    """
+    if isinstance(value, int):
+        return value
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([kmgtpezy]?)i?b?\s*$", str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError("Invalid size: {}".format(value))
+    number, unit = match.groups()
+    exponent = "kmgtpezy".find(unit.lower()) + 1 if unit else 0
+    return int(float(number) * 1024 ** exponent)
+
+
+REGEX_SPECIAL = set(".^$*+?{}[]\\|()")
+
+
+def _literal_prefix(pattern):
+    """Leading characters every match of the regex contains"""
+    if "|" in pattern:
+        return ""
+    prefix = ""
+    for index, char in enumerate(pattern):
+        if char in REGEX_SPECIAL:
+            # a quantifier makes the character before it optional
+            return prefix[:-1] if char in "*?{" else prefix
+        prefix += char
+    return prefix
+
+
+def finder(input, collection, fuzzy=False, accessor=lambda x: x, limit=None, ordered=True):
     """
     Args:
         input (str): A partial string which is typically entered by a user.
         collection (iterable): A collection of strings which will be filtered
              based on the `input`.
         fuzzy (bool): perform a fuzzy search (default=False)
+        limit (int): return only the `limit` best suggestions, kept in a heap
+        ordered (bool): rank the suggestions by match length and position,
+             otherwise they are yielded as soon as they are found
 
     Returns:
         suggestions (generator): A generator object that produces a list of
          suggestions narrowed down from `collection` using the `input`.
     """
-    suggestions = []
     input = str(input) if not isinstance(input, str) else input
     pat = input
     if fuzzy:
         pat = ".*?".join(map(re.escape, input))
+    literal = not fuzzy and not REGEX_SPECIAL.intersection(input)
+    prefix = (input[:1] if fuzzy else _literal_prefix(pat)).lower()
     regex = re.compile(pat, re.IGNORECASE)
-    for item in collection:
-        r = regex.search(accessor(item))
-        if r:
-            suggestions.append((len(r.group()), r.start(), accessor(item), item))
 
-    return (z[-1] for z in sorted(suggestions))
+    def matches():
+        for count, item in enumerate(collection):
+            value = accessor(item)
+            lowered = value.lower()
+            if prefix not in lowered:
+                continue
+            if literal:
+                yield len(input), lowered.index(prefix), value, count, item
+                continue
+            r = regex.search(value)
+            if r:
+                yield len(r.group()), r.start(), value, count, item
+
+    if not ordered:
+        suggestions = (z[-1] for z in matches())
+        return itertools.islice(suggestions, limit) if limit is not None else suggestions
+    if limit is not None:
+        return (z[-1] for z in heapq.nsmallest(limit, matches()))
+    return (z[-1] for z in sorted(matches()))
 
 
 def md5sum(filepath):
@@ -85,6 +140,79 @@ def md5sum(filepath):
     return md5.hexdigest()
 
 
+class TransferCancelled(Exception):
+    """The transfer was cancelled by the caller"""
+
+
+class IntegrityError(Exception):
+    pass
+
+
+def scan_files(root):
+    """
+    Walk a directory tree.
+    Args:
+        root (str): path to the directory
+
+    Returns:
+        generator of (name, path, size, mtime) for every file, where name is
+        the path relative to root with '/' separators. Partial downloads
+        (`.part` files with their `.part.state`) are skipped.
+    """
+    for dirpath, _, filenames in os.walk(root):
+        names = set(filenames)
+        for filename in sorted(filenames):
+            if filename.endswith(".part.state") or filename + ".state" in names:
+                continue
+            path = os.path.join(dirpath, filename)
+            stat = os.stat(path)
+            name = os.path.relpath(path, root).replace(os.sep, "/")
+            yield name, path, stat.st_size, stat.st_mtime
+
+
+def local_path(root, name):
+    """
+    Local path of a key below a directory.
+    Args:
+        root (str): destination directory
+        name (str): key, or the part of it below a prefix, with '/' separators
+
+    Returns:
+        the normalised path of the key below root
+
+    Raises:
+        ValueError: the key leaves root, eg. run1/../../.bashrc
+    """
+    path = os.path.normpath(os.path.join(root, *name.split("/")))
+    base = os.path.abspath(root)
+    if os.path.abspath(path) == base or os.path.commonpath([base, os.path.abspath(path)]) != base:
+        raise ValueError("{} escapes {}".format(name, root))
+    return path
+
+
+def prefetch(iterable):
+    """
+    Iterate in a background thread, one item ahead of the consumer.
+    Args:
+        iterable: eg. the pages of a listing, every next() is a request
+
+    Returns:
+        generator of the same items, item N+1 is fetched while N is consumed
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    iterator = iter(iterable)
+    done = object()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(next, iterator, done)
+        while True:
+            item = future.result()
+            if item is done:
+                return
+            future = pool.submit(next, iterator, done)
+            yield item
+
+
 def touch(fname):
     try:
         os.utime(fname, None)
@@ -94,6 +222,10 @@ def touch(fname):
 
 @contextlib.contextmanager
 def ignore_ctrl_c():
+    if threading.current_thread() is not threading.main_thread():
+        # signals belong to the main thread, eg. calls from a worker of wanna.aio
+        yield
+        return
     original = signal.signal(signal.SIGINT, signal.SIG_IGN)
     try:
         yield
@@ -1,33 +1,91 @@
 """S3 service from aws
 
 Features:
-   * upload object
-   * download object
+   * upload object, or a stream of unknown length
+   * download object, or every object under a prefix or matching a pattern, or to a pipe
    * list objects
    * delete object
-   * rename object
+   * rename object, or move a whole prefix with server side copies
    * get object size
    * check the integrity via control sum
-   * simple fuzzy search
+   * simple fuzzy search, answered from a local key index
+   * resume interrupted multipart uploads and ranged downloads
+   * incremental directory synchronisation
 """
-from wanna.utils import md5sum
-from wanna.utils import ProgressPercentage
 from wanna.utils import ignore_ctrl_c
-from wanna.utils import touch
 from wanna.utils import finder
+from wanna.utils import scan_files
+from wanna.utils import prefetch
+from wanna.utils import local_path
+from wanna.hashing import Checksum
+from wanna.hashing import hash_file
+from wanna.hashing import new_digest
+from wanna.hashing import get_algorithm
+from wanna.cache import ChecksumCache
+from wanna.cache import file_identity
+from wanna.index import KeyIndex
+from wanna.throttle import shared_throttle
+from wanna.throttle import throttled_body
+from wanna.progress import Progress
+from wanna.metrics import bound_pool
+from wanna.metrics import timed
+from wanna.metrics import hashing_time
 
 from wanna.settings import Config
+from wanna.journal import UploadJournal
+from wanna.vendors.aws.multipart import MultipartUpload
+from wanna.vendors.aws.ranged import RangedDownload
+from wanna.vendors.aws.servercopy import MultipartCopy
+from wanna.vendors.aws.stream import StreamUpload
+from wanna.vendors.aws.stream import StreamDownload
 
 from boto3.s3.transfer import S3Transfer
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config as BotoConfig
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+from dateutil.tz import tzutc
+from datetime import datetime
+from datetime import timedelta
+from functools import partial
+from calendar import timegm
 
+import copy
 import glob
+import contextlib
+import fnmatch
+import itertools
 import boto3
 import os.path
+import sys
 import logging
+import threading
 
 LOG = logging.getLogger("wanna:aws")
 
+GLOB_CHARS = set("*?[")
+
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def shared_client(key, factory):
+    """Process wide client for the key, so connections are reused across vendors
+
+    Args:
+        key (tuple): vendor, profile, bucket, endpoint and credentials
+        factory (callable): creates the client on first use
+    """
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            LOG.debug("new client for %s", key[:4])
+            client = _CLIENTS[key] = factory()
+        return client
+
+
 class ServerSideEncryption:
     # More information: https://docs.aws.amazon.com/AmazonS3/latest/dev/UsingEncryption.html
 
@@ -41,7 +99,10 @@ class ServerSideEncryption:
 class _AWS(object):
     """AWS s3 service"""
 
+    # checksum sidecar suffix, kept for every algorithm as the sidecar names its algorithm
     hash_checksum = ".md5"
+    list_page_size = 1000
+    delete_batch_size = 1000
     signature_version = "s3v4"
     region_name = "eu-central-1"
 
@@ -54,13 +115,40 @@ class _AWS(object):
         return "aws"
 
     def _get_config(self, config):
-        return {
+        kwargs = {
             "aws_access_key_id": config.VENDOR.API_KEY,
             "aws_secret_access_key": config.VENDOR.API_SECRET,
             "config": BotoConfig(
-                signature_version=self.signature_version, region_name=self.region_name
+                signature_version=self.signature_version,
+                region_name=self.region_name,
+                max_pool_connections=self.transfer_settings.max_pool_connections,
             ),
         }
+        endpoint_url = getattr(config.VENDOR, "ENDPOINT_URL", None)
+        if endpoint_url:
+            kwargs["endpoint_url"] = endpoint_url
+            if config.VENDOR.ROOT_CA_BUNDLE:
+                kwargs["verify"] = config.VENDOR.ROOT_CA_BUNDLE
+        return kwargs
+
+    def _client_key(self, profile, kwargs):
+        """Clients are shared by vendors with the same key"""
+        return (
+            self.name,
+            profile,
+            self._bucket,
+            kwargs.get("endpoint_url"),
+            kwargs["aws_access_key_id"],
+            kwargs["aws_secret_access_key"],
+            self.transfer_settings.max_pool_connections,
+        )
+
+    @property
+    def resource(self):
+        """boto3 resource, created on first use"""
+        if self._resource is None:
+            self._resource = boto3.resource(self.service, **self._get_config(self.config))
+        return self._resource
 
     def __init__(
         self,
@@ -69,18 +157,49 @@ class _AWS(object):
         ignore_prefix=False,
         humanized=False,
         profile=None,
-        config=None
+        config=None,
+        part_size=None,
+        concurrency=None,
+        multipart_threshold=None,
+        checksum_algorithm=None,
+        max_bandwidth=None,
+        buffer_size=None,
     ):
         LOG.info("Profile '{}'".format(profile) if profile else "No profile selected")
-        config = config if config else Config(profile=profile)
+        config = config if config else Config.load(profile=profile)
+        self.transfer_settings = copy.copy(config.TRANSFER).override(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=part_size,
+            max_concurrency=concurrency,
+            max_bandwidth=max_bandwidth,
+            stream_buffer_size=buffer_size,
+        )
+        self.throttle = shared_throttle(
+            self.transfer_settings.MAX_BANDWIDTH,
+            self.transfer_settings.BANDWIDTH_SCHEDULE,
+            self.transfer_settings.BANDWIDTH_FILE,
+        )
         self._bucket = config.BUCKET if not bucket else bucket
         self._default_prefix = os.path.join(config.UPLOAD_PREFIX, config.PARTNER_NAME)
         self._encrypt = use_encryption
         self._encryption_type = ServerSideEncryption.CUSTOMER_PROVIDED_KEY
-        self.client = boto3.client(self.service, **self._get_config(config))
-        self.resource = boto3.resource("s3", **self._get_config(config))
+        client_kwargs = self._get_config(config)
+        self.client = shared_client(
+            self._client_key(profile, client_kwargs),
+            partial(boto3.client, self.service, **client_kwargs),
+        )
+        self._resource = None
         self._transfer = S3Transfer
         self._checksum = None
+        self.journal = UploadJournal()
+        self.checksum_algorithm = get_algorithm(checksum_algorithm or config.CHECKSUM_ALGORITHM).name
+        self.checksum_cache = ChecksumCache(config.CHECKSUM_CACHE, config.CHECKSUM_CACHE_SIZE)
+        self.key_index = KeyIndex(
+            os.path.join(config.KEY_INDEX, "{}-{}.db".format(profile or config.PROFILE or "default", self._bucket))
+            if config.KEY_INDEX
+            else None,
+            ttl=config.KEY_INDEX_TTL,
+        )
         self.ignore_prefix = ignore_prefix or config.IGNORE_PREFIX
         self.config = config
         self._humanized = humanized
@@ -131,85 +250,550 @@ class _AWS(object):
             key = key + self.hash_checksum
         return key
 
-    @staticmethod
-    def get_checksum(path):
-        """Calculate control sum"""
-        return md5sum(path)
+    def get_prefix_key(self, prefix, ignore_prefix=False):
+        """Get the key prefix of a 'directory', below the upload prefix unless ignored"""
+        if ignore_prefix or self.ignore_prefix or prefix.startswith(self._default_prefix):
+            return prefix
+        return os.path.join(self._default_prefix, prefix)
+
+    def _checksum_part_size(self, size):
+        if get_algorithm(self.checksum_algorithm).parted:
+            return self.transfer_settings.chunksize(size)
+        return None
+
+    def get_checksum(self, path, algorithm=None, part_size=None, metrics=None):
+        """Calculate control sum, unless the file is unchanged since it was hashed
+
+        Args:
+            algorithm (str): by default the one of the profile
+            part_size (int): part size of part based algorithms
+            metrics (Metrics): the hashing time is added to the metrics of the run
+        """
+        algorithm = algorithm or self.checksum_algorithm
+        identity = file_identity(path)
+        if algorithm == self.checksum_algorithm and part_size is None:
+            part_size = self._checksum_part_size(identity[2])
+        checksum = self.checksum_cache.get(path, algorithm, part_size, identity=identity)
+        if checksum is None:
+            with hashing_time(metrics):
+                checksum = str(
+                    hash_file(
+                        path,
+                        algorithm,
+                        part_size=part_size,
+                        workers=self.transfer_settings.MAX_CONCURRENCY,
+                    )
+                )
+            self.checksum_cache.put(path, algorithm, part_size, checksum, identity=identity)
+        return checksum
 
-    def upload_checksum(self, path, ignore_prefix=False, prefix=None):
-        """Upload control sum for the given file"""
+    def upload_checksum(self, path, ignore_prefix=False, prefix=None, key=None, checksum=None):
+        """Upload control sum for the given file
+
+        The checksum is calculated unless it is given, eg. when it was
+        computed while the file was uploaded.
+        """
         LOG.debug('uploading checksum for: %s', path)
-        key = self.get_obj_key(path, md5=True, ignore_prefix=ignore_prefix, prefix=prefix)
-        checksum = self.get_checksum(path)
+        if key is None:
+            key = self.get_obj_key(path, md5=True, ignore_prefix=ignore_prefix, prefix=prefix)
+        else:
+            key = key + self.hash_checksum
+        checksum = checksum or self.get_checksum(path)
         response = self.client.put_object(Bucket=self._bucket, Key=key, Body=checksum)
-        LOG.info("checksum ({}): {}".format(self.hash_checksum, checksum))
+        self._index_object(key, len(checksum), response.get("ETag"))
+        LOG.info("checksum ({}): {}".format(self.checksum_algorithm, checksum))
         return response
 
+    @contextlib.contextmanager
+    def collect_metrics(self, metrics):
+        """Count the retries of the client for the run of `metrics` during the block
+
+        The metrics are not kept by the vendor, which is shared by the whole
+        process: every transfer of the run is given them.
+        """
+        metrics.labels["bucket"] = self._bucket
+        metrics.attach(self.client)
+        try:
+            yield metrics
+        finally:
+            metrics.detach(self.client)
+
+    def _get_transfer_config(self, size=None):
+        """Transfer settings for an object of the given size"""
+        settings = self.transfer_settings
+        return TransferConfig(
+            multipart_threshold=settings.MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.chunksize(size),
+            max_concurrency=settings.MAX_CONCURRENCY,
+            max_io_queue=settings.MAX_IO_QUEUE,
+        )
+
+    def _throttled(self, callback):
+        """Progress callback which also holds the transfer to the bandwidth limit"""
+        if self.throttle is None:
+            return callback
+
+        def throttled(amount):
+            callback(amount)
+            self.throttle.consume(amount)
+
+        return throttled
+
+    def _upload_file(
+        self,
+        transfer,
+        parts,
+        item,
+        key=None,
+        add_checksum=False,
+        progress=False,
+        encryption_key=None,
+        ignore_prefix=False,
+        prefix=None,
+        callback=None,
+        cancel=None,
+        metrics=None,
+    ):
+        """Upload a single file to `key`, by default named after the file
+
+        Small files go through the shared transfer manager, large ones are
+        sent as a resumable multipart upload whose parts run in `parts`.
+        With `add_checksum` the checksum is computed from the bytes read for
+        the upload, so every file is read from disk only once, or taken from
+        the checksum cache when the file did not change. While metrics are
+        collected a small file is sent with a PutObject of this thread, so
+        its retries are counted for the run.
+
+        Args:
+            progress (Progress): renderer of the run
+            callback (callable): called with the bytes sent, instead of the progress renderer
+            cancel (threading.Event): once set a multipart upload stops and is aborted
+            metrics (Metrics): metrics of the run
+        """
+        if key is None:
+            key = self.get_obj_key(os.path.basename(item), ignore_prefix=ignore_prefix, prefix=prefix)
+        extra_args = (
+            {}
+            if self._encrypt is False or (self._encrypt and self._encryption_type == ServerSideEncryption.S3_MANAGED_KEY)
+            else self._get_extra_args(encryption_key=encryption_key)
+        )
+
+        LOG.debug("uploading %s", item)
+        identity = file_identity(item)
+        size = identity[2]
+        progress_callback = callback or (progress.track(item, size) if progress else lambda x: None)
+        part_size = self._checksum_part_size(size)
+        checksum = (
+            self.checksum_cache.get(item, self.checksum_algorithm, part_size, identity=identity)
+            if add_checksum
+            else None
+        )
+        digest = (
+            new_digest(self.checksum_algorithm, self.transfer_settings.chunksize(size))
+            if add_checksum and checksum is None
+            else None
+        )
+        if metrics is not None:
+            digest = metrics.timed_digest(digest)
+        if size >= self.transfer_settings.MULTIPART_THRESHOLD:
+            response = MultipartUpload(
+                self.client,
+                self._bucket,
+                key,
+                item,
+                part_size=self.transfer_settings.chunksize(size),
+                executor=parts,
+                journal=self.journal,
+                extra_args=extra_args,
+                callback=progress_callback,
+                digest=digest,
+                queue_size=self.transfer_settings.MAX_CONCURRENCY,
+                cancel=cancel,
+                throttle=self.throttle,
+                metrics=metrics,
+            ).run()
+        elif digest is not None or metrics is not None:
+            with open(item, "rb") as source:
+                body = source.read()
+            if digest is not None:
+                digest.update(0, body)
+            with timed(metrics, "put_object"):
+                response = self.client.put_object(
+                    Bucket=self._bucket, Key=key, Body=throttled_body(body, self.throttle), **extra_args
+                )
+            progress_callback(size)
+        else:
+            response = {}
+            transfer.upload_file(
+                item,
+                self._bucket,
+                key,
+                extra_args=extra_args,
+                callback=self._throttled(progress_callback),
+            )
+        if metrics is not None:
+            metrics.add_file(size)
+        self._index_object(key, size, response.get("ETag"))
+        if digest is not None:
+            checksum = str(digest.checksum())
+            self.checksum_cache.put(item, self.checksum_algorithm, part_size, checksum, identity=identity)
+        if add_checksum:
+            self.upload_checksum(item, key=key, checksum=checksum)
+
     def upload_files(
-        self, path, add_checksum=False, progress=False, encryption_key=None, ignore_prefix=False, prefix=None
+        self,
+        path,
+        add_checksum=False,
+        progress=False,
+        encryption_key=None,
+        ignore_prefix=False,
+        prefix=None,
+        jobs=1,
+        metrics=None,
     ):
-        """Upload files"""
+        """Upload files
+
+        All files of a run share one transfer manager and one pool for
+        multipart parts, so `max_concurrency` is a global budget of in-flight
+        parts: the files uploaded at the same time compete for the same
+        slots. A file below the multipart threshold is sent with a single PUT
+        by its own job, so up to `jobs` more requests are in flight, which
+        the connection pool (2 * `max_concurrency` by default) has room for.
+        Interrupted multipart uploads are resumed from the journal.
+
+        Args:
+            jobs (int): number of files uploaded in parallel, bounded by
+                `max_concurrency`
+            metrics (Metrics): metrics of the run, see wanna.metrics.report
+        """
 
         def get_files():
             if os.path.isdir(path):
                 return glob.glob(os.path.join(path, "*"))
             return [path]
 
-        for item in get_files():
-            itemname = os.path.basename(item)
-            key = self.get_obj_key(itemname, ignore_prefix=ignore_prefix, prefix=prefix)
-            progress_callback = (
-                ProgressPercentage(item, humanized=self._humanized)
-                if progress
-                else lambda x: None
-            )
-            extra_args = (
-                {}
-                if self._encrypt is False or (self._encrypt and self._encryption_type == ServerSideEncryption.S3_MANAGED_KEY)
-                else self._get_extra_args(encryption_key=encryption_key)
-            )
+        self._upload_many(
+            [(item, None) for item in get_files()],
+            jobs=jobs,
+            add_checksum=add_checksum,
+            progress=progress,
+            encryption_key=encryption_key,
+            ignore_prefix=ignore_prefix,
+            prefix=prefix,
+            metrics=metrics,
+        )
 
-            with ignore_ctrl_c():
-                with self._transfer(self.client) as transfer:
-                    LOG.debug("uploading %s", item)
-                    transfer.upload_file(
-                        item,
-                        self._bucket,
-                        key,
-                        extra_args=extra_args,
-                        callback=progress_callback,
-                    )
-            print("")
-            if add_checksum:
-                self.upload_checksum(item, ignore_prefix=ignore_prefix, prefix=prefix)
+    def _upload_many(self, items, jobs=1, progress=False, metrics=None, **options):
+        """Upload (path, key) pairs through shared pools, see upload_files"""
+        concurrency = self.transfer_settings.MAX_CONCURRENCY
+        jobs = max(1, min(jobs or 1, len(items), concurrency))
+
+        with ignore_ctrl_c():
+            with self._transfer(self.client, config=self._get_transfer_config()) as transfer:
+                with bound_pool(concurrency, metrics) as parts:
+                    with self._progress(progress) as renderer:
+
+                        def upload(item):
+                            path, key = item
+                            return self._upload_file(
+                                transfer, parts, path, key=key, progress=renderer, metrics=metrics, **options
+                            )
+
+                        if jobs == 1:
+                            for item in items:
+                                upload(item)
+                        else:
+                            LOG.info("uploading {} files, {} at a time".format(len(items), jobs))
+                            with bound_pool(jobs, metrics) as files:
+                                for _ in files.map(upload, items):
+                                    pass
+
+    def open(
+        self,
+        key,
+        mode="wb",
+        size=None,
+        add_checksum=False,
+        encryption_key=None,
+        ignore_prefix=False,
+        prefix=None,
+        progress=None,
+        metrics=None,
+    ):
+        """Writer streaming to `key`, the object exists once it is closed
 
-    def search(self, term, fuzzy=False):
-        """Identical or Fuzzy search for the object(s) using given term"""
-        bucket = self.resource.Bucket(self._bucket)
-        for obj in finder(term, (obj.key for obj in bucket.objects.all()), fuzzy=fuzzy):
+        The bytes are uploaded in parts while they are written, the length
+        does not need to be known. Leaving the `with` block on an exception
+        aborts the upload.
+
+            with vendor.open("run1/sample.bam", "wb") as out:
+                for chunk in produce():
+                    out.write(chunk)
+
+        Args:
+            size (int): expected size, if known, to choose the part size
+            add_checksum (bool): upload the checksum computed from the written bytes
+            progress (Progress): renderer of the run
+            metrics (Metrics): metrics of the run
+
+        Returns:
+            StreamUpload
+        """
+        if mode != "wb":
+            raise ValueError("invalid mode: {}".format(mode))
+        key = self.get_obj_key(key, ignore_prefix=ignore_prefix, prefix=prefix)
+        extra_args = (
+            {}
+            if self._encrypt is False or (self._encrypt and self._encryption_type == ServerSideEncryption.S3_MANAGED_KEY)
+            else self._get_extra_args(encryption_key=encryption_key)
+        )
+        part_size = self.transfer_settings.chunksize(size)
+        digest = new_digest(self.checksum_algorithm, part_size) if add_checksum else None
+        if metrics is not None:
+            digest = metrics.timed_digest(digest)
+        tracked = progress.track(key, None) if progress else None
+
+        def complete(upload):
+            if tracked is not None:
+                tracked.finish()
+            if metrics is not None:
+                metrics.add_file(upload.size)
+            self._index_object(key, upload.size, upload.response.get("ETag"))
+            if digest is not None:
+                self.upload_checksum(key, key=key, checksum=str(digest.checksum()))
+
+        LOG.debug("streaming to %s", key)
+        return StreamUpload(
+            self.client,
+            self._bucket,
+            key,
+            part_size,
+            max_workers=self.transfer_settings.MAX_CONCURRENCY,
+            extra_args=extra_args,
+            buffer_size=self.transfer_settings.stream_buffer_size(part_size),
+            digest=digest,
+            callback=tracked,
+            throttle=self.throttle,
+            metrics=metrics,
+            on_complete=complete,
+        )
+
+    def upload_stream(
+        self, stream, key, add_checksum=False, progress=False, encryption_key=None, chunk_size=1024 ** 2, metrics=None
+    ):
+        """Upload everything read from a binary stream, eg. stdin, to `key`
+
+        Returns:
+            int - bytes uploaded
+        """
+        with self._progress(progress) as renderer:
+            with self.open(
+                key,
+                "wb",
+                add_checksum=add_checksum,
+                encryption_key=encryption_key,
+                progress=renderer,
+                metrics=metrics,
+            ) as upload:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    upload.write(chunk)
+        return upload.size
+
+    @contextlib.contextmanager
+    def _progress(self, progress, stream=None):
+        """Progress renderer of a run
+
+        Args:
+            progress (bool|str|Progress): True for the progress bars, "log" for
+                periodic lines, or the renderer of an outer run
+            stream (file): output of the renderer, default stdout
+        """
+        if not progress or isinstance(progress, Progress):
+            yield progress or None
+            return
+        with Progress(stream=stream, humanized=self._humanized, log=progress == "log") as renderer:
+            yield renderer
+
+    def list_uploads(self, prefix=None):
+        """List multipart uploads in progress"""
+        journaled = set(entry.upload_id for entry in self.journal.entries())
+        kwargs = {"Bucket": self._bucket}
+        if not self.ignore_prefix:
+            kwargs["Prefix"] = prefix or self._default_prefix
+        paginator = self.client.get_paginator("list_multipart_uploads")
+        for page in paginator.paginate(**kwargs):
+            for upload in page.get("Uploads", []):
+                yield {
+                    "date": upload["Initiated"],
+                    "name": upload["Key"],
+                    "upload_id": upload["UploadId"],
+                    "resumable": upload["UploadId"] in journaled,
+                }
+
+    def abort_stale_uploads(self, older_than=24, prefix=None):
+        """Abort multipart uploads started more than `older_than` hours ago"""
+        cutoff = datetime.now(tzutc()) - timedelta(hours=older_than)
+        for upload in list(self.list_uploads(prefix=prefix)):
+            if upload["date"] < cutoff:
+                LOG.info("aborting upload {upload_id} of {name}".format(**upload))
+                self.client.abort_multipart_upload(
+                    Bucket=self._bucket, Key=upload["name"], UploadId=upload["upload_id"]
+                )
+                self.journal.discard(upload["upload_id"])
+                yield upload
+
+    def _index_object(self, key, size, etag=None):
+        """Record an object written by wanna in the key index"""
+        self.key_index.update(
+            [{"Key": key, "Size": size, "LastModified": datetime.now(tzutc()), "ETag": etag or ""}]
+        )
+
+    def refresh_index(self):
+        """Replace the key index with a listing of the whole bucket"""
+        LOG.info("indexing the whole bucket %s", self._bucket)
+        self.key_index.rebuild(self._iter_objects(""))
+
+    def _indexed(self, refresh=False):
+        """Key index refreshed when stale, None when the index is disabled"""
+        if not self.key_index.enabled:
+            return None
+        if refresh or self.key_index.is_stale():
+            self.refresh_index()
+        return self.key_index
+
+    def search(self, term, fuzzy=False, refresh=False, limit=None, ordered=True):
+        """Identical or Fuzzy search for the object(s) using given term
+
+        Args:
+            refresh (bool): list the whole bucket again instead of trusting the key index
+            limit (int): only the best `limit` matches, or the first ones when not `ordered`
+            ordered (bool): best matches first, otherwise in key order as they are found
+        """
+        index = self._indexed(refresh)
+        if index is not None:
+            keys = (el["name"] for el in index.keys())
+        else:
+            keys = (obj.key for obj in self.resource.Bucket(self._bucket).objects.all())
+        for obj in finder(term, keys, fuzzy=fuzzy, limit=limit, ordered=ordered):
             yield obj
 
+    def _copy_args(self, encryption_key=None):
+        """Encryption parameters of a copy and of the copied object"""
+        extra = self._get_extra_args(encryption_key)
+        source = {}
+        if extra:
+            source = dict(
+                CopySourceSSECustomerAlgorithm=extra["SSECustomerAlgorithm"],
+                CopySourceSSECustomerKey=extra["SSECustomerKey"],
+            )
+        return extra, source
+
+    def _copy_object(self, parts, source, key, size, extra_args, source_args, head=None):
+        """Copy `source` to `key` within the bucket
+
+        Small objects are copied with a single CopyObject, large ones with
+        parallel UploadPartCopy in the shared `parts` pool.
+        """
+        if size < self.transfer_settings.MULTIPART_THRESHOLD:
+            args = dict(extra_args, **source_args)
+            response = self.client.copy_object(
+                Bucket=self._bucket, Key=key, CopySource={"Bucket": self._bucket, "Key": source}, **args
+            )
+            etag = response["CopyObjectResult"]["ETag"]
+        else:
+            # CopyObject keeps the metadata by itself, a multipart copy has to be told
+            head = head or self.client.head_object(Bucket=self._bucket, Key=source, **extra_args)
+            args = dict(extra_args, Metadata=head.get("Metadata", {}))
+            if head.get("ContentType"):
+                args["ContentType"] = head["ContentType"]
+            response = MultipartCopy(
+                self.client,
+                self._bucket,
+                source,
+                key,
+                size,
+                part_size=self.transfer_settings.chunksize(size),
+                executor=parts,
+                extra_args=args,
+                source_args=source_args,
+            ).run()
+            etag = response["ETag"]
+        self._index_object(key, size, etag)
+        return response
+
     def rename_object(self, old_prefix, new_prefix, encryption_key=None):
-        """Rename object"""
+        """Rename object
+
+        Raises:
+            ClientError: the original could not be deleted, the copy is left in place
+        """
         if old_prefix == new_prefix:
             LOG.info(":renaming skipped, old and new name are the same")
             return
 
         LOG.warning(":ignoring all prefixes")
-        copy_source = {"Bucket": self._bucket, "Key": old_prefix}
-        extra = self._get_extra_args(encryption_key)
-        if self._encrypt and self._encryption_type != ServerSideEncryption.S3_MANAGED_KEY:
-            extra.update(
-                dict(
-                    CopySourceSSECustomerAlgorithm=self.config.ENCRYPTION_ALGORITHM,
-                    CopySourceSSECustomerKey=self.get_encryption_key(encryption_key),
-                )
-            )
+        extra_args, source_args = self._copy_args(encryption_key)
+        head = self.client.head_object(Bucket=self._bucket, Key=old_prefix, **extra_args)
 
         with ignore_ctrl_c():
             LOG.info(":renaming")
-            self.client.copy(copy_source, self._bucket, new_prefix, ExtraArgs=extra)
-            self.delete_file(old_prefix, ignore_prefix=True)
+            with ThreadPoolExecutor(max_workers=self.transfer_settings.MAX_CONCURRENCY) as parts:
+                self._copy_object(
+                    parts, old_prefix, new_prefix, head["ContentLength"], extra_args, source_args, head=head
+                )
+            _, errors = self.delete_files([old_prefix])
+        if errors:
+            # as DeleteObject would have raised it
+            raise ClientError({"Error": errors[0]}, "DeleteObjects")
+
+    def rename_prefix(self, old_prefix, new_prefix, encryption_key=None, dry_run=False):
+        """Move every object under `old_prefix` to `new_prefix`
+
+        The listing is planned first, then the objects are copied in
+        parallel on the server side. The originals are deleted in
+        DeleteObjects batches only once every copy succeeded, a failed copy
+        leaves all of them in place.
+
+        Args:
+            dry_run (bool): only plan the moves
+
+        Returns:
+            tuple - the (old key, new key, size) moves and the errors of the deletes
+        """
+        if not old_prefix:
+            raise ValueError("refusing to move the whole bucket")
+        if old_prefix == new_prefix:
+            LOG.info(":renaming skipped, old and new prefix are the same")
+            return [], []
+        plan = [
+            (obj["Key"], new_prefix + obj["Key"][len(old_prefix):], obj["Size"])
+            for obj in self._iter_objects(old_prefix)
+        ]
+        if dry_run:
+            return plan, []
+
+        extra_args, source_args = self._copy_args(encryption_key)
+        concurrency = self.transfer_settings.MAX_CONCURRENCY
+        with ignore_ctrl_c():
+            with ThreadPoolExecutor(max_workers=concurrency) as parts:
+                with ThreadPoolExecutor(max_workers=concurrency) as objects:
+                    futures = [
+                        objects.submit(self._copy_object, parts, source, key, size, extra_args, source_args)
+                        for source, key, size in plan
+                    ]
+                    try:
+                        for future in futures:
+                            future.result()
+                    except BaseException:
+                        for future in futures:
+                            future.cancel()
+                        raise
+            LOG.info("copied %d objects, deleting the originals", len(plan))
+            _, errors = self.delete_files(source for source, _, _ in plan)
+        return plan, errors
 
     def get_object_size(self, path, encryption_key=None, ignore_prefix=False, prefix=None):
         """Get object size of SSE-S3 or CSE-encrypted object
@@ -231,72 +815,573 @@ class _AWS(object):
         """See if file/key exists"""
         LOG.info('checking {}'.format(key))
         key = self.get_obj_key(key, ignore_prefix=ignore_prefix, prefix=prefix)
+        # a fresh index answers without a request, a miss is confirmed by s3
+        if self.key_index.enabled and not self.key_index.is_stale():
+            if next(self.key_index.keys(prefix=key), None) is not None:
+                return True
         resp = self.client.list_objects_v2(Bucket=self._bucket, Prefix=key)
         return "Contents" in resp
 
+    def get_remote_checksum(self, path, ignore_prefix=False, prefix=None):
+        """Get the control sum stored next to the object"""
+        key = self.get_obj_key(path, md5=True, ignore_prefix=ignore_prefix, prefix=prefix)
+        try:
+            response = self.client.get_object(Bucket=self._bucket, Key=key)
+        except self.client.exceptions.NoSuchKey:
+            raise KeyError("{} does not exist!".format(key))
+        return response["Body"].read().strip().decode("ascii")
+
     def download_file(
-        self, path, dst=".", progress=False, use_encryption=None, encryption_key=None, ignore_prefix=False, prefix=None
+        self,
+        path,
+        dst=".",
+        progress=False,
+        use_encryption=None,
+        encryption_key=None,
+        ignore_prefix=False,
+        prefix=None,
+        checksum=None,
+        metrics=None,
     ):
-        """Download a file"""
+        """Download a file
+
+        The first GET describes the object, so no HEAD or LIST precedes the
+        transfer; a small object comes whole with it. A larger one is
+        fetched in parallel ranges into `<local>.part`, an interrupted
+        download continues with the ranges still missing.
+
+        Args:
+            checksum (str): expected checksum sidecar, the bytes are hashed as
+                they land and IntegrityError is raised on a mismatch
+            metrics (Metrics): metrics of the run, see wanna.metrics.report
+
+        Raises:
+            KeyError: the object does not exist
+        """
         dst = dst or "."
         if os.path.isdir(dst):
             local = os.path.join(dst, os.path.basename(path))
         else:
             local = dst
-        touch(local)
         key = self.get_obj_key(path, ignore_prefix=ignore_prefix, prefix=prefix)
-        LOG.warn("Downloading object with key **{}**".format(key))
+        LOG.warning("Downloading object with key **{}**".format(key))
 
-        progress_callback = (
-            ProgressPercentage(
-                local,
-                size=self.get_object_size(key, encryption_key=encryption_key, ignore_prefix=ignore_prefix),
-                humanized=self._humanized,
-            )
-            if progress
-            else lambda x: None
-        )
         extra_args = (
             {}
             if use_encryption is False
             else self._get_extra_args(encryption_key=encryption_key)
         )
 
-        if self.check_if_key_exists(key, ignore_prefix=ignore_prefix, prefix=prefix):
-            with ignore_ctrl_c():
-                with self._transfer(self.client) as transfer:
-                    response = transfer.download_file(
-                        self._bucket,
-                        key,
-                        local,
-                        extra_args=extra_args,
-                        callback=progress_callback,
+        with ignore_ctrl_c():
+            with bound_pool(self.transfer_settings.MAX_CONCURRENCY, metrics) as ranges:
+                with self._progress(progress) as renderer:
+                    return self._download_object(
+                        ranges, key, local, extra_args, progress=renderer, checksum=checksum, metrics=metrics
                     )
-            print("")
-        else:
-            raise KeyError("{} does not exist!".format(path))
+
+    def download_stream(
+        self,
+        path,
+        output,
+        progress=False,
+        use_encryption=None,
+        encryption_key=None,
+        ignore_prefix=False,
+        prefix=None,
+        checksum=None,
+        metrics=None,
+    ):
+        """Download a file to a binary stream, eg. stdout, without a temporary file
+
+        The ranges are fetched in parallel and written strictly in order, at
+        most `stream_buffer_size` bytes are fetched ahead. The progress is
+        rendered on stderr.
+
+        Args:
+            checksum (str): expected checksum sidecar, IntegrityError is raised
+                once the whole object is written when it does not match
+            metrics (Metrics): metrics of the run
+
+        Returns:
+            int - bytes written
+
+        Raises:
+            KeyError: the object does not exist
+        """
+        key = self.get_obj_key(path, ignore_prefix=ignore_prefix, prefix=prefix)
+        LOG.info("Streaming object with key **{}**".format(key))
+        extra_args = (
+            {}
+            if use_encryption is False
+            else self._get_extra_args(encryption_key=encryption_key)
+        )
+        with bound_pool(self.transfer_settings.MAX_CONCURRENCY, metrics) as ranges:
+            with self._progress(progress, stream=sys.stderr) as renderer:
+                size = StreamDownload(
+                    self.client,
+                    self._bucket,
+                    key,
+                    output,
+                    part_size=self.transfer_settings.chunksize,
+                    executor=ranges,
+                    extra_args=extra_args,
+                    buffer_size=self.transfer_settings.stream_buffer_size,
+                    progress=partial(renderer.track, key) if renderer else None,
+                    checksum=checksum,
+                    direct_size=self.transfer_settings.MULTIPART_THRESHOLD,
+                    throttle=self.throttle,
+                    metrics=metrics,
+                ).run()
+        if metrics is not None:
+            metrics.add_file(size)
+        return size
+
+    def _download_object(
+        self, ranges, key, local, extra_args, progress=False, checksum=None, cancel=None, metrics=None, mtime=None
+    ):
+        """Download `key` to `local`, fetching its ranges in the shared `ranges` pool
+
+        Args:
+            progress (Progress|callable): renderer of the run, or a callable taking the
+                size of the object and returning the callback of the bytes written
+            cancel (threading.Event): once set the download stops
+            metrics (Metrics): metrics of the run
+            mtime (int): modification time given to the file, before its checksum
+                is cached under the identity of the file
+        """
+        if isinstance(progress, Progress):
+            progress = partial(progress.track, local)
+        response = RangedDownload(
+            self.client,
+            self._bucket,
+            key,
+            local,
+            part_size=self.transfer_settings.chunksize,
+            executor=ranges,
+            extra_args=extra_args,
+            progress=progress or None,
+            checksum=checksum,
+            queue_size=self.transfer_settings.MAX_CONCURRENCY,
+            direct_size=self.transfer_settings.MULTIPART_THRESHOLD,
+            cancel=cancel,
+            throttle=self.throttle,
+            metrics=metrics,
+        ).run()
+        if mtime is not None:
+            os.utime(local, (mtime, mtime))
+        if metrics is not None:
+            metrics.add_file(os.path.getsize(local))
+        if checksum:
+            verified = Checksum.parse(checksum)
+            self.checksum_cache.put(local, verified.algorithm, verified.part_size, checksum)
         return response
 
-    def list_files(self, prefix=None):
-        """List files"""
-        if self.ignore_prefix:
-            resp = self.client.list_objects_v2(Bucket=self._bucket)
+    def list_files(self, prefix=None, max_keys=None, start_after=None, dirs=False, use_index=False, refresh=False):
+        """List files
+
+        The listing is streamed page by page, the next page is requested
+        while the current one is consumed.
+
+        Args:
+            prefix (str): by default the upload prefix, the whole bucket in ignore prefix mode
+            max_keys (int): stop after this many entries
+            start_after (str): list the keys after this one
+            dirs (bool): group the keys by '/', directories come with `"dir": True`
+            use_index (bool): answer from the key index once it was built, refreshed when stale
+            refresh (bool): list the whole bucket into the key index first
+
+        Returns:
+            generator of dicts with date, size and name
+        """
+        if prefix is None:
+            prefix = "" if self.ignore_prefix else self._default_prefix
+        index = self._indexed(refresh) if use_index and (refresh or self.key_index.refreshed) else None
+        if index is not None:
+            entries = self._list_index(index, prefix, start_after, dirs)
         else:
-            resp = self.client.list_objects_v2(Bucket=self._bucket, Prefix=prefix or self._default_prefix)
-        if "Contents" in resp:
-            for el in resp["Contents"]:
-                yield {
-                    "date": el["LastModified"],
-                    "size": el["Size"],
-                    "name": el["Key"],
-                }
+            entries = self._list_bucket(prefix, max_keys, start_after, dirs)
+        for count, entry in enumerate(entries):
+            if max_keys is not None and count >= max_keys:
+                return
+            yield entry
+
+    def _list_bucket(self, prefix, max_keys, start_after, dirs):
+        for page in self._iter_pages(prefix, max_keys=max_keys, start_after=start_after, dirs=dirs):
+            entries = [
+                {"date": el["LastModified"], "size": el["Size"], "name": el["Key"]}
+                for el in page.get("Contents", [])
+            ] + [
+                {"date": None, "size": 0, "name": el["Prefix"], "dir": True}
+                for el in page.get("CommonPrefixes", [])
+            ]
+            if dirs:
+                entries.sort(key=lambda el: el["name"])
+            for entry in entries:
+                yield entry
+
+    @staticmethod
+    def _list_index(index, prefix, start_after, dirs):
+        directory = None
+        for el in index.keys(prefix=prefix, start_after=start_after):
+            rest = el["name"][len(prefix):]
+            if dirs and "/" in rest:
+                # keys of a directory are next to each other in key order
+                name = prefix + rest[:rest.index("/") + 1]
+                if name != directory:
+                    directory = name
+                    yield {"date": None, "size": 0, "name": name, "dir": True}
+                continue
+            yield {
+                "date": datetime.fromtimestamp(el["mtime"], tzutc()),
+                "size": el["size"],
+                "name": el["name"],
+            }
+
+    def _iter_pages(self, prefix="", max_keys=None, start_after=None, dirs=False):
+        """Pages of list_objects_v2, prefetched one ahead"""
+        kwargs = {"Bucket": self._bucket, "Prefix": prefix}
+        if start_after:
+            kwargs["StartAfter"] = start_after
+        if dirs:
+            kwargs["Delimiter"] = "/"
+        page_size = min(self.list_page_size, max_keys) if max_keys else self.list_page_size
+        paginator = self.client.get_paginator("list_objects_v2")
+        return prefetch(paginator.paginate(PaginationConfig={"PageSize": page_size}, **kwargs))
+
+    def _iter_objects(self, prefix="", start_after=None):
+        """Objects under the prefix, one listing page at a time"""
+        for page in self._iter_pages(prefix, start_after=start_after):
+            for obj in page.get("Contents", []):
+                yield obj
+
+    def _delete_batch(self, keys):
+        """Delete a batch of keys with a single DeleteObjects, returns the count and per-key errors"""
+        response = self.client.delete_objects(
+            Bucket=self._bucket,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+        errors = response.get("Errors", [])
+        failed = set(error["Key"] for error in errors)
+        self.key_index.remove(key for key in keys if key not in failed)
+        return len(keys) - len(failed), errors
+
+    def delete_files(self, keys, dry_run=False):
+        """Delete many objects with parallel DeleteObjects batches of up to 1000 keys
+
+        The keys are consumed as they come, eg. from a paginated listing,
+        and deleted as given: there is no HEAD or LIST per key.
+
+        Args:
+            keys (iterable): object keys
+            dry_run (bool): only count the keys
+
+        Returns:
+            tuple - number of deleted keys and the errors, dicts with Key, Code and Message
+        """
+        keys = iter(keys)
+        batches = iter(lambda: list(itertools.islice(keys, self.delete_batch_size)), [])
+        if dry_run:
+            return sum(len(batch) for batch in batches), []
+
+        deleted, errors = 0, []
+        concurrency = self.transfer_settings.MAX_CONCURRENCY
+        with ignore_ctrl_c():
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                pending = set()
+                for batch in batches:
+                    pending.add(pool.submit(self._delete_batch, batch))
+                    if len(pending) < 2 * concurrency:
+                        continue
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for count, failed in (future.result() for future in finished):
+                        deleted += count
+                        errors.extend(failed)
+                for count, failed in (future.result() for future in pending):
+                    deleted += count
+                    errors.extend(failed)
+        for error in errors:
+            LOG.error("cannot delete %s: %s", error["Key"], error.get("Message", error["Code"]))
+        return deleted, errors
+
+    def delete_prefix(self, prefix, dry_run=False):
+        """Delete every object under the prefix, see delete_files"""
+        if not prefix:
+            raise ValueError("refusing to delete the whole bucket")
+        return self.delete_files((obj["Key"] for obj in self._iter_objects(prefix)), dry_run=dry_run)
+
+    def _expected_checksum(self, key, obj, has_sidecar):
+        """Checksum of the remote object from its sidecar or its ETag, if known"""
+        if has_sidecar:
+            return Checksum.parse(self.get_remote_checksum(key, ignore_prefix=True))
+        if self._encrypt and self._encryption_type == ServerSideEncryption.CUSTOMER_PROVIDED_KEY:
+            # the ETag of an SSE-C object is not a digest of its content
+            return None
+        etag = obj["ETag"].strip('"')
+        if "-" not in etag:
+            return Checksum("md5", etag)
+        # assume the object was uploaded with the current part size
+        return Checksum("md5-etag", etag, self.transfer_settings.chunksize(obj["Size"]))
+
+    def _is_changed(self, local, obj, key, download, add_checksum, has_sidecar, metrics=None):
+        """Should the file be transferred to the other side"""
+        _, path, size, mtime = local
+        if size != obj["Size"]:
+            return True
+        remote_mtime = timegm(obj["LastModified"].utctimetuple())
+        newer = remote_mtime > mtime + 1 if download else mtime > remote_mtime + 1
+        if not (newer or add_checksum):
+            return False
+        expected = self._expected_checksum(key, obj, has_sidecar)
+        if expected is None:
+            return newer
+        return self.get_checksum(path, expected.algorithm, expected.part_size, metrics) != str(expected)
+
+    def sync(
+        self,
+        local_dir,
+        remote_prefix=None,
+        download=False,
+        delete=False,
+        dry_run=False,
+        add_checksum=False,
+        progress=False,
+        jobs=1,
+        encryption_key=None,
+    ):
+        """Synchronise a local directory with a prefix
+
+        Files missing on the other side or whose size differs are
+        transferred. A file of the same size is transferred when its source
+        is newer and its checksum (from the sidecar or the ETag) differs,
+        with `add_checksum` the checksum is always compared.
+
+        Args:
+            local_dir (str): local directory
+            remote_prefix (str): by default the upload prefix
+            download (bool): sync from the bucket to the local directory
+            delete (bool): delete files missing on the source side
+            dry_run (bool): only plan the actions
+            add_checksum (bool): compare checksums, upload and verify sidecars
+            jobs (int): number of files transferred in parallel
+
+        Returns:
+            list - (action, name) pairs, action is upload|download|delete
+
+        Raises:
+            ValueError: the local directory of an upload does not exist, a key
+                of a download leaves it, or `delete` would empty the target
+                because the source lists nothing
+        """
+        if remote_prefix is None:
+            remote_prefix = "" if self.ignore_prefix else self._default_prefix
+        prefix = remote_prefix.rstrip("/") + "/" if remote_prefix else ""
+
+        if not download and not os.path.isdir(local_dir):
+            raise ValueError("{} is not a directory".format(local_dir))
+        local = dict((entry[0], entry) for entry in scan_files(local_dir)) if os.path.isdir(local_dir) else {}
+        remote = dict(
+            (obj["Key"][len(prefix):], obj)
+            for obj in self._iter_objects(prefix)
+            if not obj["Key"].endswith("/")
+        )
+        sidecars = set(
+            name for name in remote
+            if name.endswith(self.hash_checksum) and name[:-len(self.hash_checksum)] in remote
+        )
+        for name in sidecars:
+            del remote[name]
+
+        if download:
+            for name in remote:
+                # fails before anything is written when a key leaves local_dir
+                local_path(local_dir, name)
+        source, target = (remote, local) if download else (local, remote)
+        action = "download" if download else "upload"
+        actions = []
+        for name in sorted(source):
+            if name not in target or self._is_changed(
+                local[name],
+                remote[name],
+                prefix + name,
+                download,
+                add_checksum,
+                name + self.hash_checksum in sidecars,
+            ):
+                actions.append((action, name))
+        if delete and not source and target:
+            # an empty source is more likely a typo or an outage than the wish to delete everything
+            raise ValueError(
+                "refusing to delete: nothing found in {}".format((prefix or "the bucket") if download else local_dir)
+            )
+        if delete:
+            actions.extend(("delete", name) for name in sorted(set(target) - set(source)))
+        if dry_run:
+            return actions
+
+        transfers = [name for act, name in actions if act != "delete"]
+        deletes = [name for act, name in actions if act == "delete"]
+        if download:
+            self._sync_download(
+                local_dir, prefix, [remote[name] for name in transfers], jobs, progress,
+                encryption_key, [name for name in transfers if name + self.hash_checksum in sidecars]
+                if add_checksum else [],
+            )
+            for name in deletes:
+                os.remove(local[name][1])
+        else:
+            if transfers:
+                self._upload_many(
+                    [(local[name][1], prefix + name) for name in transfers],
+                    jobs=jobs,
+                    add_checksum=add_checksum,
+                    progress=progress,
+                    encryption_key=encryption_key,
+                )
+            self.delete_files(
+                prefix + name + suffix
+                for name in deletes
+                for suffix in (("", self.hash_checksum) if name + self.hash_checksum in sidecars else ("",))
+            )
+        return actions
+
+    def _sync_download(self, local_dir, prefix, objects, jobs, progress, encryption_key, verified):
+        """Download objects below local_dir and give them the remote modification time"""
+        extra_args = self._get_extra_args(encryption_key=encryption_key)
+        verified = set(verified)
+        concurrency = self.transfer_settings.MAX_CONCURRENCY
+
+        def download(obj):
+            name = obj["Key"][len(prefix):]
+            checksum = self.get_remote_checksum(obj["Key"], ignore_prefix=True) if name in verified else None
+            self._download_to(ranges, obj, local_path(local_dir, name), extra_args, progress, checksum)
+
+        with ignore_ctrl_c():
+            with ThreadPoolExecutor(max_workers=concurrency) as ranges:
+                with self._progress(progress) as progress:
+                    with ThreadPoolExecutor(max_workers=max(1, min(jobs or 1, concurrency))) as pool:
+                        for _ in pool.map(download, objects):
+                            pass
+
+    def _download_to(self, ranges, obj, local, extra_args, progress=False, checksum=None, metrics=None):
+        """Download a listed object to `local` and give it the remote modification time"""
+        directory = os.path.dirname(local)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by a download running next to this one
+                if not os.path.isdir(directory):
+                    raise
+        self._download_object(
+            ranges,
+            obj["Key"],
+            local,
+            extra_args,
+            progress=progress,
+            checksum=checksum,
+            metrics=metrics,
+            mtime=timegm(obj["LastModified"].utctimetuple()),
+        )
+
+    def download_prefix(
+        self,
+        prefix,
+        dst=".",
+        progress=False,
+        add_checksum=False,
+        jobs=None,
+        encryption_key=None,
+        metrics=None,
+        pattern=False,
+    ):
+        """Download every object under a prefix, or matching a glob pattern
+
+        The keys stream from the paginated listing into a bounded pool of
+        `jobs` downloads sharing one pool of range requests, so the first
+        files land before the listing is over. The key hierarchy below the
+        prefix (the directory of a pattern) is mirrored under `dst`. A file
+        already there is skipped when it has the size of the object and is
+        not older, or its ETag says it is the same. Every job sends the first
+        GET of its object itself, next to the range requests, and the
+        connection pool (2 * `max_concurrency` by default) has room for both.
+
+        Args:
+            prefix (str): key prefix, or a pattern such as `run1/*.bam` when `pattern`
+            add_checksum (bool): verify the objects against their checksum sidecars
+            jobs (int): objects downloaded in parallel (default max_concurrency)
+            metrics (Metrics): metrics of the run, see wanna.metrics.report
+            pattern (bool): match the keys against `prefix` as a glob pattern, a key
+                such as `run1/sample[1].bam` is otherwise taken literally
+
+        Returns:
+            tuple - the downloaded keys, the skipped keys and the (key, error) failures
+        """
+        pattern = prefix if pattern else None
+        if pattern:
+            prefix = pattern[:min([pattern.index(char) for char in GLOB_CHARS if char in pattern] or [len(pattern)])]
+        if not prefix and not pattern:
+            raise ValueError("refusing to download the whole bucket, give a prefix or a pattern")
+        base = prefix[:prefix.rfind("/") + 1]
+        extra_args = self._get_extra_args(encryption_key=encryption_key)
+        concurrency = self.transfer_settings.MAX_CONCURRENCY
+        jobs = max(1, min(jobs or concurrency, concurrency))
+        downloaded, skipped, failed = [], [], []
+
+        def download(obj):
+            name = obj["Key"][len(base):]
+            local = local_path(dst, name)
+            if os.path.isfile(local):
+                stat = os.stat(local)
+                entry = (name, local, stat.st_size, stat.st_mtime)
+                if not self._is_changed(entry, obj, obj["Key"], True, add_checksum, False, metrics):
+                    return False
+            checksum = None
+            if add_checksum:
+                try:
+                    checksum = self.get_remote_checksum(obj["Key"], ignore_prefix=True)
+                except KeyError:
+                    LOG.warning("%s has no checksum", obj["Key"])
+            self._download_to(ranges, obj, local, extra_args, progress, checksum, metrics)
+            return True
+
+        def collect(future, key):
+            try:
+                (downloaded if future.result() else skipped).append(key)
+            except Exception as error:
+                LOG.error("cannot download %s: %s", key, error)
+                failed.append((key, error))
+                if metrics is not None:
+                    metrics.failed.add(1)
+
+        objects = (
+            obj
+            for obj in self._iter_objects(prefix)
+            if not obj["Key"].endswith("/") and (pattern is None or fnmatch.fnmatchcase(obj["Key"], pattern))
+        )
+        with ignore_ctrl_c():
+            with bound_pool(concurrency, metrics) as ranges:
+                with self._progress(progress) as progress:
+                    with bound_pool(jobs, metrics) as pool:
+                        pending = {}
+                        for obj in objects:
+                            pending[pool.submit(download, obj)] = obj["Key"]
+                            if len(pending) < 2 * jobs:
+                                continue
+                            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in finished:
+                                collect(future, pending.pop(future))
+                        for future in list(pending):
+                            collect(future, pending.pop(future))
+        return downloaded, skipped, failed
 
     def delete_file(self, path, ignore_prefix=False, prefix=None):
         """Delete file object"""
         path = self.get_obj_key(path, ignore_prefix=ignore_prefix, prefix=prefix)
         if self.check_if_key_exists(path, ignore_prefix=ignore_prefix, prefix=prefix):
             with ignore_ctrl_c():
-                return self.client.delete_object(Bucket=self._bucket, Key=path)
+                response = self.client.delete_object(Bucket=self._bucket, Key=path)
+                self.key_index.remove([path])
+                return response
         raise KeyError("{} does not exist!".format(path))
 
     def get_status(self, path):
@@ -0,0 +1,205 @@
+"""Resumable multipart upload
+
+The UploadId and the ETag of every completed part are written to the
+upload journal. When the same file is uploaded again the parts S3 already
+has (ListParts) are skipped and only the missing ones are sent.
+"""
+from wanna.utils import TransferCancelled
+from wanna.hashing import wait_for_digest
+from wanna.throttle import throttled_body
+
+from botocore.exceptions import ClientError
+from concurrent.futures import wait
+
+import os
+import time
+import logging
+
+LOG = logging.getLogger("wanna:aws")
+
+
+class MultipartUpload(object):
+    """Multipart upload of a single file
+
+    Args:
+        client: s3 client
+        bucket (str): bucket name
+        key (str): object key
+        filename (str): path to the file
+        part_size (int): size of every part but the last one
+        executor (Executor): pool the parts are uploaded in, shared by all files
+        journal (UploadJournal): local record of uploads in progress
+        extra_args (dict): encryption parameters
+        callback (callable): called with the number of bytes of every uploaded part
+        digest (OrderedDigest|PartedDigest): fed with every part as it is read
+        queue_size (int): parts read ahead while the digest waits for an earlier one
+        cancel (threading.Event): once set the upload stops and is aborted
+        throttle (Throttle): bandwidth limit the parts are paid to as they are sent
+        metrics (Metrics): collects the latency of every part
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket,
+        key,
+        filename,
+        part_size,
+        executor,
+        journal,
+        extra_args=None,
+        callback=None,
+        digest=None,
+        queue_size=10,
+        cancel=None,
+        throttle=None,
+        metrics=None,
+    ):
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._filename = filename
+        self._part_size = part_size
+        self._executor = executor
+        self._journal = journal
+        self._extra_args = extra_args or {}
+        self._callback = callback or (lambda x: None)
+        self._digest = digest
+        self._queue_size = queue_size
+        self._cancel = cancel
+        self._throttle = throttle
+        self._metrics = metrics
+        self._size = os.path.getsize(filename)
+
+    @property
+    def _part_args(self):
+        """Parameters every UploadPart needs to repeat, eg. the SSE-C key"""
+        return dict(
+            (name, value) for name, value in self._extra_args.items() if name.startswith("SSECustomer")
+        )
+
+    def _parts(self):
+        """Part number, offset and length of every part"""
+        count = max(1, (self._size + self._part_size - 1) // self._part_size)
+        for index in range(count):
+            offset = index * self._part_size
+            yield index + 1, offset, min(self._part_size, self._size - offset)
+
+    def _list_parts(self, upload_id):
+        parts = {}
+        paginator = self._client.get_paginator("list_parts")
+        for page in paginator.paginate(Bucket=self._bucket, Key=self._key, UploadId=upload_id):
+            for part in page.get("Parts", []):
+                parts[part["PartNumber"]] = part
+        return parts
+
+    def _abort(self, entry):
+        try:
+            self._client.abort_multipart_upload(
+                Bucket=self._bucket, Key=self._key, UploadId=entry.upload_id
+            )
+        except ClientError as error:
+            LOG.debug("abort %s: %s", entry.upload_id, error)
+        self._journal.finish(entry)
+
+    def _resume(self):
+        """Get the upload in progress and the parts it already has"""
+        entry = self._journal.load(self._bucket, self._key, self._filename)
+        if entry is None:
+            return None, {}
+        if not entry.matches(self._filename, self._part_size):
+            LOG.info("%s changed since upload %s started", self._filename, entry.upload_id)
+            self._abort(entry)
+            return None, {}
+        try:
+            return entry, self._list_parts(entry.upload_id)
+        except ClientError as error:
+            if error.response["Error"]["Code"] != "NoSuchUpload":
+                raise
+            LOG.info("upload %s is gone, starting over", entry.upload_id)
+            self._journal.finish(entry)
+            return None, {}
+
+    def _read(self, offset, length):
+        with open(self._filename, "rb") as source:
+            source.seek(offset)
+            body = source.read(length)
+        if self._digest is not None:
+            self._digest.update(offset, body)
+        return body
+
+    def _hash_part(self, offset, length):
+        """Feed the digest with a part uploaded by an earlier run"""
+        self._read(offset, length)
+
+    def _check_cancelled(self):
+        if self._cancel is not None and self._cancel.is_set():
+            raise TransferCancelled("upload of {} cancelled".format(self._key))
+
+    def _upload_part(self, entry, part_number, offset, length):
+        self._check_cancelled()
+        body = self._read(offset, length)
+        started = time.monotonic()
+        response = self._client.upload_part(
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=entry.upload_id,
+            PartNumber=part_number,
+            Body=throttled_body(body, self._throttle),
+            **self._part_args
+        )
+        if self._metrics is not None:
+            self._metrics.observe("upload_part", time.monotonic() - started)
+        entry.add_part(part_number, response["ETag"])
+        self._callback(length)
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def run(self):
+        """Upload the missing parts and complete the upload"""
+        entry, uploaded = self._resume()
+        if entry is None:
+            response = self._client.create_multipart_upload(
+                Bucket=self._bucket, Key=self._key, **self._extra_args
+            )
+            entry = self._journal.start(
+                self._bucket, self._key, self._filename, response["UploadId"], self._part_size
+            )
+        else:
+            LOG.info("resuming upload %s, %d parts already uploaded", entry.upload_id, len(uploaded))
+
+        completed = []
+        futures = []
+        try:
+            for part_number, offset, length in self._parts():
+                self._check_cancelled()
+                if self._digest is not None:
+                    wait_for_digest(self._digest, self._queue_size * self._part_size, futures)
+                part = uploaded.get(part_number)
+                if part is not None and part["Size"] == length:
+                    completed.append({"PartNumber": part_number, "ETag": part["ETag"]})
+                    self._callback(length)
+                    if self._digest is not None:
+                        futures.append(self._executor.submit(self._hash_part, offset, length))
+                else:
+                    futures.append(
+                        self._executor.submit(self._upload_part, entry, part_number, offset, length)
+                    )
+            completed.extend(part for part in (future.result() for future in futures) if part)
+            self._check_cancelled()
+        except BaseException as error:
+            for future in futures:
+                future.cancel()
+            if isinstance(error, TransferCancelled):
+                # a cancelled upload is not resumed, its parts are dropped
+                wait(futures)
+                self._abort(entry)
+            raise
+
+        response = self._client.complete_multipart_upload(
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=entry.upload_id,
+            MultipartUpload={"Parts": sorted(completed, key=lambda part: part["PartNumber"])},
+        )
+        self._journal.finish(entry)
+        return response
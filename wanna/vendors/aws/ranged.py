@@ -0,0 +1,364 @@
+"""Resumable ranged download
+
+The object is fetched in byte ranges into `<file>.part`. Next to it
+`<file>.part.state` records the ETag and size of the object together with
+a bitmap of the ranges already written. A re-run only fetches the missing
+ranges, and the file is renamed into place once every range is written.
+
+The first request is a GET of the leading `direct_size` bytes. Its
+headers stand in for a HEAD (size, ETag, encryption), and a small object
+arrives whole with it, so it costs a single request and no preflight.
+The body of a larger object is kept: the ranges it covers are marked
+done and the range it ends in is only fetched from where it stopped. That
+range is marked done once both its head, from the first GET, and its tail
+are on disk.
+
+When the expected checksum is known the bytes are hashed as the ranges
+land, so the download is verified without reading the file again.
+"""
+from wanna.utils import IntegrityError
+from wanna.utils import TransferCancelled
+from wanna.hashing import Checksum
+from wanna.hashing import wait_for_digest
+
+from botocore.exceptions import ClientError
+
+import os
+import json
+import time
+import logging
+import binascii
+import threading
+
+LOG = logging.getLogger("wanna:aws")
+
+
+def get_first_range(client, bucket, key, direct_size, extra_args):
+    """GET the leading bytes, the response describes the whole object
+
+    Returns:
+        tuple - the response and the size of the object
+
+    Raises:
+        KeyError: the object does not exist
+    """
+    try:
+        response = client.get_object(
+            Bucket=bucket, Key=key, Range="bytes=0-{}".format(direct_size - 1), **extra_args
+        )
+    except ClientError as error:
+        code = error.response["Error"]["Code"]
+        if code in ("NoSuchKey", "404"):
+            raise KeyError("{} does not exist!".format(key))
+        if code != "InvalidRange":
+            raise
+        # an empty object has no byte 0
+        response = client.get_object(Bucket=bucket, Key=key, **extra_args)
+    content_range = response.get("ContentRange")
+    size = int(content_range.rsplit("/", 1)[1]) if content_range else response["ContentLength"]
+    return response, size
+
+
+class DownloadState(object):
+    """Completed ranges of a partial download"""
+
+    def __init__(self, path, etag, size, part_size, bitmap=None):
+        self.path = path
+        self.etag = etag
+        self.size = size
+        self.part_size = part_size
+        self.count = max(1, (size + part_size - 1) // part_size) if size else 0
+        self.bitmap = bitmap or bytearray((self.count + 7) // 8)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as state:
+                data = json.load(state)
+            return cls(
+                path,
+                data["etag"],
+                data["size"],
+                data["part_size"],
+                bytearray(binascii.unhexlify(data["bitmap"])),
+            )
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def matches(self, etag, size, part_size):
+        return (self.etag, self.size, self.part_size) == (etag, size, part_size)
+
+    def is_done(self, index):
+        return bool(self.bitmap[index // 8] & (1 << (index % 8)))
+
+    def ranges(self):
+        """Index, offset and length of every range"""
+        for index in range(self.count):
+            offset = index * self.part_size
+            yield index, offset, min(self.part_size, self.size - offset)
+
+    def mark_done(self, index):
+        with self._lock:
+            self.bitmap[index // 8] |= 1 << (index % 8)
+            self.save()
+
+    def save(self):
+        """Write the state atomically"""
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as state:
+            json.dump(
+                {
+                    "etag": self.etag,
+                    "size": self.size,
+                    "part_size": self.part_size,
+                    "bitmap": binascii.hexlify(bytes(self.bitmap)).decode("ascii"),
+                },
+                state,
+            )
+            state.flush()
+            os.fsync(state.fileno())
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class RangedDownload(object):
+    """Download of a single object in parallel byte ranges
+
+    Args:
+        client: s3 client
+        bucket (str): bucket name
+        key (str): object key
+        filename (str): local destination
+        part_size (callable): part size for the given object size
+        executor (Executor): pool the ranges are fetched in
+        extra_args (dict): decryption parameters
+        progress (callable): called with the size of the object, returns the
+            callback called with the number of bytes written
+        checksum (str): expected checksum sidecar of the object
+        queue_size (int): ranges fetched ahead while the digest waits for an earlier one
+        direct_size (int): objects up to this size are fetched with a single GET
+        cancel (threading.Event): once set the download stops, the partial file is kept
+        throttle (Throttle): bandwidth limit every received chunk is paid to
+        metrics (Metrics): collects the latency of every range and the hashing time
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        client,
+        bucket,
+        key,
+        filename,
+        part_size,
+        executor,
+        extra_args=None,
+        progress=None,
+        checksum=None,
+        queue_size=10,
+        direct_size=8 * 1024 * 1024,
+        cancel=None,
+        throttle=None,
+        metrics=None,
+    ):
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._filename = filename
+        self._part_size = part_size
+        self._executor = executor
+        self._extra_args = extra_args or {}
+        self._progress = progress
+        self._callback = lambda x: None
+        self._checksum = Checksum.parse(checksum) if checksum else None
+        self._digest = self._checksum.new_digest() if checksum else None
+        self._queue_size = queue_size
+        self._direct_size = direct_size
+        self._cancel = cancel
+        self._throttle = throttle
+        self._metrics = metrics
+        if metrics is not None:
+            self._digest = metrics.timed_digest(self._digest)
+        self._partial = filename + ".part"
+
+    def _prepare(self, etag, size):
+        """Reuse a partial download of the same object or start a new one"""
+        part_size = self._part_size(size)
+        state = DownloadState.load(self._partial + ".state")
+        if state is not None and state.matches(etag, size, part_size) and os.path.exists(self._partial):
+            LOG.info("resuming download of %s", self._key)
+            return state
+        if state is not None:
+            LOG.info("%s changed since the download started, starting over", self._key)
+        with open(self._partial, "wb") as partial:
+            partial.truncate(size)
+        state = DownloadState(self._partial + ".state", etag, size, part_size)
+        state.save()
+        return state
+
+    def _open(self):
+        return get_first_range(self._client, self._bucket, self._key, self._direct_size, self._extra_args)
+
+    def _write(self, response, size):
+        """Write a small object that came whole with the first response"""
+        with open(self._partial, "wb") as partial:
+            offset = 0
+            for chunk in iter(lambda: response["Body"].read(self.chunk_size), b""):
+                partial.write(chunk)
+                if self._digest is not None:
+                    self._digest.update(offset, chunk)
+                offset += len(chunk)
+                self._callback(len(chunk))
+                if self._throttle is not None:
+                    self._throttle.consume(len(chunk))
+        if offset != size:
+            raise IOError("{}: got {} of {} bytes".format(self._key, offset, size))
+
+    def _write_leading(self, response, state):
+        """Write the body of the first GET into the partial file, the ranges it covers are done"""
+        started = time.monotonic()
+        offset = 0
+        with open(self._partial, "r+b") as partial:
+            for chunk in iter(lambda: response["Body"].read(self.chunk_size), b""):
+                partial.write(chunk)
+                if self._digest is not None:
+                    self._digest.update(offset, chunk)
+                offset += len(chunk)
+                self._callback(len(chunk))
+                if self._throttle is not None:
+                    self._throttle.consume(len(chunk))
+            # the bytes are on disk before the state says so
+            partial.flush()
+            os.fsync(partial.fileno())
+        if offset != response["ContentLength"]:
+            raise IOError("{}: got {} of {} bytes".format(self._key, offset, response["ContentLength"]))
+        for index, start, length in state.ranges():
+            if start + length > offset:
+                break
+            state.mark_done(index)
+        if self._metrics is not None:
+            self._metrics.observe("get_range", time.monotonic() - started)
+
+    def _check_cancelled(self):
+        if self._cancel is not None and self._cancel.is_set():
+            raise TransferCancelled("download of {} cancelled".format(self._key))
+
+    def _fetch(self, state, index, offset, length, after=None):
+        """Write a range, `after` is the future writing the head of a range the first GET ends in"""
+        self._check_cancelled()
+        started = time.monotonic()
+        response = self._client.get_object(
+            Bucket=self._bucket,
+            Key=self._key,
+            Range="bytes={}-{}".format(offset, offset + length - 1),
+            IfMatch=state.etag,
+            **self._extra_args
+        )
+        body = response["Body"]
+        with open(self._partial, "r+b") as partial:
+            partial.seek(offset)
+            for chunk in iter(lambda: body.read(self.chunk_size), b""):
+                partial.write(chunk)
+                if self._digest is not None:
+                    self._digest.update(offset, chunk)
+                offset += len(chunk)
+                self._callback(len(chunk))
+                if self._throttle is not None:
+                    self._throttle.consume(len(chunk))
+            # the bytes are on disk before the state says so
+            partial.flush()
+            os.fsync(partial.fileno())
+        if after is not None:
+            # submitted before this range, it is not waiting for a worker
+            after.result()
+        state.mark_done(index)
+        if self._metrics is not None:
+            self._metrics.observe("get_range", time.monotonic() - started)
+
+    def _hash_range(self, offset, length):
+        """Feed the digest with a range written by an earlier run"""
+        with open(self._partial, "rb") as partial:
+            partial.seek(offset)
+            self._digest.update(offset, partial.read(length))
+
+    def _verify(self, state):
+        digest = self._digest.checksum()
+        if digest != self._checksum:
+            os.remove(self._partial)
+            if state is not None:
+                state.remove()
+            raise IntegrityError(
+                "File corrupted!\n{}: expected {}, got {}".format(self._key, self._checksum, digest)
+            )
+        LOG.info("Integrity check: OK")
+
+    def run(self):
+        """Fetch the missing ranges and move the file into place"""
+        started = time.monotonic()
+        response, size = self._open()
+        if self._progress is not None and size:
+            self._callback = self._progress(size)
+        if response["ContentLength"] == size:
+            self._write(response, size)
+            if self._metrics is not None:
+                self._metrics.observe("get_object", time.monotonic() - started)
+            if self._digest is not None:
+                self._verify(None)
+            os.replace(self._partial, self._filename)
+            if os.path.exists(self._partial + ".state"):
+                # left by an earlier, larger version of the object
+                os.remove(self._partial + ".state")
+            return self._filename
+        state = self._prepare(response["ETag"], size)
+
+        futures = []
+        head = None
+        # the body of the first GET is written while the next ranges are fetched,
+        # unless an earlier run already has every range it touches
+        leading = response["ContentLength"]
+        if all(state.is_done(index) for index, offset, _ in state.ranges() if offset < leading):
+            leading = 0
+        if leading:
+            head = self._executor.submit(self._write_leading, response, state)
+            futures.append(head)
+        else:
+            response["Body"].close()
+        try:
+            for index, offset, length in state.ranges():
+                self._check_cancelled()
+                if offset + length <= leading:
+                    # came with the first GET
+                    continue
+                if self._digest is not None:
+                    wait_for_digest(self._digest, self._queue_size * state.part_size, futures)
+                after = None
+                if offset < leading:
+                    # the first GET ends in this range, only the rest of it is missing
+                    offset, length, after = leading, offset + length - leading, head
+                if state.is_done(index):
+                    self._callback(length)
+                    if self._digest is not None:
+                        futures.append(self._executor.submit(self._hash_range, offset, length))
+                else:
+                    futures.append(self._executor.submit(self._fetch, state, index, offset, length, after))
+            for future in futures:
+                future.result()
+        except BaseException as error:
+            for future in futures:
+                future.cancel()
+            response["Body"].close()
+            if isinstance(error, ClientError) and error.response["Error"]["Code"] in ("PreconditionFailed", "412"):
+                LOG.warning("%s changed during the download", self._key)
+            raise
+
+        if self._digest is not None:
+            self._verify(state)
+        os.replace(self._partial, self._filename)
+        state.remove()
+        return self._filename
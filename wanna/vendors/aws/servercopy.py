@@ -0,0 +1,91 @@
+"""Server side multipart copy
+
+A large object is copied in parallel UploadPartCopy ranges, the data
+never leaves S3. Objects above 5GB cannot be copied with CopyObject at all.
+"""
+from botocore.exceptions import ClientError
+
+import logging
+
+LOG = logging.getLogger("wanna:aws")
+
+
+class MultipartCopy(object):
+    """Multipart copy of a single object within the bucket
+
+    Args:
+        client: s3 client
+        bucket (str): bucket name
+        source (str): key of the copied object
+        key (str): key of the copy
+        size (int): size of the copied object
+        part_size (int): size of every part but the last one
+        executor (Executor): pool the parts are copied in, shared by all objects
+        extra_args (dict): encryption parameters of the copy and other CreateMultipartUpload arguments
+        source_args (dict): CopySourceSSECustomer* parameters of the copied object
+    """
+
+    def __init__(self, client, bucket, source, key, size, part_size, executor, extra_args=None, source_args=None):
+        self._client = client
+        self._bucket = bucket
+        self._source = source
+        self._key = key
+        self._size = size
+        self._part_size = part_size
+        self._executor = executor
+        self._extra_args = extra_args or {}
+        self._source_args = source_args or {}
+
+    @property
+    def _part_args(self):
+        """Parameters every UploadPartCopy needs to repeat"""
+        args = dict(
+            (name, value) for name, value in self._extra_args.items() if name.startswith("SSECustomer")
+        )
+        args.update(self._source_args)
+        return args
+
+    def _parts(self):
+        """Part number, first and last byte of every part"""
+        count = max(1, (self._size + self._part_size - 1) // self._part_size)
+        for index in range(count):
+            offset = index * self._part_size
+            yield index + 1, offset, min(offset + self._part_size, self._size) - 1
+
+    def _copy_part(self, upload_id, part_number, first, last):
+        response = self._client.upload_part_copy(
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            CopySource={"Bucket": self._bucket, "Key": self._source},
+            CopySourceRange="bytes={}-{}".format(first, last),
+            **self._part_args
+        )
+        return {"PartNumber": part_number, "ETag": response["CopyPartResult"]["ETag"]}
+
+    def run(self):
+        """Copy every part and complete the upload, abort it on failure"""
+        upload_id = self._client.create_multipart_upload(
+            Bucket=self._bucket, Key=self._key, **self._extra_args
+        )["UploadId"]
+        futures = [
+            self._executor.submit(self._copy_part, upload_id, part_number, first, last)
+            for part_number, first, last in self._parts()
+        ]
+        try:
+            parts = [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            try:
+                self._client.abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=upload_id)
+            except ClientError as error:
+                LOG.debug("abort %s: %s", upload_id, error)
+            raise
+        return self._client.complete_multipart_upload(
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
@@ -0,0 +1,397 @@
+"""Streaming transfers, from and to pipes
+
+Bytes written to the writer are cut into parts which are uploaded while
+the producer keeps writing, the length of the stream does not need to be
+known. Parts in flight hold at most `buffer_size` bytes of memory, a write
+blocks until an upload makes room. The part size doubles every 1000 parts,
+so an unknown length is not limited by the 10,000 parts of an upload.
+
+A stream shorter than a part is sent with a single PutObject.
+
+A download to a stream fetches the ranges of the object in parallel and
+writes them strictly in order, at most `buffer_size` bytes of ranges are
+fetched ahead of the one being written.
+"""
+from wanna.utils import IntegrityError
+from wanna.utils import TransferCancelled
+from wanna.hashing import Checksum
+from wanna.metrics import bound_pool
+from wanna.throttle import throttled_body
+from wanna.vendors.aws.ranged import get_first_range
+
+from botocore.exceptions import ClientError
+
+import time
+import logging
+import functools
+import threading
+import itertools
+import collections
+
+LOG = logging.getLogger("wanna:aws")
+
+MAX_PART_SIZE = 5 * 1024 ** 3
+PARTS_PER_SIZE = 1000
+
+
+class StreamUpload(object):
+    """Writer uploading an unknown-length stream to `key`
+
+    Args:
+        client: s3 client
+        bucket (str): bucket name
+        key (str): object key
+        part_size (int): size of the first 1000 parts
+        executor (Executor): pool the parts are uploaded in, by default one of
+            `max_workers` threads owned by the upload
+        max_workers (int): uploads of parts in parallel in the pool of the upload
+        extra_args (dict): encryption parameters
+        buffer_size (int): bytes of the parts in flight, at least one part is always sent
+        digest (OrderedDigest|PartedDigest): fed with every part as it is uploaded
+        callback (callable): called with the number of bytes of every uploaded part
+        throttle (Throttle): bandwidth limit the parts are paid to as they are sent
+        metrics (Metrics): collects the latency of every part
+        on_complete (callable): called with the upload once the object exists
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket,
+        key,
+        part_size,
+        executor=None,
+        max_workers=10,
+        extra_args=None,
+        buffer_size=None,
+        digest=None,
+        callback=None,
+        throttle=None,
+        metrics=None,
+        on_complete=None,
+    ):
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._part_size = part_size
+        self._own_executor = executor is None
+        self._executor = executor or bound_pool(max_workers, metrics)
+        self._extra_args = extra_args or {}
+        self._buffer_size = buffer_size or 2 * part_size
+        self._digest = digest
+        self._callback = callback or (lambda x: None)
+        self._throttle = throttle
+        self._metrics = metrics
+        self._on_complete = on_complete
+        self._buffer = bytearray()
+        self._offset = 0
+        self._upload_id = None
+        self._futures = []
+        self._in_flight = 0
+        self._error = None
+        self._cond = threading.Condition()
+        self.closed = False
+        self.response = None
+        self.size = 0
+
+    @property
+    def _part_args(self):
+        return dict(
+            (name, value) for name, value in self._extra_args.items() if name.startswith("SSECustomer")
+        )
+
+    def _next_part_size(self):
+        doublings = len(self._futures) // PARTS_PER_SIZE
+        return min(self._part_size << doublings, MAX_PART_SIZE)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        """Buffer the bytes, full parts are sent, blocks while the buffer is full"""
+        if self.closed:
+            raise ValueError("write to a closed upload")
+        self._buffer += data
+        part_size = self._next_part_size()
+        while len(self._buffer) >= part_size:
+            body = bytes(self._buffer[:part_size])
+            del self._buffer[:part_size]
+            self._send(body)
+            part_size = self._next_part_size()
+        return len(data)
+
+    def _send(self, body):
+        with self._cond:
+            while self._in_flight and self._in_flight + len(body) > self._buffer_size and self._error is None:
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+            self._in_flight += len(body)
+        if self._upload_id is None:
+            self._upload_id = self._client.create_multipart_upload(
+                Bucket=self._bucket, Key=self._key, **self._extra_args
+            )["UploadId"]
+            LOG.debug("streaming %s in upload %s", self._key, self._upload_id)
+        future = self._executor.submit(self._upload_part, len(self._futures) + 1, self._offset, body)
+        future.add_done_callback(functools.partial(self._sent, len(body)))
+        self._futures.append(future)
+        self._offset += len(body)
+
+    def _sent(self, length, future):
+        with self._cond:
+            self._in_flight -= length
+            if future.exception() is not None and self._error is None:
+                self._error = future.exception()
+            self._cond.notify_all()
+
+    def _upload_part(self, part_number, offset, body):
+        if self._digest is not None:
+            self._digest.update(offset, body)
+        started = time.monotonic()
+        response = self._client.upload_part(
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=throttled_body(body, self._throttle),
+            **self._part_args
+        )
+        if self._metrics is not None:
+            self._metrics.observe("upload_part", time.monotonic() - started)
+        self._callback(len(body))
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def close(self):
+        """Send what is left and complete the upload
+
+        Returns:
+            dict - response of CompleteMultipartUpload (or PutObject)
+        """
+        if self.closed:
+            return self.response
+        self.closed = True
+        body = bytes(self._buffer)
+        self._buffer = bytearray()
+        try:
+            if self._upload_id is None:
+                self.response = self._put(body)
+            else:
+                if body:
+                    self._send(body)
+                parts = [future.result() for future in self._futures]
+                self.response = self._client.complete_multipart_upload(
+                    Bucket=self._bucket,
+                    Key=self._key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={"Parts": parts},
+                )
+        except BaseException:
+            self.abort()
+            raise
+        self._release()
+        self.size = self._offset
+        if self._on_complete is not None:
+            self._on_complete(self)
+        return self.response
+
+    def _put(self, body):
+        if self._digest is not None:
+            self._digest.update(0, body)
+        started = time.monotonic()
+        response = self._client.put_object(
+            Bucket=self._bucket, Key=self._key, Body=throttled_body(body, self._throttle), **self._extra_args
+        )
+        if self._metrics is not None:
+            self._metrics.observe("put_object", time.monotonic() - started)
+        self._offset = len(body)
+        self._callback(len(body))
+        return response
+
+    def abort(self):
+        """Drop the upload, the parts already sent are deleted"""
+        if self.response is not None:
+            return
+        self.closed = True
+        with self._cond:
+            if self._error is None:
+                self._error = TransferCancelled("upload of {} aborted".format(self._key))
+            self._cond.notify_all()
+        for future in self._futures:
+            future.cancel()
+        for future in self._futures:
+            if not future.cancelled():
+                future.exception()
+        if self._upload_id is not None:
+            try:
+                self._client.abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+            except ClientError as error:
+                LOG.debug("abort %s: %s", self._upload_id, error)
+        self._release()
+
+    def _release(self):
+        if self._own_executor:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class StreamDownload(object):
+    """Download of a single object to a stream, eg. stdout, in parallel byte ranges
+
+    Nothing touches the disk: the first GET is written as it arrives while
+    the next ranges are fetched into memory, and every range is written
+    once all the bytes before it are.
+
+    Args:
+        client: s3 client
+        bucket (str): bucket name
+        key (str): object key
+        output (file): binary stream the object is written to
+        part_size (callable): range size for the given object size
+        executor (Executor): pool the ranges are fetched in
+        extra_args (dict): decryption parameters
+        buffer_size (callable): bytes fetched ahead for the given range size,
+            at least one range
+        progress (callable): called with the size of the object, returns the
+            callback called with the number of bytes written
+        checksum (str): expected checksum sidecar of the object, IntegrityError
+            is raised after the last byte is written when it does not match
+        direct_size (int): bytes of the first GET
+        throttle (Throttle): bandwidth limit every received chunk is paid to
+        metrics (Metrics): collects the latency of every range and the hashing time
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        client,
+        bucket,
+        key,
+        output,
+        part_size,
+        executor,
+        extra_args=None,
+        buffer_size=None,
+        progress=None,
+        checksum=None,
+        direct_size=8 * 1024 * 1024,
+        throttle=None,
+        metrics=None,
+    ):
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._output = output
+        self._part_size = part_size
+        self._executor = executor
+        self._extra_args = extra_args or {}
+        self._buffer_size = buffer_size or (lambda part_size: 2 * part_size)
+        self._progress = progress
+        self._callback = lambda x: None
+        self._checksum = Checksum.parse(checksum) if checksum else None
+        self._digest = self._checksum.new_digest() if checksum else None
+        self._direct_size = direct_size
+        self._throttle = throttle
+        self._metrics = metrics
+        if metrics is not None:
+            self._digest = metrics.timed_digest(self._digest)
+        self._cancel = threading.Event()
+
+    def _ranges(self, start, size):
+        """Offset and length of every range after the first GET"""
+        part_size = self._part_size(size)
+        for offset in range(start, size, part_size):
+            yield offset, min(part_size, size - offset)
+
+    def _read(self, body):
+        for chunk in iter(lambda: body.read(self.chunk_size), b""):
+            if self._throttle is not None:
+                self._throttle.consume(len(chunk))
+            yield chunk
+
+    def _fetch(self, etag, offset, length):
+        if self._cancel.is_set():
+            raise TransferCancelled("download of {} cancelled".format(self._key))
+        started = time.monotonic()
+        response = self._client.get_object(
+            Bucket=self._bucket,
+            Key=self._key,
+            Range="bytes={}-{}".format(offset, offset + length - 1),
+            IfMatch=etag,
+            **self._extra_args
+        )
+        body = b"".join(self._read(response["Body"]))
+        if len(body) != length:
+            raise IOError("{}: got {} of {} bytes at {}".format(self._key, len(body), length, offset))
+        if self._metrics is not None:
+            self._metrics.observe("get_range", time.monotonic() - started)
+        if self._digest is not None:
+            self._digest.update(offset, body)
+        return body
+
+    def _emit(self, data):
+        self._output.write(data)
+        self._callback(len(data))
+
+    def run(self):
+        """Write the whole object to the output
+
+        Returns:
+            int - bytes written
+        """
+        started = time.monotonic()
+        response, size = get_first_range(
+            self._client, self._bucket, self._key, self._direct_size, self._extra_args
+        )
+        if self._progress is not None:
+            self._callback = self._progress(size)
+        first = response["ContentLength"]
+        window = max(1, self._buffer_size(self._part_size(size)) // self._part_size(size))
+        ranges = self._ranges(first, size)
+        pending = collections.deque()
+        try:
+            # the ranges after the first GET are fetched while its body is written
+            for offset, length in itertools.islice(ranges, window):
+                pending.append(self._executor.submit(self._fetch, response["ETag"], offset, length))
+            offset = 0
+            for chunk in self._read(response["Body"]):
+                if self._digest is not None:
+                    self._digest.update(offset, chunk)
+                self._emit(chunk)
+                offset += len(chunk)
+            if offset != first:
+                raise IOError("{}: got {} of {} bytes".format(self._key, offset, first))
+            if self._metrics is not None:
+                self._metrics.observe("get_object", time.monotonic() - started)
+            while pending:
+                body = pending.popleft().result()
+                self._emit(body)
+                offset += len(body)
+                for next_offset, length in itertools.islice(ranges, 1):
+                    pending.append(self._executor.submit(self._fetch, response["ETag"], next_offset, length))
+        except BaseException as error:
+            self._cancel.set()
+            for future in pending:
+                future.cancel()
+            if isinstance(error, ClientError) and error.response["Error"]["Code"] in ("PreconditionFailed", "412"):
+                LOG.warning("%s changed during the download", self._key)
+            raise
+        finally:
+            response["Body"].close()
+        self._output.flush()
+        if self._digest is not None:
+            digest = self._digest.checksum()
+            if digest != self._checksum:
+                raise IntegrityError(
+                    "Stream corrupted!\n{}: expected {}, got {}".format(self._key, self._checksum, digest)
+                )
+            LOG.info("Integrity check: OK")
+        return offset